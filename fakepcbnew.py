@@ -0,0 +1,555 @@
+# fakepcbnew.py
+#
+# Stand-in for the pcbnew module, so KiPadCheck and its checks can run
+# (and be tested) on a machine without KiCad. It implements the subset of
+# the pcbnew API that kipadcheck.py uses, backed by plain Python objects:
+# BOARD, MODULE, D_PAD, TRACK, VIA, TEXTE_PCB, TEXTE_MODULE, DRAWSEGMENT,
+# wxPoint arithmetic, layer tests (IsOnLayer, LSET), GetDrillSize,
+# TransformTextShapeToSegmentList (with the simple stroke font of
+# kicad_pcb.py), SetSelected and the IU_PER_MM/IU_PER_MILS constants.
+#
+# Boards are built from a .kicad_pcb file with LoadBoard(), which also
+# makes it the board returned by GetBoard(), or item by item with Add().
+# install() registers this module as "pcbnew", so it must be called before
+# kipadcheck is imported:
+#    import fakepcbnew
+#    fakepcbnew.install()
+#    fakepcbnew.LoadBoard('board.kicad_pcb')
+#    import kipadcheck
+#    kpc = kipadcheck.KiPadCheck()
+#    kpc.RunHeadless(kipadcheck.PcbnewBackend(kpc))
+#
+# Values follow pcbnew: nanometers, orientations in tenths of a degree.
+# As in pcbnew, TEXTE_MODULE.GetOrientation() is relative to the module
+# and TransformTextShapeToSegmentList() leaves out the module rotation
+# (kipadcheck.get_text_strokes() adds it back).
+#
+# Naming conventions follow pcbnew for the stand-in API and kipadcheck.py
+# (PEP8) otherwise.
+
+import sys
+
+import kicad_pcb
+from kicad_pcb import (IU_PER_MM, IU_PER_MILS,
+    F_Cu, B_Cu, B_Adhes, F_Adhes, B_Paste, F_Paste, B_SilkS, F_SilkS,
+    B_Mask, F_Mask, Dwgs_User, Cmts_User, Eco1_User, Eco2_User, Edge_Cuts,
+    Margin, B_CrtYd, F_CrtYd, B_Fab, F_Fab, PCB_LAYER_ID_COUNT,
+    PAD_SHAPE_CIRCLE, PAD_SHAPE_RECT, PAD_SHAPE_OVAL, PAD_SHAPE_TRAPEZOID,
+    PAD_SHAPE_ROUNDRECT, PAD_ATTRIB_STANDARD, PAD_ATTRIB_SMD,
+    PAD_ATTRIB_CONN, PAD_ATTRIB_HOLE_NOT_PLATED, S_SEGMENT, S_RECT, S_ARC,
+    S_CIRCLE, S_POLYGON, S_CURVE, S_LAST, VIA_THROUGH, VIA_BLIND_BURIED,
+    VIA_MICROVIA,
+    IsCopperLayer, IsNonCopperLayer, IsUserLayer, IsValidLayer, IsPcbLayer,
+    ActionPlugin, wxPoint)
+
+STAND_IN = True
+"""Lets kipadcheck tell this module from the real pcbnew."""
+
+GR_TEXT_HJUSTIFY_LEFT = -1
+GR_TEXT_HJUSTIFY_CENTER = 0
+GR_TEXT_HJUSTIFY_RIGHT = 1
+GR_TEXT_VJUSTIFY_CENTER = 0
+
+UNDEFINED_DRILL_DIAMETER = -1
+
+_shape_names = dict((shape,name) for shape,name in
+                    kicad_pcb._drawing_shapes.values())
+
+wxSize = wxPoint
+
+
+def Iu2Mils(iu):
+    return int(round(iu/IU_PER_MILS))
+
+def Iu2DMils(iu):
+    return int(round(iu/IU_PER_MILS*10))
+
+
+class wxPoint_Vector(list):
+    """Stands in for the std::vector<wxPoint> wrapper."""
+    def __init__(self,size=0):
+        list.__init__(self,[wxPoint() for n in range(size)])
+    def clear(self):
+        del self[:]
+
+
+class EDA_RECT(object):
+    """Stands in for EDA_RECT: origin x,y (top left) and size w,h."""
+    def __init__(self,x=0,y=0,w=0,h=0):
+        self.x = int(x)
+        self.y = int(y)
+        self.w = int(w)
+        self.h = int(h)
+    def GetX(self):
+        return self.x
+    def GetY(self):
+        return self.y
+    def GetWidth(self):
+        return self.w
+    def GetHeight(self):
+        return self.h
+    def GetOrigin(self):
+        return wxPoint(self.x,self.y)
+    def GetCenter(self):
+        return wxPoint(self.x + self.w//2,self.y + self.h//2)
+    def Contains(self,point):
+        return self.x <= point[0] <= self.x + self.w \
+            and self.y <= point[1] <= self.y + self.h
+    def getWxRect(self):
+        return (self.x,self.y,self.w,self.h)
+    GetWxRect = getWxRect
+
+
+class LSET(object):
+    """Stands in for LSET, the set of layers of an item."""
+    def __init__(self,layers=()):
+        self._layers = frozenset(layers)
+    def Contains(self,layer):
+        return layer in self._layers
+    def Seq(self):
+        return sorted(self._layers)
+    def FmtHex(self):
+        """The bits as hex digits, highest first, with a '_' between
+           groups of 8 digits (as pcbnew)."""
+        mask = 0
+        for layer in self._layers:
+            mask |= 1 << layer
+        digits = "%0*x"%((PCB_LAYER_ID_COUNT+3)//4,mask)
+        groups = []
+        while digits:
+            groups.insert(0,digits[-8:])
+            digits = digits[:-8]
+        return "_".join(groups)
+
+
+class BOARD_ITEM(object):
+    """Base of the board items: parent, layers and selection state."""
+
+    def __init__(self,parent=None,layers=()):
+        self._parent = parent
+        self._layers = set(layers)
+        self._layer = min(self._layers) if self._layers else F_Cu
+        self._selected = False
+        self._highlighted = False
+        self._brightened = False
+
+    def GetParent(self):
+        return self._parent
+    def SetParent(self,parent):
+        self._parent = parent
+    def GetBoard(self):
+        parent = self._parent
+        while parent is not None and not isinstance(parent,BOARD):
+            parent = parent.GetParent()
+        return parent
+
+    def GetLayer(self):
+        return self._layer
+    def SetLayer(self,layer):
+        self._layer = layer
+        self._layers = set([layer])
+    def IsOnLayer(self,layer):
+        return layer in self._layers
+    def GetLayerSet(self):
+        return LSET(self._layers)
+
+    def SetSelected(self):
+        self._selected = True
+    def ClearSelected(self):
+        self._selected = False
+    def IsSelected(self):
+        return self._selected
+    def SetHighlighted(self):
+        self._highlighted = True
+    def ClearHighlighted(self):
+        self._highlighted = False
+    def IsHighlighted(self):
+        return self._highlighted
+    def SetBrightened(self):
+        self._brightened = True
+    def ClearBrightened(self):
+        self._brightened = False
+    def IsBrightened(self):
+        return self._brightened
+
+    def _cast(self,cls):
+        if isinstance(self,cls):
+            return self
+        return None
+    def Cast_to_MODULE(self):
+        return self._cast(MODULE)
+    def Cast_to_D_PAD(self):
+        return self._cast(D_PAD)
+    def Cast_to_TRACK(self):
+        return self._cast(TRACK)
+    def Cast_to_VIA(self):
+        return self._cast(VIA)
+    def Cast_to_TEXTE_PCB(self):
+        return self._cast(TEXTE_PCB)
+    def Cast_to_TEXTE_MODULE(self):
+        return self._cast(TEXTE_MODULE)
+    def Cast_to_DRAWSEGMENT(self):
+        return self._cast(DRAWSEGMENT)
+
+
+class D_PAD(BOARD_ITEM):
+    """Pad, from a kicad_pcb 'pads' record."""
+
+    def __init__(self,parent,record):
+        BOARD_ITEM.__init__(self,parent,record['layers'])
+        self._record = record
+
+    def GetCenter(self):
+        return wxPoint(self._record['x'],self._record['y'])
+    GetPosition = GetCenter
+    def GetSize(self):
+        return wxSize(self._record['w'],self._record['h'])
+    def GetDrillSize(self):
+        return wxSize(self._record['drill_x'],self._record['drill_y'])
+    def GetOffset(self):
+        return wxPoint(self._record['offset_x'],self._record['offset_y'])
+    def GetShape(self):
+        return self._record['shape']
+    def GetDrillShape(self):
+        return self._record['drill_shape']
+    def GetAttribute(self):
+        return self._record['attribute']
+    def GetOrientation(self):
+        return self._record['orientation']
+    def GetNetname(self):
+        return self._record['net']
+    def GetPadName(self):
+        return self._record['name']
+    GetName = GetPadName
+    def GetLocalClearance(self):
+        return self._record['local_clearance']
+    def GetClearance(self,item=None):
+        return self._record['clearance']
+    def GetSolderPasteMargin(self):
+        return wxSize(self._record['paste_margin_x'],
+                      self._record['paste_margin_y'])
+    def GetLocalSolderPasteMargin(self):
+        return self._record['local_paste_margin']
+    def GetLocalSolderPasteMarginRatio(self):
+        return 0.0
+    def GetSolderMaskMargin(self):
+        return self._record['mask_margin']
+    def GetLocalSolderMaskMargin(self):
+        return self._record['local_mask_margin']
+    def GetBoundingBox(self):
+        return EDA_RECT(self._record['bbox_x'],self._record['bbox_y'],
+                        self._record['bbox_w'],self._record['bbox_h'])
+
+
+class TRACK(BOARD_ITEM):
+    """Track segment, from a kicad_pcb 'tracks' record."""
+
+    def __init__(self,parent,record):
+        BOARD_ITEM.__init__(self,parent,record['layers'])
+        self._record = record
+
+    def GetStart(self):
+        return wxPoint(self._record['x1'],self._record['y1'])
+    def GetEnd(self):
+        return wxPoint(self._record['x2'],self._record['y2'])
+    GetPosition = GetStart
+    def GetWidth(self):
+        return self._record['width']
+    def GetNetname(self):
+        return self._record['net']
+
+
+class VIA(TRACK):
+    """Via, from a kicad_pcb 'vias' record. Its layers are all the copper
+       layers it spans."""
+
+    def GetPosition(self):
+        return wxPoint(self._record['x'],self._record['y'])
+    GetStart = GetPosition
+    GetEnd = GetPosition
+    def GetDrill(self):
+        return self._record['drill']
+    def GetDrillValue(self):
+        return self._record['drill_value']
+    def GetViaType(self):
+        return self._record['via_type']
+    def LayerPair(self):
+        layers = sorted(self._layers)
+        return (layers[0],layers[-1]) if layers else (F_Cu,B_Cu)
+
+
+class TEXTE_PCB(BOARD_ITEM):
+    """Single line text, from a kicad_pcb 'texts' record."""
+
+    def __init__(self,parent,record):
+        BOARD_ITEM.__init__(self,parent,record['layers'])
+        self._record = record
+
+    def GetText(self):
+        return self._record['text']
+    def GetCenter(self):
+        return wxPoint(self._record['x'],self._record['y'])
+    # the record keeps the text box center, not the anchor
+    GetPosition = GetCenter
+    GetTextPos = GetCenter
+    def GetTextSize(self):
+        return wxSize(self._record['size_x'],self._record['size_y'])
+    def GetThickness(self):
+        return self._record['thickness']
+    def GetOrientation(self):
+        return self._record['orientation']
+    def GetDrawRotation(self):
+        return self._record['orientation']
+    def GetHorizJustify(self):
+        return self._record['justify']
+    def GetVertJustify(self):
+        return GR_TEXT_VJUSTIFY_CENTER
+    def IsMirrored(self):
+        return self._record['mirror']
+    def IsItalic(self):
+        return False
+    def GetTextBox(self,line=-1):
+        return EDA_RECT(self._record['box_x'],self._record['box_y'],
+                        self._record['box_w'],self._record['box_h'])
+    GetBoundingBox = GetTextBox
+
+    def get_strokes(self):
+        """Return the flat x0,y0,x1,y1,... stroke list to transform."""
+        return self._record['strokes']
+
+    def TransformTextShapeToSegmentList(self,vector):
+        """Append the end points of the text strokes to vector, two
+           points per stroke segment."""
+        strokes = self.get_strokes()
+        for index in range(0,len(strokes),2):
+            vector.append(wxPoint(strokes[index],strokes[index+1]))
+
+
+class TEXTE_MODULE(TEXTE_PCB):
+    """Reference, value or other text of a module."""
+
+    def GetOrientation(self):
+        return self._record['orientation'] - self._parent.GetOrientation()
+
+    def get_strokes(self):
+        # pcbnew leaves the module rotation out of the strokes
+        cx,cy = self._record['x'],self._record['y']
+        angle = -self._parent.GetOrientation()/10.0
+        strokes = self._record['strokes']
+        points = []
+        for index in range(0,len(strokes),2):
+            x,y = kicad_pcb.rotate(strokes[index] - cx,strokes[index+1] - cy,
+                                   angle)
+            points.append(int(round(cx + x)))
+            points.append(int(round(cy + y)))
+        return points
+
+
+class DRAWSEGMENT(BOARD_ITEM):
+    """Graphic shape (line, arc, circle...), from a kicad_pcb 'drawings'
+       record, or empty as created by pcbnew.DRAWSEGMENT(board)."""
+
+    def __init__(self,parent=None,record=None):
+        if record is None:
+            record = {
+                'x1':0,'y1':0,'x2':0,'y2':0,'width':0,'shape':S_SEGMENT,
+                'cx':None,'cy':None,'layers':[Dwgs_User]}
+        BOARD_ITEM.__init__(self,parent,record['layers'])
+        self._record = record
+
+    def GetStart(self):
+        return wxPoint(self._record['x1'],self._record['y1'])
+    def SetStart(self,point):
+        self._record['x1'],self._record['y1'] = point[0],point[1]
+    def GetEnd(self):
+        return wxPoint(self._record['x2'],self._record['y2'])
+    def SetEnd(self,point):
+        self._record['x2'],self._record['y2'] = point[0],point[1]
+    def GetCenter(self):
+        if self._record['cx'] is not None:
+            return wxPoint(self._record['cx'],self._record['cy'])
+        if self._record['shape'] in (S_ARC,S_CIRCLE):
+            return self.GetStart()
+        return wxPoint((self._record['x1'] + self._record['x2'])//2,
+                       (self._record['y1'] + self._record['y2'])//2)
+    def GetWidth(self):
+        return self._record['width']
+    def SetWidth(self,width):
+        self._record['width'] = width
+    def GetShape(self):
+        return self._record['shape']
+    def SetShape(self,shape):
+        self._record['shape'] = shape
+    def GetShapeStr(self):
+        return _shape_names.get(self._record['shape'],"Unrecognized")
+    def SetLayer(self,layer):
+        BOARD_ITEM.SetLayer(self,layer)
+        self._record['layers'] = [layer]
+
+
+class EDGE_MODULE(DRAWSEGMENT):
+    """Graphic shape of a module."""
+
+
+class MODULE(BOARD_ITEM):
+    """Footprint, from the 'module' dict of kicad_pcb records. Holds its
+       pads, graphic shapes and texts."""
+
+    def __init__(self,parent,module):
+        BOARD_ITEM.__init__(self,parent,[module['layer']])
+        self._module = module
+        self._pads = []
+        self._graphical_items = []
+        self._reference = None
+        self._value = None
+
+    def Add(self,item):
+        item.SetParent(self)
+        if isinstance(item,D_PAD):
+            self._pads.append(item)
+        elif isinstance(item,TEXTE_MODULE) and item._record.get('kind') \
+                in ('reference','value'):
+            setattr(self,'_'+item._record['kind'],item)
+        else:
+            self._graphical_items.append(item)
+
+    def GetReference(self):
+        return self._module['reference']
+    def GetValue(self):
+        return self._module['value']
+    def GetPosition(self):
+        return wxPoint(self._module['x'],self._module['y'])
+    def GetOrientation(self):
+        return self._module['orientation']
+    def Pads(self):
+        return list(self._pads)
+    def GraphicalItems(self):
+        return list(self._graphical_items)
+    def Reference(self):
+        # pcbnew always has a reference and a value text
+        return self._reference or BOARD_ITEM(self)
+    def Value(self):
+        return self._value or BOARD_ITEM(self)
+
+
+class BOARD(BOARD_ITEM):
+    """Board: modules, tracks and vias, drawings, and the layer setup."""
+
+    def __init__(self):
+        BOARD_ITEM.__init__(self)
+        self._file_name = ''
+        self._layer_names = dict(enumerate(kicad_pcb.LAYER_NAMES))
+        self._copper_layer_count = 2
+        self._modules = []
+        self._pads = []
+        self._tracks = []
+        self._drawings = []
+
+    def Add(self,item):
+        """Add a MODULE (with its pads), TRACK, VIA or drawing item."""
+        item.SetParent(self)
+        if isinstance(item,MODULE):
+            self._modules.append(item)
+            self._pads.extend(item.Pads())
+        elif isinstance(item,TRACK):
+            self._tracks.append(item)
+        else:
+            self._drawings.append(item)
+
+    def Remove(self,item):
+        for items in (self._modules,self._tracks,self._drawings):
+            if item in items:
+                items.remove(item)
+        if isinstance(item,MODULE):
+            self._pads = [p for p in self._pads if p.GetParent() is not item]
+
+    def GetFileName(self):
+        return self._file_name
+    def SetFileName(self,name):
+        self._file_name = name
+    def GetLayerName(self,layer):
+        return self._layer_names.get(layer,str(layer))
+    def GetLayerID(self,name):
+        for layer,layer_name in self._layer_names.items():
+            if layer_name == name:
+                return layer
+        return -1
+    def GetCopperLayerCount(self):
+        return self._copper_layer_count
+    def SetCopperLayerCount(self,count):
+        self._copper_layer_count = count
+    def GetModules(self):
+        return list(self._modules)
+    def GetPadCount(self):
+        return len(self._pads)
+    def GetPad(self,index):
+        return self._pads[index]
+    def GetPads(self):
+        return list(self._pads)
+    def GetTracks(self):
+        return list(self._tracks)
+    def GetDrawings(self):
+        return list(self._drawings)
+
+
+_board = None
+
+def GetBoard():
+    """Return the current board (see LoadBoard and SetBoard)."""
+    global _board
+    if _board is None:
+        _board = BOARD()
+    return _board
+
+def SetBoard(board):
+    """Make board the one returned by GetBoard()."""
+    global _board
+    _board = board
+
+def LoadBoard(path,chunksize=65536):
+    """Return the BOARD read from the .kicad_pcb file at path, and make
+       it the current board."""
+    board = BOARD()
+    board.SetFileName(path)
+    modules = {}
+    pending = []
+    for kind,record in kicad_pcb.read_board_file(path,chunksize):
+        if kind == 'board':
+            board._layer_names.update(record['layer_names'])
+            board.SetCopperLayerCount(record['copper_layers'])
+            continue
+        module = record.get('module')
+        if module is not None:
+            # the records of one module share its dict
+            parent = modules.get(id(module))
+            if parent is None:
+                parent = MODULE(board,module)
+                modules[id(module)] = parent
+                pending.append(parent)
+            if kind == 'pads':
+                parent.Add(D_PAD(parent,record))
+            elif kind == 'texts':
+                parent.Add(TEXTE_MODULE(parent,record))
+            else:
+                parent.Add(EDGE_MODULE(parent,record))
+            continue
+        while pending:
+            board.Add(pending.pop(0))
+        if kind == 'vias':
+            board.Add(VIA(board,record))
+        elif kind == 'tracks':
+            board.Add(TRACK(board,record))
+        elif kind == 'texts':
+            board.Add(TEXTE_PCB(board,record))
+        else:
+            board.Add(DRAWSEGMENT(board,record))
+    while pending:
+        board.Add(pending.pop(0))
+    SetBoard(board)
+    return board
+
+
+def install():
+    """Register this module as pcbnew (unless pcbnew is already loaded)
+       and return the module that is now pcbnew."""
+    return sys.modules.setdefault('pcbnew',sys.modules[__name__])
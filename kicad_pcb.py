@@ -0,0 +1,742 @@
+# kicad_pcb.py
+#
+# Streaming reader for KiCad .kicad_pcb board files, so the KiPadCheck
+# checks can run without pcbnew (for example on a build server).
+#
+# The file is tokenized in fixed size chunks and only one top level element
+# of (kicad_pcb ...) is held as a tree at a time (one module, one segment,
+# one via...). Each element is turned into a plain record and dropped, so
+# memory use is bounded by the largest single element, not the file size.
+#
+# read_board() yields (kind, record) tuples:
+#   ('board', {'layernums','layer_names','copper_layers'}) first, then
+#   ('pads'|'vias'|'tracks'|'texts'|'drawings', record) for each item.
+# Record keys are the BoardSnapshot column names of that table (kipadcheck.py),
+# plus 'layers' (list of layer numbers) and 'net' (net name).
+# Texts also have the font 'size_x', 'size_y', 'justify' and 'mirror'.
+# Items of a footprint have 'module': a dict (the same one for all its
+# items) with 'reference', 'value', 'x', 'y', 'orientation' (tenths of
+# a degree) and 'layer'; its reference and value texts have 'kind'.
+#
+# This module also provides the pcbnew constants and the small subset of
+# pcbnew names used by kipadcheck.py, so "import kipadcheck" works when
+# pcbnew is not available.
+#
+# Supports the KiCad 4 and 5 file format, and reads the common items of
+# later versions (footprint, property "Reference"/"Value", stroke width).
+#
+# Naming conventions follow kipadcheck.py (PEP8).
+
+import io
+import math
+import re
+
+# Internal units are nanometers, as in pcbnew.
+IU_PER_MM = 1000000.0
+IU_PER_MILS = 25400.0
+
+# PCB_LAYER_ID of KiCad 4/5.
+F_Cu = 0
+B_Cu = 31
+B_Adhes = 32
+F_Adhes = 33
+B_Paste = 34
+F_Paste = 35
+B_SilkS = 36
+F_SilkS = 37
+B_Mask = 38
+F_Mask = 39
+Dwgs_User = 40
+Cmts_User = 41
+Eco1_User = 42
+Eco2_User = 43
+Edge_Cuts = 44
+Margin = 45
+B_CrtYd = 46
+F_CrtYd = 47
+B_Fab = 48
+F_Fab = 49
+PCB_LAYER_ID_COUNT = 50
+
+LAYER_NAMES = ["F.Cu"] + ["In%d.Cu"%n for n in range(1,31)] + [
+    "B.Cu", "B.Adhes", "F.Adhes", "B.Paste", "F.Paste", "B.SilkS",
+    "F.SilkS", "B.Mask", "F.Mask", "Dwgs.User", "Cmts.User", "Eco1.User",
+    "Eco2.User", "Edge.Cuts", "Margin", "B.CrtYd", "F.CrtYd", "B.Fab",
+    "F.Fab"]
+"""Standard layer names indexed by layer number."""
+_layer_ids = dict((name,num) for num,name in enumerate(LAYER_NAMES))
+# names used by newer file versions
+_layer_ids.update({"F.Silkscreen":F_SilkS, "B.Silkscreen":B_SilkS,
+    "F.Courtyard":F_CrtYd, "B.Courtyard":B_CrtYd, "F.Adhesive":F_Adhes,
+    "B.Adhesive":B_Adhes, "User.Drawings":Dwgs_User,
+    "User.Comments":Cmts_User, "User.Eco1":Eco1_User, "User.Eco2":Eco2_User})
+
+PAD_SHAPE_CIRCLE = 0
+PAD_SHAPE_RECT = 1
+PAD_SHAPE_OVAL = 2
+PAD_SHAPE_TRAPEZOID = 3
+PAD_SHAPE_ROUNDRECT = 4
+_pad_shapes = {"circle":PAD_SHAPE_CIRCLE, "rect":PAD_SHAPE_RECT,
+    "oval":PAD_SHAPE_OVAL, "trapezoid":PAD_SHAPE_TRAPEZOID,
+    "roundrect":PAD_SHAPE_ROUNDRECT, "custom":PAD_SHAPE_RECT}
+
+PAD_ATTRIB_STANDARD = 0
+PAD_ATTRIB_SMD = 1
+PAD_ATTRIB_CONN = 2
+PAD_ATTRIB_HOLE_NOT_PLATED = 3
+_pad_attributes = {"thru_hole":PAD_ATTRIB_STANDARD, "smd":PAD_ATTRIB_SMD,
+    "connect":PAD_ATTRIB_CONN, "np_thru_hole":PAD_ATTRIB_HOLE_NOT_PLATED}
+
+S_SEGMENT = 0
+S_RECT = 1
+S_ARC = 2
+S_CIRCLE = 3
+S_POLYGON = 4
+S_CURVE = 5
+S_LAST = 6
+_drawing_shapes = {"line":(S_SEGMENT,"Line"), "rect":(S_RECT,"Rect"),
+    "arc":(S_ARC,"Arc"), "circle":(S_CIRCLE,"Circle"),
+    "poly":(S_POLYGON,"Polygon"), "curve":(S_CURVE,"Bezier Curve")}
+
+VIA_THROUGH = 3
+VIA_BLIND_BURIED = 2
+VIA_MICROVIA = 1
+
+
+def IsCopperLayer(layer):
+    return F_Cu <= layer <= B_Cu
+
+def IsNonCopperLayer(layer):
+    return B_Cu < layer < PCB_LAYER_ID_COUNT
+
+def IsUserLayer(layer):
+    return Dwgs_User <= layer <= Eco2_User
+
+def IsValidLayer(layer):
+    return 0 <= layer < PCB_LAYER_ID_COUNT
+
+def IsPcbLayer(layer):
+    return IsValidLayer(layer)
+
+
+class ActionPlugin(object):
+    """Stands in for pcbnew.ActionPlugin when pcbnew is not available."""
+    def register(self):
+        pass
+
+
+class wxPoint(object):
+    """Stands in for pcbnew.wxPoint: integer x,y with the arithmetic
+       used by kipadcheck.wxPointUtil."""
+    __slots__ = ('x','y')
+
+    def __init__(self,x=0,y=0):
+        self.x = int(x)
+        self.y = int(y)
+    def __getitem__(self,index):
+        return (self.x,self.y)[index]
+    def __len__(self):
+        return 2
+    def __add__(self,other):
+        return wxPoint(self.x+other.x,self.y+other.y)
+    def __sub__(self,other):
+        return wxPoint(self.x-other.x,self.y-other.y)
+    def __eq__(self,other):
+        return self.x == other[0] and self.y == other[1]
+    def __ne__(self,other):
+        return not self == other
+    def __repr__(self):
+        return "(%d, %d)"%(self.x,self.y)
+
+
+# Tokenizer
+
+_token = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+_escape = re.compile(r'\\(.)')
+_escapes = {'n':'\n'}
+"""Escapes of quoted strings that are not the escaped character itself:
+   KiCad writes the line breaks of multi-line texts as \\n."""
+
+def _unescape(match):
+    """Return the character of an escape matched by _escape."""
+    char = match.group(1)
+    return _escapes.get(char,char)
+
+def tokenize(stream,chunksize=65536):
+    """Yield the tokens of an S-expression text stream: '(' , ')' and
+       atoms (quoted strings are returned unquoted and unescaped).
+       The stream is read chunksize characters at a time. Each chunk is
+       cut after its last newline, since KiCad never breaks a token
+       across lines, or, in a chunk without newlines (a file written on
+       one line), between its last two tokens (see _token_boundary)."""
+    leftover = ''
+    while True:
+        chunk = stream.read(chunksize)
+        if chunk:
+            text = leftover + chunk
+            cut = text.rfind('\n') + 1
+            if cut == 0:
+                cut = _token_boundary(text)
+            if cut == 0:
+                leftover = text
+                continue
+            leftover = text[cut:]
+            text = text[:cut]
+        else:
+            text = leftover
+        for match in _token.finditer(text):
+            token = match.group()
+            if token[0] == '"':
+                token = token[1:-1]
+                if '\\' in token:
+                    token = _escape.sub(_unescape,token)
+                yield _quoted(token)
+            else:
+                yield token
+        if not chunk:
+            return
+
+def _token_boundary(text):
+    """Return the length of the longest start of text that ends between
+       two tokens: before its last token, which may go on in the next
+       chunk, or before a quoted string that is not closed in text.
+       0 if text is a single token."""
+    end = 0
+    for match in _token.finditer(text):
+        # only whitespace, or the quote of an unclosed string, is skipped
+        if '"' in text[end:match.start()]:
+            break
+        if match.end() == len(text):
+            return match.start()
+        end = match.end()
+    quote = text.find('"',end)
+    return len(text) if quote < 0 else quote
+
+
+class _quoted(type(u'')):
+    """A quoted atom. Kept apart from bare atoms so "(" in a name is
+       never read as a parenthesis."""
+    __slots__ = ()
+
+
+def iter_elements(stream,chunksize=65536):
+    """Yield each top level element of the root list, e.g. each child of
+       (kicad_pcb ...), as a nested list of atoms. Only the element being
+       read is held in memory."""
+    depth = 0
+    stack = []
+    for token in tokenize(stream,chunksize):
+        if token == '(' and type(token) is not _quoted:
+            depth += 1
+            if depth >= 2:
+                stack.append([])
+        elif token == ')' and type(token) is not _quoted:
+            depth -= 1
+            if depth >= 1:
+                element = stack.pop()
+                if stack:
+                    stack[-1].append(element)
+                else:
+                    yield element
+        elif stack:
+            stack[-1].append(token)
+
+
+# Element helpers
+
+def _find(element,name):
+    """Return the first child list of element named name, or None."""
+    for child in element:
+        if isinstance(child,list) and child and child[0] == name:
+            return child
+    return None
+
+def _find_all(element,name):
+    return [child for child in element
+            if isinstance(child,list) and child and child[0] == name]
+
+def _iu(value):
+    """Convert a millimeter atom to integer internal units."""
+    return int(round(float(value)*IU_PER_MM))
+
+def _xy(element,name,default=(0,0)):
+    child = _find(element,name)
+    if child is None:
+        return default
+    return (_iu(child[1]),_iu(child[2]))
+
+def _number(element,name,default=0.0):
+    child = _find(element,name)
+    if child is None or len(child) < 2:
+        return default
+    return float(child[1])
+
+def _width(element):
+    """Line width: (width w) or, in newer files, (stroke (width w))."""
+    child = _find(element,'width')
+    if child is None:
+        stroke = _find(element,'stroke')
+        if stroke is not None:
+            child = _find(stroke,'width')
+    return _iu(child[1]) if child is not None else 0
+
+def _at(element):
+    """Return (x, y, angle in degrees) of the (at x y [angle]) child."""
+    child = _find(element,'at')
+    if child is None:
+        return (0,0,0.0)
+    angle = 0.0
+    if len(child) > 3:
+        try:
+            angle = float(child[3])
+        except ValueError:
+            pass
+    return (_iu(child[1]),_iu(child[2]),angle)
+
+def rotate(x,y,angle):
+    """Rotate x,y around the origin by angle degrees, in the direction
+       pcbnew uses for positive orientations (y axis down)."""
+    if angle == 0.0:
+        return (x,y)
+    radians = math.radians(angle)
+    cos = math.cos(radians)
+    sin = math.sin(radians)
+    return (x*cos + y*sin, -x*sin + y*cos)
+
+
+# Text strokes
+
+# A simple 16 segment stroke font. Segment end points are in a unit cell
+# with y down: (0,0) top left, (1,1) bottom right.
+_segments = {
+    'A':((0,0),(.5,0)), 'a':((.5,0),(1,0)),
+    'B':((1,0),(1,.5)), 'C':((1,.5),(1,1)),
+    'D':((0,1),(.5,1)), 'd':((.5,1),(1,1)),
+    'E':((0,.5),(0,1)), 'F':((0,0),(0,.5)),
+    'G':((0,.5),(.5,.5)), 'g':((.5,.5),(1,.5)),
+    'H':((0,0),(.5,.5)), 'I':((.5,0),(.5,.5)),
+    'J':((1,0),(.5,.5)), 'K':((.5,.5),(0,1)),
+    'L':((.5,.5),(.5,1)), 'M':((.5,.5),(1,1))}
+_glyphs = {
+    '0':"AaBCDdEFJK", '1':"BC", '2':"AaBgGEDd", '3':"AaBgCDd",
+    '4':"FGgBC", '5':"AaFGgCDd", '6':"AaFEDdCgG", '7':"AaBC",
+    '8':"AaBCDdEFGg", '9':"AaBCDdFGg",
+    'A':"AaBCEFGg", 'B':"AaBCDdILg", 'C':"AaFEDd", 'D':"AaBCDdIL",
+    'E':"AaFEDdG", 'F':"AaFEG", 'G':"AaFEDdCg", 'H':"FEBCGg",
+    'I':"AaILDd", 'J':"BCDdE", 'K':"FEGJM", 'L':"FEDd", 'M':"FEBCHJ",
+    'N':"FEBCHM", 'O':"AaBCDdEF", 'P':"AaBFEGg", 'Q':"AaBCDdEFM",
+    'R':"AaBFEGgM", 'S':"AaFGgCDd", 'T':"AaIL", 'U':"FEDdBC",
+    'V':"FEKJ", 'W':"FEBCKM", 'X':"HJKM", 'Y':"HJL", 'Z':"AaJKDd",
+    '-':"Gg", '+':"GgIL", '_':"Dd", '.':"D", ',':"K", '/':"JK",
+    '\\':"HM", '*':"HJKMIL", '=':"GgDd", ':':"IL", '(':"JM", ')':"HK",
+    '#':"BCILGgDd", ' ':""}
+_unknown_glyph = "AaBCDdEF"
+GLYPH_WIDTH = 0.7
+"""Width of a glyph as a fraction of the font width (the advance)."""
+
+LINE_SPACING = 1.61
+"""Pitch of the lines of a multi-line text, as a fraction of the font
+   height (KiCad's interline pitch ratio)."""
+
+def text_layout(text,x,y,size_x,size_y,thickness,angle,
+                justify=0,mirror=False):
+    """Return (strokes, box, center) for a text anchored at x,y and
+       rotated by angle degrees. The lines of a multi-line text are
+       LINE_SPACING font heights apart and centered on the anchor, as in
+       KiCad, each justified on its own.
+       strokes is a flat list x0,y0,x1,y1,... of stroke segment end points
+       on the board. box is the unrotated (x, y, w, h) text box around
+       center, the rotation center of the box.
+       justify is -1 (left), 0 (center) or 1 (right)."""
+    lines = text.split('\n')
+    interline = int(round(size_y*LINE_SPACING))
+    strokes = []
+    for number,line in enumerate(lines):
+        width = len(line)*size_x
+        left = -width/2.0*(justify+1)
+        top = (number - (len(lines)-1)/2.0)*interline
+        for index,char in enumerate(line):
+            segments = _glyphs.get(char.upper(),_unknown_glyph)
+            x0 = left + index*size_x + (1-GLYPH_WIDTH)/2.0*size_x
+            for name in segments:
+                for px,py in _segments[name]:
+                    lx = x0 + px*GLYPH_WIDTH*size_x
+                    ly = top + (py - 0.5)*size_y
+                    if mirror:
+                        lx = -lx
+                    rx,ry = rotate(lx,ly,angle)
+                    strokes.append(int(round(x + rx)))
+                    strokes.append(int(round(y + ry)))
+    width = max([len(line) for line in lines])*size_x
+    left = -width/2.0*(justify+1)
+    cx,cy = rotate(-(left + width/2.0) if mirror else left + width/2.0,
+                   0.0,angle)
+    center = (int(round(x + cx)),int(round(y + cy)))
+    w = int(round(width + thickness))
+    h = int(round(size_y + (len(lines)-1)*interline + thickness))
+    box = (center[0] - w//2,center[1] - h//2,w,h)
+    return strokes,box,center
+
+
+# Board reader
+
+class _NetClass(object):
+    def __init__(self,clearance=200000,via_drill=400000):
+        self.clearance = clearance
+        self.via_drill = via_drill
+
+
+def read_board(stream,chunksize=65536):
+    """Yield (kind, record) tuples for the board in the .kicad_pcb text
+       stream. See the top of this file for the record layout."""
+    reader = _BoardReader()
+    for element in iter_elements(stream,chunksize):
+        for record in reader.element(element):
+            yield record
+
+
+def read_board_file(path,chunksize=65536):
+    """read_board() on the file at path."""
+    with io.open(path,'r',encoding='utf-8') as stream:
+        for record in read_board(stream,chunksize):
+            yield record
+
+
+class _BoardReader(object):
+    """Turns top level elements into records, remembering the board
+       settings (layers, nets, net classes, setup) the items depend on."""
+
+    def __init__(self):
+        self.layer_names = dict(enumerate(LAYER_NAMES))
+        self.copper = [F_Cu,B_Cu]
+        self.nets = {}
+        self.netclass_by_net = {}
+        self.default_netclass = _NetClass()
+        self.mask_margin = 0
+        self.paste_margin = 0
+        self.paste_ratio = 0.0
+        self.board_sent = False
+
+    def layer_id(self,name):
+        return _layer_ids.get(name)
+
+    def layers(self,names):
+        """Expand layer names (with *.Cu, F&B.Cu style wildcards) to
+           layer numbers."""
+        found = []
+        for name in names:
+            if isinstance(name,list):
+                continue
+            if name.startswith('*.') or name.startswith('F&B.'):
+                suffix = name.split('.',1)[1]
+                if suffix == 'Cu':
+                    found.extend(self.copper)
+                else:
+                    for side in ('F.','B.'):
+                        layer = self.layer_id(side+suffix)
+                        if layer is not None:
+                            found.append(layer)
+            else:
+                layer = self.layer_id(name)
+                if layer is not None:
+                    found.append(layer)
+        return found
+
+    def board_record(self):
+        # Same layer order as KiPadCheck.MenuItemPadInfo: F.Cu, B.Cu,
+        # inner copper, then all non copper layers.
+        inner = sorted(l for l in self.copper if l not in (F_Cu,B_Cu))
+        layernums = [F_Cu,B_Cu] + inner \
+            + list(range(B_Cu+1,PCB_LAYER_ID_COUNT))
+        self.board_sent = True
+        return ('board',{
+            'layernums':layernums,
+            'layer_names':dict((l,self.layer_names.get(l,str(l)))
+                               for l in layernums),
+            'copper_layers':len(self.copper)})
+
+    def netname(self,element):
+        net = _find(element,'net')
+        if net is None:
+            return ''
+        if len(net) > 2:
+            return net[2]
+        return self.nets.get(net[1],'')
+
+    def netclass(self,netname):
+        return self.netclass_by_net.get(netname,self.default_netclass)
+
+    def element(self,element):
+        """Return the list of records for one top level element."""
+        kind = element[0] if element else None
+        if kind == 'layers':
+            copper = []
+            for layer in element[1:]:
+                if not isinstance(layer,list) or len(layer) < 2:
+                    continue
+                num = self.layer_id(layer[1])
+                if num is None:
+                    continue
+                self.layer_names[num] = layer[1]
+                if IsCopperLayer(num):
+                    copper.append(num)
+            if copper:
+                self.copper = copper
+            return []
+        if kind == 'setup':
+            self.mask_margin = _iu(_number(element,'pad_to_mask_clearance'))
+            self.paste_margin = _iu(_number(element,'pad_to_paste_clearance'))
+            self.paste_ratio = _number(element,'pad_to_paste_clearance_ratio')
+            if _find(element,'via_drill') is not None:
+                self.default_netclass.via_drill = \
+                    _iu(_number(element,'via_drill'))
+            return []
+        if kind == 'net':
+            if len(element) > 2:
+                self.nets[element[1]] = element[2]
+            return []
+        if kind == 'net_class':
+            netclass = _NetClass(
+                _iu(_number(element,'clearance',0.2)),
+                _iu(_number(element,'via_drill',0.4)))
+            if element[1] == 'Default':
+                self.default_netclass = netclass
+            for net in _find_all(element,'add_net'):
+                self.netclass_by_net[net[1]] = netclass
+            return []
+
+        records = []
+        if not self.board_sent and kind in ('module','footprint','segment',
+            'arc','via','gr_text','gr_line','gr_arc','gr_circle','gr_poly',
+            'gr_rect','gr_curve'):
+            records.append(self.board_record())
+        if kind in ('module','footprint'):
+            records.extend(self.module(element))
+        elif kind in ('segment','arc'):
+            # arcs are checked as their chord
+            layer = _find(element,'layer')
+            start = _xy(element,'start')
+            end = _xy(element,'end')
+            records.append(('tracks',{
+                'x1':start[0],'y1':start[1],'x2':end[0],'y2':end[1],
+                'width':_width(element),
+                'net':self.netname(element),
+                'layers':self.layers(layer[1:] if layer else [])}))
+        elif kind == 'via':
+            records.append(('vias',self.via(element)))
+        elif kind == 'gr_text':
+            record = self.text(element,element[1],(0,0,0.0))
+            if record is not None:
+                records.append(('texts',record))
+        elif kind in ('gr_line','gr_arc','gr_circle','gr_poly','gr_rect',
+                      'gr_curve'):
+            records.append(('drawings',self.drawing(element,(0,0,0.0))))
+        return records
+
+    def via(self,element):
+        x,y,angle = _at(element)
+        netname = self.netname(element)
+        drill = _iu(_number(element,'drill',-1)) \
+            if _find(element,'drill') is not None else -1
+        if 'blind' in element:
+            via_type = VIA_BLIND_BURIED
+        elif 'micro' in element:
+            via_type = VIA_MICROVIA
+        else:
+            via_type = VIA_THROUGH
+        # a via is on every copper layer between its two end layers
+        ends = self.layers((_find(element,'layers') or ['layers'])[1:])
+        if ends:
+            top,bottom = min(ends),max(ends)
+            layers = [l for l in self.copper if top <= l <= bottom]
+        else:
+            layers = list(self.copper)
+        return {
+            'x':x,'y':y,'drill':drill,
+            'drill_value':drill if drill > 0
+                          else self.netclass(netname).via_drill,
+            'width':_iu(_number(element,'size')),
+            'via_type':via_type,
+            'net':netname,
+            'layers':layers}
+
+    def module(self,element):
+        origin = _at(element)
+        local_clearance = _iu(_number(element,'clearance'))
+        mask_margin = _iu(_number(element,'solder_mask_margin'))
+        paste_margin = _iu(_number(element,'solder_paste_margin'))
+        paste_ratio = _number(element,'solder_paste_ratio')
+        # Reference and value texts: (fp_text reference "R1" ...) or, in
+        # newer files, (property "Reference" "R1" ...)
+        names = {}
+        records = []
+        for child in element:
+            if not isinstance(child,list) or len(child) < 3:
+                continue
+            if child[0] == 'fp_text':
+                kind = child[1]
+            elif child[0] == 'property':
+                kind = child[1].lower()
+            else:
+                continue
+            if kind not in ('reference','value'):
+                continue
+            names[kind] = child[2]
+            record = self.text(child,child[2],origin)
+            if record is not None:
+                record['kind'] = kind
+                records.append(('texts',record))
+        reference = names.get('reference','')
+        value = names.get('value','')
+        layer = _find(element,'layer')
+        module = {
+            'reference':reference,'value':value,
+            'x':origin[0],'y':origin[1],'orientation':origin[2]*10.0,
+            'layer':self.layer_id(layer[1]) if layer else F_Cu}
+
+        for child in element:
+            if not isinstance(child,list) or not child:
+                continue
+            if child[0] == 'pad':
+                records.append(('pads',self.pad(
+                    child,origin,reference,value,local_clearance,
+                    mask_margin,paste_margin,paste_ratio)))
+            elif child[0] in ('fp_line','fp_arc','fp_circle','fp_poly',
+                              'fp_rect','fp_curve'):
+                records.append(('drawings',self.drawing(child,origin)))
+        for kind,record in records:
+            record['module'] = module
+        return records
+
+    def pad(self,element,origin,reference,value,module_clearance,
+            module_mask_margin,module_paste_margin,module_paste_ratio):
+        ox,oy,oangle = origin
+        px,py,angle = _at(element)
+        rx,ry = rotate(px,py,oangle)
+        x = int(round(ox + rx))
+        y = int(round(oy + ry))
+        w,h = _xy(element,'size')
+        drill_x = drill_y = 0
+        offset_x = offset_y = 0
+        drill_shape = PAD_SHAPE_CIRCLE
+        drill = _find(element,'drill')
+        if drill is not None:
+            # (offset x y) of the hole from the pad center, unrotated
+            offset_x,offset_y = _xy(drill,'offset')
+            sizes = [a for a in drill[1:] if not isinstance(a,list)]
+            if sizes and sizes[0] == 'oval':
+                drill_shape = PAD_SHAPE_OVAL
+                sizes = sizes[1:]
+            if sizes:
+                drill_x = _iu(sizes[0])
+                drill_y = _iu(sizes[1]) if len(sizes) > 1 else drill_x
+        netname = self.netname(element)
+        local_clearance = _iu(_number(element,'clearance'))
+        clearance = local_clearance or module_clearance \
+            or self.netclass(netname).clearance
+        local_mask_margin = _iu(_number(element,'solder_mask_margin'))
+        mask_margin = local_mask_margin or module_mask_margin \
+            or self.mask_margin
+        local_paste_margin = _iu(_number(element,'solder_paste_margin'))
+        paste_margin = local_paste_margin or module_paste_margin \
+            or self.paste_margin
+        paste_ratio = _number(element,'solder_paste_margin_ratio') \
+            or module_paste_ratio or self.paste_ratio
+        # bounding box of the rotated pad
+        radians = math.radians(angle)
+        bw = int(round(abs(w*math.cos(radians)) + abs(h*math.sin(radians))))
+        bh = int(round(abs(w*math.sin(radians)) + abs(h*math.cos(radians))))
+        layers = _find(element,'layers')
+        return {
+            'x':x,'y':y,'w':w,'h':h,'drill_x':drill_x,'drill_y':drill_y,
+            'offset_x':offset_x,'offset_y':offset_y,
+            'shape':_pad_shapes.get(element[3] if len(element) > 3 else '',
+                                    PAD_SHAPE_RECT),
+            'drill_shape':drill_shape,
+            'attribute':_pad_attributes.get(
+                element[2] if len(element) > 2 else '',PAD_ATTRIB_STANDARD),
+            'orientation':angle*10.0,
+            'net':netname,
+            'local_clearance':local_clearance,
+            'clearance':clearance,
+            'paste_margin_x':int(round(paste_margin + w*paste_ratio)),
+            'paste_margin_y':int(round(paste_margin + h*paste_ratio)),
+            'local_paste_margin':local_paste_margin,
+            'mask_margin':mask_margin,
+            'local_mask_margin':local_mask_margin,
+            'bbox_x':x - bw//2,'bbox_y':y - bh//2,'bbox_w':bw,'bbox_h':bh,
+            'reference':reference,
+            'name':element[1],
+            'footprint':value,
+            'layers':self.layers(layers[1:] if layers else [])}
+
+    def text(self,element,text,origin):
+        """Return the texts record of a gr_text or module text element,
+           or None if it has no layer."""
+        layer = _find(element,'layer')
+        if layer is None:
+            return None
+        ox,oy,oangle = origin
+        px,py,angle = _at(element)
+        rx,ry = rotate(px,py,oangle)
+        size_x = size_y = IU_PER_MM
+        thickness = int(0.15*IU_PER_MM)
+        justify = 0
+        mirror = False
+        effects = _find(element,'effects')
+        if effects is not None:
+            font = _find(effects,'font')
+            if font is not None:
+                size_x,size_y = _xy(font,'size',(size_x,size_y))
+                if _find(font,'thickness') is not None:
+                    thickness = _iu(_number(font,'thickness'))
+            options = _find(effects,'justify') or []
+            if 'left' in options:
+                justify = -1
+            elif 'right' in options:
+                justify = 1
+            mirror = 'mirror' in options
+        strokes,box,center = text_layout(
+            text,ox + rx,oy + ry,size_x,size_y,thickness,angle,
+            justify,mirror)
+        return {
+            'x':center[0],'y':center[1],
+            'box_x':box[0],'box_y':box[1],'box_w':box[2],'box_h':box[3],
+            'orientation':angle*10.0,
+            'thickness':thickness,
+            'size_x':size_x,'size_y':size_y,
+            'justify':justify,'mirror':mirror,
+            'text':text,
+            'strokes':strokes,
+            'net':'',
+            'layers':self.layers(layer[1:])}
+
+    def drawing(self,element,origin):
+        ox,oy,oangle = origin
+        shape,shape_name = _drawing_shapes.get(
+            element[0].split('_',1)[1],(S_LAST,element[0]))
+        if shape == S_CIRCLE:
+            start = _xy(element,'center')
+        else:
+            start = _xy(element,'start')
+        end = _xy(element,'end')
+        x1,y1 = rotate(start[0],start[1],oangle)
+        x2,y2 = rotate(end[0],end[1],oangle)
+        x1 = int(round(ox + x1))
+        y1 = int(round(oy + y1))
+        x2 = int(round(ox + x2))
+        y2 = int(round(oy + y2))
+        if shape in (S_ARC,S_CIRCLE):
+            center = (x1,y1)
+        else:
+            center = ((x1 + x2)//2,(y1 + y2)//2)
+        layer = _find(element,'layer')
+        return {
+            'x1':x1,'y1':y1,'x2':x2,'y2':y2,
+            'width':_width(element),
+            'shape':shape,
+            'cx':center[0],'cy':center[1],
+            'shape_name':shape_name,
+            'net':'',
+            'layers':self.layers(layer[1:] if layer else [])}
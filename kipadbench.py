@@ -0,0 +1,353 @@
+# kipadbench.py
+# Benchmarks of the KiPadCheck checks on synthetic boards, without KiCad.
+#
+# Usage (from the directory of kipadcheck.py and kicad_pcb.py):
+#    python kipadbench.py -o results.json
+#    python kipadbench.py --scales 1000,10000 --compare results.json
+#    python kipadbench.py --generate board.kicad_pcb --pads 5000
+#
+# Each scale N is a board with N pads, N/4 vias, N/2 tracks and N/10
+# silk texts (see SCALE_RATIOS), written by generate_board() and read
+# with the headless backend (kipadcheck.PcbFileBackend), or with
+# --backend pcbnew, loaded into the stand-in pcbnew (fakepcbnew.py) and
+# extracted by kipadcheck.PcbnewBackend before every check, as in pcbnew.
+# The boards only
+# depend on the arguments and --seed, so results of different versions
+# of kipadcheck.py can be compared: the JSON results hold the wall and
+# CPU time of every check and a hash of its report text.
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import StringIO
+import sys
+import tempfile
+import time
+
+import fakepcbnew
+fakepcbnew.install()
+import kipadcheck
+
+SCALES = (1000,10000,100000)
+"""Default board sizes, in pads."""
+SCALE_RATIOS = {'pads':1.0,'vias':0.25,'tracks':0.5,'texts':0.1}
+"""Number of each kind of item on a board of a given scale, per pad."""
+CHECKS = kipadcheck.KiPadCheck.HEADLESS_CHECKS
+"""Checks that are timed, in order."""
+BACKENDS = ('file','pcbnew')
+"""Board sources: kicad_pcb records or stand-in pcbnew objects."""
+
+_USER_LAYERS = (
+    (32,"B.Adhes"),(33,"F.Adhes"),(34,"B.Paste"),(35,"F.Paste"),
+    (36,"B.SilkS"),(37,"F.SilkS"),(38,"B.Mask"),(39,"F.Mask"),
+    (40,"Dwgs.User"),(44,"Edge.Cuts"),(48,"B.Fab"),(49,"F.Fab"))
+
+
+def generate_board(stream,pads=1000,vias=250,tracks=500,texts=100,
+                   layers=2,seed=1):
+    """Write a synthetic .kicad_pcb board to stream.
+       Pads come in footprints of four (two SMD pads on the footprint
+       side, two through hole pads), each with a silk line. The first
+       texts footprints have their reference on the silk layer, and any
+       texts beyond the footprints are board texts. Tracks and vias are
+       spread over layers copper layers, with some blind vias when there
+       are inner layers. The board grows with the number of pads, so the
+       density is the same at every scale. The same arguments always
+       write the same board."""
+    rand = random.Random(seed)
+    side = max(20.0,2.0*math.sqrt(pads))
+    nets = max(2,pads//20)
+    copper = ["F.Cu"] + ["In%d.Cu"%n for n in range(1,layers-1)] + ["B.Cu"]
+
+    def xy(margin=2.0):
+        return (rand.uniform(margin,side-margin),
+                rand.uniform(margin,side-margin))
+
+    out = stream.write
+    out('(kicad_pcb (version 20171130) (host kipadbench 1)\n'
+        '  (general (thickness 1.6))\n'
+        '  (layers\n')
+    out('    (0 F.Cu signal)\n')
+    for n in range(1,layers-1):
+        out('    (%d In%d.Cu signal)\n'%(n,n))
+    out('    (31 B.Cu signal)\n')
+    for num,name in _USER_LAYERS:
+        out('    (%d %s user)\n'%(num,name))
+    out('  )\n'
+        '  (setup\n'
+        '    (pad_to_mask_clearance 0.05)\n'
+        '    (pad_to_paste_clearance -0.02)\n'
+        '  )\n'
+        '  (net 0 "")\n')
+    for net in range(1,nets+1):
+        out('  (net %d N%d)\n'%(net,net))
+    out('  (net_class Default "Default"\n'
+        '    (clearance 0.2)\n'
+        '    (via_dia 0.8)\n'
+        '    (via_drill 0.4)\n')
+    for net in range(1,nets+1):
+        out('    (add_net N%d)\n'%net)
+    out('  )\n')
+
+    modules = (pads+3)//4
+    for m in range(modules):
+        x,y = xy()
+        angle = rand.choice((0,90,180,270,45))
+        layer = rand.choice(("F","B"))
+        mirror = " (justify mirror)" if layer == "B" else ""
+        out('  (module KiPadBench:M4 (layer %s.Cu)\n'
+            '    (at %.4f %.4f %d)\n'%(layer,x,y,angle))
+        out('    (fp_text reference U%d (at 0 -1.8 %d) (layer %s)\n'
+            '      (effects (font (size 1 1) (thickness 0.15))%s)\n'
+            '    )\n'%(m,angle,
+                      "%s.SilkS"%layer if m < texts else "%s.Fab"%layer,
+                      mirror))
+        out('    (fp_line (start -1.5 1.2) (end 1.5 1.2) (layer %s.SilkS)'
+            ' (width 0.12))\n'%layer)
+        for p in range(min(4,pads-4*m)):
+            net = rand.randint(1,nets)
+            if p < 2:
+                out('    (pad %d smd rect (at %.2f -0.6 %d) (size %s)'
+                    ' (layers %s.Cu %s.Paste %s.Mask) (net %d N%d))\n'%(
+                    p+1,-0.95+1.9*p,angle,
+                    rand.choice(("0.6 0.8","1.0 1.45","0.3 0.8")),
+                    layer,layer,layer,net,net))
+            else:
+                size = rand.choice((1.6,1.8,2.0))
+                out('    (pad %d thru_hole circle (at %.2f 0.6 %d)'
+                    ' (size %.1f %.1f) (drill %s) (layers *.Cu *.Mask)'
+                    ' (net %d N%d))\n'%(
+                    p+1,-0.95+1.9*(p-2),angle,size,size,
+                    rand.choice(("0.8","1.0","1.02","oval 0.8 1.2")),
+                    net,net))
+        out('  )\n')
+
+    for t in range(modules,texts):
+        x,y = xy()
+        out('  (gr_text "TEXT %d" (at %.4f %.4f %d) (layer F.SilkS)\n'
+            '    (effects (font (size 1.5 1.5) (thickness 0.3)))\n'
+            '  )\n'%(t,x,y,rand.choice((0,90,30))))
+
+    for t in range(tracks):
+        x,y = xy()
+        out('  (segment (start %.4f %.4f) (end %.4f %.4f) (width %s)'
+            ' (layer %s) (net %d))\n'%(
+            x,y,
+            min(side,max(0.0,x+rand.uniform(-5.0,5.0))),
+            min(side,max(0.0,y+rand.uniform(-5.0,5.0))),
+            rand.choice(("0.2","0.25","0.5")),
+            rand.choice(copper),rand.randint(1,nets)))
+
+    for v in range(vias):
+        x,y = xy()
+        if layers > 2 and rand.random() < 0.2:
+            kind,ends = "blind ",(copper[0],copper[1])
+        else:
+            kind,ends = "",(copper[0],copper[-1])
+        out('  (via %s(at %.4f %.4f) (size %s) %s(layers %s %s) (net %d))\n'%(
+            kind,x,y,rand.choice(("0.6","0.8")),
+            rand.choice(("(drill 0.3) ","(drill 0.4) ","")),
+            ends[0],ends[1],rand.randint(1,nets)))
+
+    out('  (gr_line (start 0 0) (end %.4f 0) (layer Edge.Cuts) (width 0.05))\n'
+        '  (gr_circle (center 5 5) (end 6 5) (layer F.SilkS) (width 0.15))\n'
+        ')\n'%side)
+
+
+def scale_counts(scale):
+    """Return the item counts of a board of the given scale."""
+    return dict((kind,int(scale*ratio))
+                for kind,ratio in SCALE_RATIOS.items())
+
+
+def cpu_time():
+    """Return the CPU time of this process and its finished children
+       (the silk check pool), in seconds."""
+    t = os.times()
+    return t[0]+t[1]+t[2]+t[3]
+
+
+def time_check(backend,check,parameters):
+    """Run one check headless on backend. Returns (wall seconds, CPU
+       seconds, report text)."""
+    checker = kipadcheck.KiPadCheck()
+    checker._parameters = parameters
+    checker._checkpoint_dir = None
+    report = StringIO.StringIO()
+    wall = time.time()
+    cpu = cpu_time()
+    checker.RunHeadless(backend,[check],report)
+    return (time.time()-wall,cpu_time()-cpu,report.getvalue())
+
+
+def run_board(counts,layers,seed,checks,parameters,repeat=1,log=None,
+              backend='file'):
+    """Generate, load and check one board. Returns the list of result
+       dicts: one per step ('generate', 'load' and each check), with the
+       best wall and CPU time of repeat runs."""
+    base = dict(counts,layers=layers,seed=seed)
+    if backend != 'file':
+        base['backend'] = backend
+    results = []
+
+    def record(step,wall,cpu,text=None):
+        result = dict(base,step=step,wall=round(wall,4),cpu=round(cpu,4))
+        if text is not None:
+            result['report_sha1'] = hashlib.sha1(text).hexdigest()
+        results.append(result)
+        if log is not None:
+            log.write("%8d pads  %-12s %9.3f s wall %9.3f s cpu\n"%(
+                counts['pads'],step,wall,cpu))
+            log.flush()
+
+    handle,path = tempfile.mkstemp(suffix=".kicad_pcb",prefix="kipadbench-")
+    try:
+        wall = time.time()
+        cpu = cpu_time()
+        with os.fdopen(handle,"w") as stream:
+            generate_board(stream,layers=layers,seed=seed,**counts)
+        record('generate',time.time()-wall,cpu_time()-cpu)
+
+        wall = time.time()
+        cpu = cpu_time()
+        if backend == 'pcbnew':
+            fakepcbnew.LoadBoard(path)
+            # one checker for all runs, as in pcbnew: the board is
+            # extracted again for every check, its text strokes are cached
+            source = kipadcheck.PcbnewBackend(kipadcheck.KiPadCheck())
+        else:
+            source = kipadcheck.PcbFileBackend(path)
+            source.snapshot()
+        record('load',time.time()-wall,cpu_time()-cpu)
+
+        for check in checks:
+            best = None
+            for i in range(repeat):
+                timing = time_check(source,check,parameters)
+                if best is None or timing[0] < best[0]:
+                    best = timing
+            record(check,*best)
+    finally:
+        os.remove(path)
+    return results
+
+
+def compare(old,new,stream):
+    """Write a table of the wall times of the new results against the
+       old ones, by board and step, noting reports that changed."""
+    def key(result):
+        return (result['pads'],result['vias'],result['tracks'],
+                result['texts'],result['layers'],result['seed'],
+                result['step'])
+    before = dict((key(r),r) for r in old['results'])
+    stream.write("\n%8s  %-12s %10s %10s %7s\n"%(
+        "pads","step","old (s)","new (s)","ratio"))
+    for result in new['results']:
+        previous = before.get(key(result))
+        if previous is None:
+            continue
+        note = ""
+        if previous.get('report_sha1') != result.get('report_sha1'):
+            note = "  report differs"
+        stream.write("%8d  %-12s %10.3f %10.3f %7.2f%s\n"%(
+            result['pads'],result['step'],previous['wall'],result['wall'],
+            result['wall']/previous['wall'] if previous['wall'] else 0.0,
+            note))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="kipadbench",
+        description="Time the KiPadCheck checks on synthetic boards.")
+    parser.add_argument("--scales",default=",".join(str(s) for s in SCALES),
+        help="comma separated board sizes in pads (default %(default)s)")
+    parser.add_argument("--pads",type=int,
+        help="check one board with this many pads (and the counts below)"
+             " instead of --scales")
+    parser.add_argument("--vias",type=int,help="vias on the --pads board")
+    parser.add_argument("--tracks",type=int,help="tracks on the --pads board")
+    parser.add_argument("--texts",type=int,help="silk texts on the --pads board")
+    parser.add_argument("--layers",type=int,default=2,
+        help="copper layers (default %(default)s)")
+    parser.add_argument("--seed",type=int,default=1,
+        help="random seed of the boards (default %(default)s)")
+    parser.add_argument("--checks",default=",".join(CHECKS),
+        help="comma separated checks to time (default %(default)s)")
+    parser.add_argument("--sp",type=float,default=0.2,
+        help="(mm) Silk to Pad spacing (default %(default)s)")
+    parser.add_argument("--sc",action="store_true",help="Silk Slow Check")
+    parser.add_argument("--silk-workers",type=int,default=1,
+        help="processes for the silk check (default %(default)s)")
+    parser.add_argument("--backend",choices=BACKENDS,default=BACKENDS[0],
+        help="read the boards as kicad_pcb records (file) or as stand-in "
+        "pcbnew objects (pcbnew) (default %(default)s)")
+    parser.add_argument("--repeat",type=int,default=1,
+        help="runs of each check, the fastest is kept (default %(default)s)")
+    parser.add_argument("--compare",metavar="JSON",
+        help="results of an earlier run to compare with")
+    parser.add_argument("--generate",metavar="BOARD",
+        help="only write the --pads board to this .kicad_pcb file")
+    parser.add_argument("-o","--output",default="-",
+        help="JSON results file (default stdout)")
+    args = parser.parse_args(argv)
+
+    checks = [c.strip() for c in args.checks.split(",") if c.strip()]
+    for check in checks:
+        if check not in CHECKS:
+            parser.error("unknown check %s (choose from %s)"%(
+                check,", ".join(CHECKS)))
+    if args.layers < 2 or args.layers > 32 or args.layers % 2:
+        parser.error("--layers must be an even number from 2 to 32")
+    if args.pads is not None:
+        counts = scale_counts(args.pads)
+        for kind in ('vias','tracks','texts'):
+            if getattr(args,kind) is not None:
+                counts[kind] = getattr(args,kind)
+        boards = [counts]
+    else:
+        boards = [scale_counts(int(s)) for s in args.scales.split(",")]
+
+    if args.generate is not None:
+        if args.pads is None:
+            parser.error("--generate needs --pads")
+        with open(args.generate,"w") as stream:
+            generate_board(stream,layers=args.layers,seed=args.seed,
+                           **boards[0])
+        return 0
+
+    parameters = dict(kipadcheck.KiPadCheck._parameters,
+        sp=args.sp,sc=args.sc,sw=args.silk_workers)
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    results = {
+        'time':time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python':platform.python_version(),
+        'numpy':numpy_version,
+        'platform':platform.platform(),
+        'parameters':parameters,
+        'results':[]}
+    for counts in boards:
+        results['results'].extend(run_board(counts,args.layers,args.seed,
+            checks,parameters,args.repeat,sys.stderr,args.backend))
+
+    if args.output == "-":
+        json.dump(results,sys.stdout,indent=1,sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output,"w") as stream:
+            json.dump(results,stream,indent=1,sort_keys=True)
+            stream.write("\n")
+    if args.compare is not None:
+        with open(args.compare) as stream:
+            compare(json.load(stream),results,sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,6 +35,20 @@
 # In pcbnew, open scripting console (Tools > Scripting Console)
 # Type "import kipadcheck".
 #
+# Without KiCad: place kicad_pcb.py next to kipadcheck.py. When pcbnew
+# and wx cannot be imported, the checks run on a .kicad_pcb file:
+#    import kipadcheck
+#    kipadcheck.KiPadCheck().RunHeadless(
+#        kipadcheck.PcbFileBackend('board.kicad_pcb'))
+# Text is drawn with a simple stroke font, so silk checks on text are
+# approximate.
+#
+# Batch mode: check many boards in parallel and write one report, e.g.
+#    python kipadcheck.py --vv 12 --vt 12 --sp 0.1 --sc -j 8 \
+#        -o report.txt boards/*.kicad_pcb
+# Each board's results are written as soon as that board is done.
+# See python kipadcheck.py --help.
+#
 # ABOUT:
 
 # This python script provides additional basic DRC checks to KiCAD and lists
@@ -52,17 +66,13 @@
 # Preliminary support is included for more than 2 layers.
 # Pads are not verified for shape, currently assumes rectangle bounding box.
 # Assumes all pads are on the front.
-# Does not mix via drill and pad drill checks.
-# Does not check annular ring size.
 #
 # TODO list, aside from fixing the BUGS above.
 #   Support all layers for all checks. Currently SilkInfo does check layers
 #      appropriately: F.Cu vs. F.SilkS and B.Cu vs. B.SilkS
-#	Support more than just through drills (i.e. buried/blind self._vias).
 #   Label units and make consistent.
 #   Mask Info: Check solder mask dam sizes.
 #   Silk Info: Check silk screen character sizes.
-#   Check Annular Rings.
 #   Update progress bar when doing SilkInfo
 #
 # Pad Info: Produces two lists: 
@@ -134,7 +144,7 @@
 #
 #   4) Distance from each via to next closest via
 #      ***** Distance to next closest via  *****
-#      (looking only *forward* through the list)
+#      (nearest via through a common layer)
 #      
 #      Minimum Via to Via = 20.000 mils (0.508 mm)
 #      0 3.692 mm
@@ -225,11 +235,51 @@ import threading
 import Queue
 from operator import itemgetter
 import math
+import re
 import itertools
-
-import wx
-import pcbnew
+import array
+import bisect
+import collections
+import heapq
+import sys
+import argparse
+import multiprocessing
+import StringIO
+import traceback
+import os
+import tempfile
+import hashlib
+import cPickle as pickle
+import json
+import getpass
+import stat
+
+try:
+    import wx
+    import pcbnew
+except ImportError:
+    # Without KiCad, checks run headless on .kicad_pcb files
+    # (see PcbFileBackend); kicad_pcb provides the pcbnew constants,
+    # unless a stand-in pcbnew is loaded (see fakepcbnew.py).
+    wx = None
+    pcbnew = sys.modules.get('pcbnew')
+    if pcbnew is None:
+        import kicad_pcb as pcbnew
+if getattr(pcbnew,'STAND_IN',False):
+    # no pcbnew window to put the dialog in
+    wx = None
+try:
+    import kicad_pcb
+except ImportError:
+    # only needed without KiCad (PcbFileBackend): in KiCad, kipadcheck.py
+    # is installed on its own
+    kicad_pcb = None
 import random # for testing
+try:
+    import numpy
+except ImportError:
+    # optional: the batched checks fall back to the scalar functions
+    numpy = None
 
 # Action Plugin information here:
 # https://forum.kicad.info/t/
@@ -413,6 +463,44 @@ class wxPointUtil:
         # projection = v + (w-v).scale(t);  # Projection falls on the segment
         # return p.distance(projection);
                 
+    @staticmethod
+    def mindistance_xy(px, py, vx, vy, wx, wy):
+        """Return minimum distance between point px,py and line segment
+           vx,vy - wx,wy. Same as mindistance, but on plain numbers so no
+           point objects are created."""
+        wvx = wx - vx
+        wvy = wy - vy
+        pvx = px - vx
+        pvy = py - vy
+        L2 = float(wvx*wvx + wvy*wvy)
+        if L2 == 0.0:
+            return math.sqrt(pvx*pvx + pvy*pvy)
+        t = max(0.0, min(1.0, (pvx*wvx + pvy*wvy) / L2))
+        dx = pvx - t*wvx
+        dy = pvy - t*wvy
+        return math.sqrt(dx*dx + dy*dy)
+
+    @staticmethod
+    def mindistance_segments_xy(ax, ay, bx, by, cx, cy, dx, dy):
+        """Return minimum distance between line segments ax,ay - bx,by
+           and cx,cy - dx,dy (0 if they cross). Segments may be points."""
+        abx = bx - ax
+        aby = by - ay
+        cdx = dx - cx
+        cdy = dy - cy
+        # sides of c and d from ab, and of a and b from cd
+        c_side = abx*(cy - ay) - aby*(cx - ax)
+        d_side = abx*(dy - ay) - aby*(dx - ax)
+        a_side = cdx*(ay - cy) - cdy*(ax - cx)
+        b_side = cdx*(by - cy) - cdy*(bx - cx)
+        if c_side*d_side < 0 and a_side*b_side < 0:
+            return 0.0
+        mindistance_xy = wxPointUtil.mindistance_xy
+        return min(mindistance_xy(ax,ay,cx,cy,dx,dy),
+                   mindistance_xy(bx,by,cx,cy,dx,dy),
+                   mindistance_xy(cx,cy,ax,ay,bx,by),
+                   mindistance_xy(dx,dy,ax,ay,bx,by))
+
     #https://stackoverflow.com/questions/2272179/a-simple-algorithm-for-polygon-intersection
     # NB: The algorithm only works for convex polygons, specified in either clockwise, or counterclockwise order.
 
@@ -470,7 +558,169 @@ class wxPointUtil:
                 #print(" Nope\n")
 
         return True
-        
+
+    @staticmethod
+    def polygon_array(polygons):
+        """Return polygons (a list of polygons with the same number of
+           points) as an (N, k, 2) int64 numpy array for
+           check_polygons_intersecting_batch(). Returns polygons unchanged
+           when numpy is not available."""
+        if numpy is None:
+            return polygons
+        if not len(polygons):
+            return numpy.zeros((0,0,2),dtype=numpy.int64)
+        return numpy.array(
+            [[(p[0],p[1]) for p in polygon] for polygon in polygons],
+            dtype=numpy.int64)
+
+    @staticmethod
+    def take_polygons(polygons,indexes):
+        """Return the polygons at indexes of a polygon_array() result."""
+        if numpy is None:
+            return [polygons[i] for i in indexes]
+        return polygons[indexes]
+
+    @staticmethod
+    def polygon_box(polygon,grow=0):
+        """Return the axis aligned box (minx,miny,maxx,maxy) of the points
+           of polygon, grown by grow on every side."""
+        xs = [p[0] for p in polygon]
+        ys = [p[1] for p in polygon]
+        return (min(xs)-grow,min(ys)-grow,max(xs)+grow,max(ys)+grow)
+
+    @staticmethod
+    def boxes_overlapping(box_a,box_b):
+        """Return True if the (minx,miny,maxx,maxy) boxes overlap or touch."""
+        return (box_a[0] <= box_b[2] and box_b[0] <= box_a[2]
+                and box_a[1] <= box_b[3] and box_b[1] <= box_a[3])
+
+    @staticmethod
+    def polygon_edges(polygons):
+        """Return the edges of closed (..., k, 2) polygon_array() polygons
+           as a (..., k-1, 2, 2) array of segments. Requires numpy."""
+        return numpy.stack((polygons[...,:-1,:],polygons[...,1:,:]),axis=-2)
+
+    @staticmethod
+    def mindistance2_segments_batch(segments_a, segments_b):
+        """Return the squared minimum distances between every segment of
+           segments_a (N, 2, 2) and every segment of segments_b (M, 2, 2)
+           as an (N, M) float array. Like mindistance2_line_polygon(), this
+           is the smallest end point to segment distance, so crossing
+           segments are not reported as 0: test those with
+           check_polygons_intersecting_batch(). Requires numpy."""
+        a = numpy.asarray(segments_a,dtype=float)
+        b = numpy.asarray(segments_b,dtype=float)
+        a0 = a[:,numpy.newaxis,0,:]
+        a1 = a[:,numpy.newaxis,1,:]
+        b0 = b[numpy.newaxis,:,0,:]
+        b1 = b[numpy.newaxis,:,1,:]
+        def point_segment2(p, v, w):
+            vw = w - v
+            pv = p - v
+            length2 = (vw*vw).sum(axis=-1)
+            t = (pv*vw).sum(axis=-1) / numpy.where(length2 > 0, length2, 1.0)
+            t = numpy.clip(t,0.0,1.0)
+            d = pv - t[...,numpy.newaxis]*vw
+            return (d*d).sum(axis=-1)
+        return numpy.minimum(
+            numpy.minimum(point_segment2(a0,b0,b1),point_segment2(a1,b0,b1)),
+            numpy.minimum(point_segment2(b0,a0,a1),point_segment2(b1,a0,a1)))
+
+    @staticmethod
+    def _edge_normals(polygons,closed):
+        """Return the edge normals (..., e, 2) of (..., k, 2) polygons,
+           for the same edges as check_polygons_intersecting()."""
+        if closed:
+            edges = polygons[...,1:,:] - polygons[...,:-1,:]
+        else:
+            edges = numpy.roll(polygons,-1,axis=-2) - polygons
+        return numpy.stack((edges[...,1],-edges[...,0]),axis=-1)
+
+    @staticmethod
+    def check_polygons_intersecting_batch(poly_a, polys_b, closed=True):
+        """Batched check_polygons_intersecting() of polygon poly_a against
+           each of the N polygons in polys_b. Returns a sequence of N
+           booleans.
+           With numpy, poly_a is an (m, 2) array and polys_b an (N, k, 2)
+           array (see polygon_array()), and all separating axes are tested
+           at once. Use integer arrays: products of board coordinates need
+           64 bits. Without numpy, poly_a is a list of points, polys_b a
+           list of polygons, and each pair is checked with
+           check_polygons_intersecting()."""
+        if numpy is None:
+            return [wxPointUtil.check_polygons_intersecting(
+                        poly_a,poly_b,closed) for poly_b in polys_b]
+        if not len(polys_b):
+            return numpy.zeros(0,dtype=bool)
+        # axes from the edges of poly_a
+        normals = wxPointUtil._edge_normals(poly_a,closed)     # (e,2)
+        proj_a = poly_a.dot(normals.T)                         # (m,e)
+        proj_b = polys_b.dot(normals.T)                        # (N,k,e)
+        separated = ((proj_a.max(axis=0) < proj_b.min(axis=1))
+                     | (proj_b.max(axis=1) < proj_a.min(axis=0))).any(axis=1)
+        # axes from the edges of each polygon of polys_b
+        normals = wxPointUtil._edge_normals(polys_b,closed)    # (N,e,2)
+        nx = normals[:,numpy.newaxis,:,0]
+        ny = normals[:,numpy.newaxis,:,1]
+        proj_a = (poly_a[numpy.newaxis,:,0,numpy.newaxis]*nx
+                  + poly_a[numpy.newaxis,:,1,numpy.newaxis]*ny)  # (N,m,e)
+        proj_b = (polys_b[:,:,0,numpy.newaxis]*nx
+                  + polys_b[:,:,1,numpy.newaxis]*ny)             # (N,k,e)
+        separated |= ((proj_a.max(axis=1) < proj_b.min(axis=1))
+                      | (proj_b.max(axis=1) < proj_a.min(axis=1))).any(axis=1)
+        return ~separated
+
+    @staticmethod
+    def annular_ring(w, h, drill_x, drill_y, offset_x, offset_y, rounded):
+        """Return the narrowest copper between a pad's hole and the edge
+           of the pad, negative when the hole breaks out. The pad is w by
+           h, its hole drill_x by drill_y (a slot when they differ) at
+           offset_x, offset_y from the pad center, all in the pad's own
+           unrotated frame. A rounded (circle or oval) pad is a capsule:
+           the ring is its radius less the hole radius, less the farthest
+           distance from an end of the hole's segment to the pad's segment.
+           Other pads are taken as their rectangle."""
+        if not rounded:
+            return min(w/2.0 - abs(offset_x) - drill_x/2.0,
+                       h/2.0 - abs(offset_y) - drill_y/2.0)
+        # half lengths of the pad and hole segments along x and y
+        pad_x = max(w-h,0)/2.0
+        pad_y = max(h-w,0)/2.0
+        hole_x = max(drill_x-drill_y,0)/2.0
+        hole_y = max(drill_y-drill_x,0)/2.0
+        farthest = 0.0
+        for sign in (1,-1):
+            dx = max(abs(offset_x + sign*hole_x) - pad_x,0)
+            dy = max(abs(offset_y + sign*hole_y) - pad_y,0)
+            farthest = max(farthest,math.sqrt(dx*dx+dy*dy))
+        return (min(w,h) - min(drill_x,drill_y))/2.0 - farthest
+
+    @staticmethod
+    def annular_ring_batch(w, h, drill_x, drill_y, offset_x, offset_y, rounded):
+        """Batched annular_ring() of N pads. With numpy, the arguments are
+           float arrays (rounded a boolean array) and all the rings are
+           computed at once, both ways, then picked by shape. Without
+           numpy, they are sequences and each pad is computed with
+           annular_ring()."""
+        if numpy is None:
+            return map(wxPointUtil.annular_ring,
+                       w,h,drill_x,drill_y,offset_x,offset_y,rounded)
+        rectangle = numpy.minimum(
+            w/2.0 - numpy.abs(offset_x) - drill_x/2.0,
+            h/2.0 - numpy.abs(offset_y) - drill_y/2.0)
+        pad_x = numpy.maximum(w-h,0)/2.0
+        pad_y = numpy.maximum(h-w,0)/2.0
+        hole_x = numpy.maximum(drill_x-drill_y,0)/2.0
+        hole_y = numpy.maximum(drill_y-drill_x,0)/2.0
+        farthest = numpy.maximum(
+            numpy.hypot(numpy.maximum(numpy.abs(offset_x+hole_x)-pad_x,0),
+                        numpy.maximum(numpy.abs(offset_y+hole_y)-pad_y,0)),
+            numpy.hypot(numpy.maximum(numpy.abs(offset_x-hole_x)-pad_x,0),
+                        numpy.maximum(numpy.abs(offset_y-hole_y)-pad_y,0)))
+        capsule = (numpy.minimum(w,h)
+                   - numpy.minimum(drill_x,drill_y))/2.0 - farthest
+        return numpy.where(rounded,capsule,rectangle)
+
     # To find orientation of ordered triplet (p, q, r).
     # The function returns following values
     # 0 --> p, q and r are colinear
@@ -512,6 +762,1281 @@ class wxPointUtil:
             pcbnew.wxPoint(maxx,miny), # lower right
             pcbnew.wxPoint(minx,miny)) # lower left
 
+
+class SpatialGrid(object):
+    """Uniform grid of points for fixed-range neighbour queries.
+       Points are bucketed by integer cell coordinates. When cellsize is at
+       least the largest distance of interest, any two points closer than
+       that distance are in the same or adjacent cells, so only the 3x3
+       neighbourhood needs to be compared."""
+
+    def __init__(self,cellsize):
+        self.cellsize = float(max(cellsize,1))
+        self.cells = {}
+        """Dictionary of (cx,cy) cell key to list of point indexes."""
+        self.points = []
+        """List of (x,y) in insertion order, indexed by point index."""
+
+    def cell_key(self,x,y):
+        """Return the (cx,cy) key of the cell containing point x,y."""
+        return (int(math.floor(x/self.cellsize)),
+                int(math.floor(y/self.cellsize)))
+
+    def insert(self,x,y):
+        """Add the point x,y to the grid and return its index."""
+        index = len(self.points)
+        self.points.append((x,y))
+        self.cells.setdefault(self.cell_key(x,y),[]).append(index)
+        return index
+
+    def neighbours(self,x,y):
+        """Yield the indexes of all points in the cell containing x,y
+           and the eight cells around it."""
+        cx,cy = self.cell_key(x,y)
+        cells = self.cells
+        for nx in (cx-1,cx,cx+1):
+            for ny in (cy-1,cy,cy+1):
+                for index in cells.get((nx,ny),()):
+                    yield index
+
+    # Half of the 3x3 neighbourhood, so each pair of cells is visited once.
+    _forward_cells = ((1,-1),(1,0),(1,1),(0,1))
+
+    def pairs(self):
+        """Yield each candidate pair (i,j), i<j, of points that share a
+           cell or lie in adjacent cells. Every pair closer than cellsize
+           is guaranteed to be yielded exactly once."""
+        cells = self.cells
+        for (cx,cy),members in cells.iteritems():
+            count = len(members)
+            for a in range(count):
+                i = members[a]
+                for b in range(a+1,count):
+                    j = members[b]
+                    yield (i,j) if i<j else (j,i)
+            for dx,dy in self._forward_cells:
+                others = cells.get((cx+dx,cy+dy))
+                if not others:
+                    continue
+                for i in members:
+                    for j in others:
+                        yield (i,j) if i<j else (j,i)
+
+
+class RTree(object):
+    """Static R-tree of axis aligned boxes, bulk loaded once with
+       Sort-Tile-Recursive (STR) packing.
+       Boxes are (minx,miny,maxx,maxy) tuples and are identified by their
+       index in the list given to the constructor. Nodes are tuples of
+       (minx,miny,maxx,maxy,children,is_leaf); leaf children are box indexes."""
+
+    def __init__(self,boxes,capacity=16):
+        self.boxes = boxes
+        self.capacity = max(2,capacity)
+        level = self._pack(
+            [(box[0],box[1],box[2],box[3],index)
+             for index,box in enumerate(boxes)],
+            True)
+        while len(level) > 1:
+            level = self._pack(level,False)
+        self.root = level[0] if level else None
+
+    def _pack(self,entries,is_leaf):
+        """Return the list of parent nodes for entries using STR:
+           sort by x center, cut into vertical slices, sort each slice by
+           y center and fill nodes of self.capacity entries."""
+        if not entries:
+            return []
+        capacity = self.capacity
+        nodecount = int(math.ceil(len(entries)/float(capacity)))
+        slicecount = int(math.ceil(math.sqrt(nodecount)))
+        slicesize = slicecount*capacity
+        entries = sorted(entries,key=lambda e: e[0]+e[2])
+        nodes = []
+        for s in range(0,len(entries),slicesize):
+            tile = sorted(entries[s:s+slicesize],key=lambda e: e[1]+e[3])
+            for n in range(0,len(tile),capacity):
+                group = tile[n:n+capacity]
+                nodes.append((
+                    min(e[0] for e in group),
+                    min(e[1] for e in group),
+                    max(e[2] for e in group),
+                    max(e[3] for e in group),
+                    [e[4] for e in group] if is_leaf else group,
+                    is_leaf))
+        return nodes
+
+    def query(self,minx,miny,maxx,maxy):
+        """Return the list of indexes of boxes that overlap the given box."""
+        found = []
+        if self.root is None:
+            return found
+        boxes = self.boxes
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node[0] > maxx or node[2] < minx \
+               or node[1] > maxy or node[3] < miny:
+                continue
+            if node[5]:
+                for index in node[4]:
+                    b = boxes[index]
+                    if b[0] <= maxx and b[2] >= minx \
+                       and b[1] <= maxy and b[3] >= miny:
+                        found.append(index)
+            else:
+                stack.extend(node[4])
+        return found
+
+
+class SpanIndex(object):
+    """Spatial index of boxes (minx,miny,maxx,maxy) on copper layer
+       spans (top, bottom), for layer-sliced queries on boards with
+       blind, buried and micro vias. The boxes of each distinct span are
+       packed into an RTree of their own. The distinct spans, sorted by
+       top layer, are the interval index: a query only searches the trees
+       of the spans that share a copper layer with its own span.
+       Layer numbers are in stack order (see BoardSnapshot.copper_span)."""
+
+    def __init__(self,boxes,spans,capacity=16):
+        by_span = {}
+        for index,span in enumerate(spans):
+            by_span.setdefault(span,[]).append(index)
+        self.spans = sorted(by_span)
+        """Distinct (top, bottom) spans, by top layer."""
+        self.tops = [top for top,bottom in self.spans]
+        self.trees = [
+            (by_span[span],RTree([boxes[i] for i in by_span[span]],capacity))
+            for span in self.spans]
+        """(box indexes, RTree of those boxes) of each span."""
+
+    @staticmethod
+    def share_dielectric(span_a,span_b):
+        """Return whether holes of copper spans span_a and span_b drill
+           through a common dielectric layer: the spans are the same or
+           overlap by more than one layer."""
+        return span_a == span_b or (
+            span_a[0] < span_b[1] and span_b[0] < span_a[1])
+
+    def overlapping(self,top,bottom):
+        """Return the indexes into self.spans of the spans that share a
+           copper layer with top..bottom."""
+        # spans that start below bottom cannot share a layer
+        end = bisect.bisect_right(self.tops,bottom)
+        return [i for i in range(end) if self.spans[i][1] >= top]
+
+    def query(self,minx,miny,maxx,maxy,top,bottom):
+        """Return the list of indexes of boxes that overlap the given box
+           and share a copper layer with top..bottom."""
+        found = []
+        for i in self.overlapping(top,bottom):
+            indexes,tree = self.trees[i]
+            found.extend(indexes[j] for j in tree.query(minx,miny,maxx,maxy))
+        return found
+
+
+class SweepAndPrune(object):
+    """Broad phase between two sets of axis aligned boxes
+       (minx,miny,maxx,maxy): the boxes of both sets are sorted by minx
+       and swept once, and y overlap is only tested for boxes whose x
+       ranges overlap. Touching boxes overlap."""
+
+    def __init__(self,boxes_a,boxes_b):
+        self.boxes_a = boxes_a
+        self.boxes_b = boxes_b
+
+    def total(self):
+        """Return the number of pairs without pruning."""
+        return len(self.boxes_a)*len(self.boxes_b)
+
+    def pairs(self):
+        """Return the sorted list of (index in boxes_a, index in boxes_b)
+           of overlapping boxes."""
+        sets = (self.boxes_a,self.boxes_b)
+        events = sorted(
+            [(box[0],0,i) for i,box in enumerate(self.boxes_a)]
+            + [(box[0],1,i) for i,box in enumerate(self.boxes_b)])
+        active = ([],[])
+        pairs = []
+        for minx,side,index in events:
+            box = sets[side][index]
+            other = 1 - side
+            others = sets[other]
+            # drop boxes of the other set that end before this one starts
+            active[other][:] = [j for j in active[other]
+                                if others[j][2] >= minx]
+            for j in active[other]:
+                if others[j][1] <= box[3] and box[1] <= others[j][3]:
+                    pairs.append((index,j) if side == 0 else (j,index))
+            active[side].append(index)
+        pairs.sort()
+        return pairs
+
+
+class KDTree(object):
+    """Balanced 2-d tree of points (circles) for nearest neighbour queries.
+       Each point may have a radius; the distance between two points is
+       then the edge to edge distance: center distance minus both radii.
+       Nodes are tuples of (point index, axis, left node, right node)."""
+
+    def __init__(self,points,radii=None):
+        self.points = points
+        self.radii = radii if radii is not None else [0]*len(points)
+        self.maxradius = max(self.radii) if len(self.radii) else 0
+        self.root = self._build(range(len(points)),0)
+
+    def _build(self,indexes,axis):
+        if not indexes:
+            return None
+        points = self.points
+        indexes = sorted(indexes,key=lambda i: points[i][axis])
+        median = len(indexes)//2
+        return (indexes[median],
+                axis,
+                self._build(indexes[:median],1-axis),
+                self._build(indexes[median+1:],1-axis))
+
+    def nearest(self,index):
+        """Return (nearest index, edge to edge distance) of the point
+           closest to points[index], excluding itself.
+           Returns (None, None) if there is no other point."""
+        x,y = self.points[index]
+        nearest,distance = self.query(x,y,index)
+        if nearest is None:
+            return (None,None)
+        return (nearest,distance-self.radii[index])
+
+    def query(self,x,y,exclude=None):
+        """Return (nearest index, distance from x,y to its edge) of the
+           point closest to x,y, other than point exclude.
+           Returns (None, None) if there is no such point."""
+        best = [None,float('inf')]
+        if self.root is not None:
+            self._search(self.root,x,y,exclude,best)
+        if best[0] is None:
+            return (None,None)
+        return (best[0],best[1])
+
+    def _search(self,node,x,y,exclude,best):
+        # best is [index, center distance minus radius of that point]
+        index,axis,left,right = node
+        px,py = self.points[index]
+        if index != exclude:
+            dx = px - x
+            dy = py - y
+            value = math.sqrt(dx*dx+dy*dy) - self.radii[index]
+            if value < best[1]:
+                best[0] = index
+                best[1] = value
+        diff = (x - px) if axis == 0 else (y - py)
+        near,far = (left,right) if diff < 0 else (right,left)
+        if near is not None:
+            self._search(near,x,y,exclude,best)
+        # the far side can only win if the splitting line is close enough
+        if far is not None and abs(diff) - self.maxradius < best[1]:
+            self._search(far,x,y,exclude,best)
+
+    def all_nearest(self):
+        """Return a list, in point order, of (nearest index, distance)
+           for every point. See nearest()."""
+        return [self.nearest(i) for i in range(len(self.points))]
+
+
+class DrillPath(object):
+    """Drilling order of the holes of one tool: an open path through
+       points (x,y), from the first to the last index of order.
+       seed() orders the points along a Hilbert curve, which keeps points
+       that are close on the board mostly close in the path. improve()
+       then applies 2-opt moves: for each point and each of its nearest
+       points (from a SpatialGrid), the two path edges whose exchange
+       makes them neighbours in the path are replaced when that shortens
+       the path. A missing edge past either end of the path has length
+       0, so the ends move too."""
+
+    HILBERT_ORDER = 12
+    """Hilbert curve of 2**HILBERT_ORDER cells across the larger side
+       of the bounding box of the points."""
+    MAX_REVERSE = 1000
+    """Longest stretch of the path a 2-opt move reverses. Longer moves
+       are skipped: they are rare after the Hilbert seed and each costs
+       time in proportion to its length."""
+
+    def __init__(self,points,neighbours=8):
+        self.points = points
+        self.neighbours = neighbours
+        self.order = range(len(points))
+        """List of point indexes in drilling order."""
+
+    def length(self,order=None):
+        """Return the travel distance along order (default self.order)."""
+        if order is None:
+            order = self.order
+        points = self.points
+        total = 0.0
+        for i in range(1,len(order)):
+            x1,y1 = points[order[i-1]]
+            x2,y2 = points[order[i]]
+            total += math.hypot(x2-x1,y2-y1)
+        return total
+
+    @staticmethod
+    def hilbert_key(x,y,order):
+        """Return the distance along the Hilbert curve of a grid of
+           2**order by 2**order cells to the integer cell x,y."""
+        n = 1 << order
+        key = 0
+        s = n >> 1
+        while s:
+            rx = 1 if x & s else 0
+            ry = 1 if y & s else 0
+            key += s*s*((3*rx)^ry)
+            # rotate the quadrant so the sub-curve has the same orientation
+            if ry == 0:
+                if rx == 1:
+                    x = n-1-x
+                    y = n-1-y
+                x,y = y,x
+            s >>= 1
+        return key
+
+    def seed(self):
+        """Order the points along a Hilbert curve."""
+        points = self.points
+        if not points:
+            self.order = []
+            return self.order
+        minx = min(p[0] for p in points)
+        miny = min(p[1] for p in points)
+        span = max(max(p[0] for p in points) - minx,
+                   max(p[1] for p in points) - miny, 1)
+        order = self.HILBERT_ORDER
+        scale = ((1 << order) - 1)/float(span)
+        hilbert_key = self.hilbert_key
+        keys = [hilbert_key(int((x-minx)*scale),int((y-miny)*scale),order)
+                for x,y in points]
+        self.order = sorted(range(len(points)),key=keys.__getitem__)
+        return self.order
+
+    def nearest_points(self):
+        """Return, for each point, the list of up to self.neighbours
+           nearest points among those in the 3x3 cells around it, on a
+           SpatialGrid of about one point per cell."""
+        points = self.points
+        count = len(points)
+        minx = min(p[0] for p in points)
+        miny = min(p[1] for p in points)
+        area = max((max(p[0] for p in points) - minx)
+                   * (max(p[1] for p in points) - miny), 1)
+        grid = SpatialGrid(math.sqrt(area/float(count)))
+        for x,y in points:
+            grid.insert(x,y)
+        neighbours = self.neighbours
+        nearest = [None]*count
+        cells = grid.cells
+        for (cx,cy),members in cells.iteritems():
+            # the same candidates for every point of the cell
+            candidates = [(j,points[j][0],points[j][1])
+                          for nx in (cx-1,cx,cx+1)
+                          for ny in (cy-1,cy,cy+1)
+                          for j in cells.get((nx,ny),())]
+            for index in members:
+                x,y = points[index]
+                others = [((px-x)*(px-x) + (py-y)*(py-y),j)
+                          for j,px,py in candidates if j != index]
+                if len(others) > neighbours:
+                    others = heapq.nsmallest(neighbours,others)
+                nearest[index] = [j for d2,j in others]
+        return nearest
+
+    def improve(self,max_moves=None):
+        """Shorten self.order with 2-opt moves until none of the moves
+           tried shortens it, or after max_moves moves.
+           Points whose path edges did not change since they were last
+           tried are not tried again.
+           Returns the number of moves made."""
+        order = self.order
+        count = len(order)
+        if count < 3:
+            return 0
+        points = self.points
+        hypot = math.hypot
+        position = [0]*count
+        for i,p in enumerate(order):
+            position[p] = i
+        nearest = self.nearest_points()
+        max_reverse = self.MAX_REVERSE
+        queue = collections.deque(order)
+        queued = [True]*count
+        moves = 0
+        while queue:
+            a = queue.popleft()
+            queued[a] = False
+            ax,ay = points[a]
+            for c in nearest[a]:
+                i = position[a]
+                j = position[c]
+                cx,cy = points[c]
+                ac = hypot(cx-ax,cy-ay)
+                moved = False
+                # step 1: replace (a, next of a) and (c, next of c)
+                # by (a,c) and (next of a, next of c);
+                # step -1: the same with the previous points
+                for step in (1,-1):
+                    ia = i+step
+                    ic = j+step
+                    an = order[ia] if 0 <= ia < count else None
+                    cn = order[ic] if 0 <= ic < count else None
+                    if an == c or cn == a:
+                        continue
+                    gain = -ac
+                    if an is not None:
+                        bx,by = points[an]
+                        gain += hypot(bx-ax,by-ay)
+                    if cn is not None:
+                        dx,dy = points[cn]
+                        gain += hypot(dx-cx,dy-cy)
+                        if an is not None:
+                            gain -= hypot(dx-bx,dy-by)
+                    if gain <= 1e-9*ac:
+                        continue
+                    if step == 1:
+                        low,high = min(i,j)+1,max(i,j)
+                    else:
+                        low,high = min(i,j),max(i,j)-1
+                    if high - low >= max_reverse:
+                        continue
+                    order[low:high+1] = order[high:low-1 if low else None:-1]
+                    for k in range(low,high+1):
+                        position[order[k]] = k
+                    for p in (a,c,an,cn):
+                        if p is not None and not queued[p]:
+                            queued[p] = True
+                            queue.append(p)
+                    moves += 1
+                    moved = True
+                    break
+                if moved:
+                    break
+            if max_moves is not None and moves >= max_moves:
+                break
+        return moves
+
+
+class SnapshotTable(object):
+    """One table of a BoardSnapshot, stored by column.
+       Each numeric column is an array.array attribute named after the
+       column. Each list column (strings, stroke arrays) is a plain list
+       attribute. layers holds one integer layer bitmask per row (bit n set
+       when the row is on layer n). objects holds the source pcbnew object
+       of each row (or None) and is only used to mark results on the board.
+       The rows by layer are built from the bitmasks in one pass, the first
+       time they are needed, and kept until the next append()."""
+
+    def __init__(self,columns,lists=()):
+        self.columns = tuple(name for name,typecode in columns)
+        self.lists = tuple(lists)
+        self._arrays = []
+        for name,typecode in columns:
+            column = array.array(typecode)
+            setattr(self,name,column)
+            self._arrays.append(column)
+        self._lists = []
+        for name in lists:
+            column = []
+            setattr(self,name,column)
+            self._lists.append(column)
+        self.layers = []
+        self.objects = []
+        self._by_layer = None
+
+    def __len__(self):
+        return len(self.layers)
+
+    def column_array(self,name,dtype=float):
+        """Return the named numeric column as a numpy array of dtype,
+           read from the array.array buffer without a Python loop.
+           Requires numpy."""
+        column = getattr(self,name)
+        if not len(column):
+            return numpy.zeros(0,dtype=dtype)
+        return numpy.frombuffer(column,dtype=column.typecode).astype(dtype)
+
+    def append(self,values,lists=(),layers=0,object=None):
+        """Add one row and return its row number. values are in the order
+           of the numeric columns, lists in the order of the list columns."""
+        for column,value in itertools.izip(self._arrays,values):
+            column.append(value)
+        for column,value in itertools.izip(self._lists,lists):
+            column.append(value)
+        self.layers.append(layers)
+        self.objects.append(object)
+        self._by_layer = None
+        return len(self.layers)-1
+
+    @staticmethod
+    def layers_of(mask):
+        """Return the layer numbers of the bits set in mask, in order."""
+        layers = []
+        while mask:
+            bit = mask & -mask
+            layers.append(bit.bit_length()-1)
+            mask ^= bit
+        return layers
+
+    def by_layer(self):
+        """Return a dictionary of the list of rows on each layer number."""
+        if self._by_layer is None:
+            by_layer = {}
+            layers_by_mask = {}
+            for row,mask in enumerate(self.layers):
+                layers = layers_by_mask.get(mask)
+                if layers is None:
+                    layers = layers_by_mask[mask] = self.layers_of(mask)
+                for layer in layers:
+                    by_layer.setdefault(layer,[]).append(row)
+            self._by_layer = by_layer
+        return self._by_layer
+
+    def on_layer(self,layer):
+        """Return the list of rows that are on the given layer number."""
+        return list(self.by_layer().get(layer,()))
+
+    def group_by(self,names,rows=None):
+        """Returns a dictionary with key of the tuple of values of the
+           named columns, and value of the list of rows with those values."""
+        columns = [getattr(self,name) for name in names]
+        groups = {}
+        for row in (range(len(self)) if rows is None else rows):
+            groups.setdefault(
+                tuple(column[row] for column in columns),[]).append(row)
+        return groups
+
+    def select(self,row):
+        """Mark the source object of row with SetSelected(), if any."""
+        if self.objects[row] is not None:
+            self.objects[row].SetSelected()
+
+    def highlight(self,row):
+        """Mark the source object of row with SetHighlighted(), if any."""
+        if self.objects[row] is not None:
+            self.objects[row].SetHighlighted()
+
+
+class BoardSnapshot(object):
+    """Copy of the board data used by the checks, extracted once per run
+       into compact SnapshotTable columns (positions and sizes in internal
+       units, layer bitmasks, net ids, shape codes and orientations).
+       Checks read only the snapshot; the pcbnew objects kept in each
+       table's objects list are used for highlighting results only.
+       A snapshot is filled once and not modified afterwards."""
+
+    PAD_COLUMNS = (
+        ('x','l'),('y','l'),('w','l'),('h','l'),
+        ('drill_x','l'),('drill_y','l'),('offset_x','l'),('offset_y','l'),
+        ('shape','i'),('drill_shape','i'),('attribute','i'),
+        ('orientation','d'),('net','i'),('local_clearance','l'),('clearance','l'),
+        ('paste_margin_x','l'),('paste_margin_y','l'),
+        ('local_paste_margin','l'),
+        ('mask_margin','l'),('local_mask_margin','l'),
+        ('bbox_x','l'),('bbox_y','l'),('bbox_w','l'),('bbox_h','l'))
+    PAD_LISTS = ('reference','name','footprint')
+    VIA_COLUMNS = (
+        ('x','l'),('y','l'),('drill','l'),('drill_value','l'),
+        ('width','l'),('via_type','i'),('net','i'))
+    TRACK_COLUMNS = (
+        ('x1','l'),('y1','l'),('x2','l'),('y2','l'),('width','l'),('net','i'))
+    TEXT_COLUMNS = (
+        ('x','l'),('y','l'),
+        ('box_x','l'),('box_y','l'),('box_w','l'),('box_h','l'),
+        ('orientation','d'),('thickness','l'))
+    TEXT_LISTS = ('text','strokes')
+    """strokes are flat array.array('l') of x,y pairs, two points per
+       stroke segment, already rotated to board orientation."""
+    DRAWING_COLUMNS = (
+        ('x1','l'),('y1','l'),('x2','l'),('y2','l'),('width','l'),
+        ('shape','i'),('cx','l'),('cy','l'))
+    DRAWING_LISTS = ('shape_name',)
+    HOLE_COLUMNS = (
+        ('kind','i'),('x','l'),('y','l'),('size_x','l'),('size_y','l'),
+        ('orientation','d'),('net','i'),('row','l'),
+        ('top','i'),('bottom','i'))
+    """Columns of hole_table(). kind is HOLE_VIA, HOLE_PAD (plated) or
+       HOLE_NPTH; size_x, size_y and orientation are the drill of a pad,
+       a slot when they differ; row is the row in pads or vias; top and
+       bottom are the copper layer span (see copper_span)."""
+    HOLE_VIA, HOLE_PAD, HOLE_NPTH = range(3)
+    HOLE_KINDS = ('via','pad hole','NPTH hole')
+
+    def __init__(self,layernums=(),layer_names=None):
+        self.layernums = list(layernums)
+        """Layer numbers on this board, in reporting order."""
+        self.layer_names = dict(layer_names or {})
+        """Dictionary of layer name by layer number."""
+        self.netnames = []
+        """Net names indexed by the net id stored in the tables."""
+        self._net_ids = {}
+        self.pads = SnapshotTable(self.PAD_COLUMNS,self.PAD_LISTS)
+        self.vias = SnapshotTable(self.VIA_COLUMNS)
+        self.tracks = SnapshotTable(self.TRACK_COLUMNS)
+        self.texts = SnapshotTable(self.TEXT_COLUMNS,self.TEXT_LISTS)
+        self.drawings = SnapshotTable(self.DRAWING_COLUMNS,self.DRAWING_LISTS)
+        self._holes = None
+        self._copper_mask = None
+
+    def net_id(self,netname):
+        """Return the net id for netname, adding it if it is new."""
+        try:
+            return self._net_ids[netname]
+        except KeyError:
+            self._net_ids[netname] = len(self.netnames)
+            self.netnames.append(netname)
+            return self._net_ids[netname]
+
+    def layer_names_of(self,mask):
+        """Return the names of the layers in bitmask mask,
+           in self.layernums order."""
+        return [self.layer_names.get(layer,str(layer))
+                for layer in self.layernums if mask & (1 << layer)]
+
+    def copper_span(self,mask=0):
+        """Return the (top, bottom) copper layers of bitmask mask: its
+           first and last copper layer, or those of the board if it has no
+           copper layer. Layer numbers are in stack order (F.Cu 0, the
+           inner layers, then B.Cu 31), and a via is on every copper layer
+           between its two end layers."""
+        if self._copper_mask is None:
+            self._copper_mask = 0
+            for layer in self.layernums:
+                if pcbnew.IsCopperLayer(layer):
+                    self._copper_mask |= 1 << layer
+        mask = (mask & self._copper_mask) or self._copper_mask
+        if not mask:
+            return (pcbnew.F_Cu,pcbnew.B_Cu)
+        return ((mask & -mask).bit_length()-1,mask.bit_length()-1)
+
+    def hole_table(self):
+        """Return the SnapshotTable (HOLE_COLUMNS) of every drilled pad
+           and via, pad holes first. Each hole has the layers and the
+           object of its pad or via. A pad hole is at its drill offset,
+           turned with the pad. Pad holes span the whole board, vias
+           their own layers. Built on the first call."""
+        if self._holes is None:
+            holes = SnapshotTable(self.HOLE_COLUMNS)
+            board = self.copper_span()
+            pads = self.pads
+            for row in range(len(pads)):
+                if pads.drill_x[row] <= 0 or pads.drill_y[row] <= 0:
+                    continue
+                x = pads.x[row]
+                y = pads.y[row]
+                if pads.offset_x[row] or pads.offset_y[row]:
+                    # positive orientations turn counterclockwise, y down
+                    radians = math.radians(pads.orientation[row]/10.0)
+                    cos = math.cos(radians)
+                    sin = math.sin(radians)
+                    x += int(round(pads.offset_x[row]*cos
+                                   + pads.offset_y[row]*sin))
+                    y += int(round(pads.offset_y[row]*cos
+                                   - pads.offset_x[row]*sin))
+                holes.append(
+                    (self.HOLE_NPTH if pads.attribute[row]
+                         == pcbnew.PAD_ATTRIB_HOLE_NOT_PLATED
+                     else self.HOLE_PAD,
+                     x,y,
+                     pads.drill_x[row],pads.drill_y[row],
+                     pads.orientation[row],pads.net[row],row)+board,
+                    layers=pads.layers[row],object=pads.objects[row])
+            vias = self.vias
+            for row in range(len(vias)):
+                size = vias.drill_value[row]
+                if size <= 0:
+                    continue
+                holes.append(
+                    (self.HOLE_VIA,vias.x[row],vias.y[row],size,size,
+                     0.0,vias.net[row],row)
+                     + self.copper_span(vias.layers[row]),
+                    layers=vias.layers[row],object=vias.objects[row])
+            self._holes = holes
+        return self._holes
+
+
+class StrokeCache(object):
+    """Least recently used cache of text stroke arrays (flat
+       array.array('l') of x,y pairs, as in BoardSnapshot.texts.strokes)
+       by text geometry key (see KiPadCheck.get_text_key()).
+       When the cached arrays take more than max_bytes, the least recently
+       used are evicted. Cached arrays are shared between snapshots and
+       must not be modified."""
+
+    def __init__(self,max_bytes=16*1024*1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        """Size of the cached arrays."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self,key):
+        """Return the strokes cached for key, or None."""
+        try:
+            strokes = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # reinsert as the most recently used
+        self._entries[key] = strokes
+        self.hits += 1
+        return strokes
+
+    def put(self,key,strokes):
+        """Cache strokes for key, evicting least recently used entries
+           to stay within max_bytes. Arrays larger than max_bytes are
+           not cached."""
+        if key in self._entries:
+            old = self._entries.pop(key)
+            self.bytes -= old.itemsize*len(old)
+        size = strokes.itemsize*len(strokes)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = strokes
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            key, old = self._entries.popitem(last=False)
+            self.bytes -= old.itemsize*len(old)
+            self.evictions += 1
+
+    def summary(self):
+        """Return a one line description of the cache statistics."""
+        return ("Stroke cache: %d hits, %d misses, %d evictions; "
+                "%d texts, %.1f of %.1f KB"%(
+                    self.hits,self.misses,self.evictions,len(self),
+                    self.bytes/1024.0,self.max_bytes/1024.0))
+
+
+class PcbnewBackend(object):
+    """Board data source for the board open in pcbnew.
+       A new snapshot is extracted on every run, since the board may
+       have been edited in between."""
+
+    def __init__(self,kpc):
+        self.kpc = kpc
+
+    def snapshot(self):
+        if not self.kpc._layernums:
+            # headless: the dialog has not set the layers up
+            self.kpc.SetBoardLayers(pcbnew.GetBoard())
+        return self.kpc.GetBoardSnapshot()
+
+    def name(self):
+        """Return the file name of the board (may be empty)."""
+        return pcbnew.GetBoard().GetFileName()
+
+
+class PcbFileBackend(object):
+    """Board data source for a .kicad_pcb file, read with the kicad_pcb
+       streaming parser. Needs neither pcbnew nor wx. The file is read
+       once, on the first call to snapshot()."""
+
+    TABLES = ('pads','vias','tracks','texts','drawings')
+
+    def __init__(self,path,chunksize=65536):
+        self.path = path
+        self.chunksize = chunksize
+        self._snapshot = None
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = self.read(
+                kicad_pcb.read_board_file(self.path,self.chunksize))
+        return self._snapshot
+
+    def name(self):
+        """Return the file name of the board."""
+        return self.path
+
+    @staticmethod
+    def read(records):
+        """Return a BoardSnapshot filled from kicad_pcb records."""
+        snapshot = BoardSnapshot(range(pcbnew.PCB_LAYER_ID_COUNT),
+                                 dict(enumerate(kicad_pcb.LAYER_NAMES)))
+        layerbits = 0
+        for layer in snapshot.layernums:
+            layerbits |= 1 << layer
+        for kind,record in records:
+            if kind == 'board':
+                snapshot.layernums = record['layernums']
+                snapshot.layer_names = record['layer_names']
+                layerbits = 0
+                for layer in snapshot.layernums:
+                    layerbits |= 1 << layer
+                continue
+            table = getattr(snapshot,kind)
+            record['net'] = snapshot.net_id(record['net'])
+            if kind == 'texts':
+                record['strokes'] = array.array('l',record['strokes'])
+            mask = 0
+            for layer in record['layers']:
+                mask |= 1 << layer
+            table.append(
+                [record[name] for name in table.columns],
+                [record[name] for name in table.lists],
+                mask & layerbits)
+        return snapshot
+
+
+class ProgressReporter(object):
+    """Progress of a worker thread through weighted phases, published to
+       a queue as a value from 0 to RANGE (the range of the gauge).
+       phases is a list of (name, items, weight). The work of a phase is
+       its number of items times weight, the cost of one item, so the
+       value follows the actual work rather than the item counts.
+       The worker calls phase() at the start of each phase and advance()
+       as items are done. The count is kept here, and only changes of at
+       least STEP, or any change INTERVAL seconds after the last one,
+       are put in the queue."""
+
+    RANGE = 1000
+    STEP = 10
+    INTERVAL = 0.1
+
+    def __init__(self,queue,phases):
+        self.queue = queue
+        self.phases = {}
+        total = 0
+        for name,items,weight in phases:
+            # (work before the phase, items, weight)
+            self.phases[name] = (total,items,weight)
+            total += items*weight
+        self.total = float(total) or 1.0
+        self.before = 0
+        self.items = 0
+        self.weight = 0
+        self.count = 0
+        self.value = -1
+        self.time = 0.0
+
+    def phase(self,name):
+        """Start the named phase."""
+        self.before,self.items,self.weight = self.phases[name]
+        self.count = 0
+        self.advance(0)
+
+    def advance(self,count=1):
+        """Count count more items of the current phase done."""
+        self.count += count
+        value = int(self.RANGE*(self.before
+            + min(self.count,self.items)*self.weight)/self.total)
+        if value == self.value:
+            return
+        if value-self.value >= self.STEP or time.time()-self.time >= self.INTERVAL:
+            self.publish(value)
+
+    def publish(self,value):
+        self.value = value
+        self.time = time.time()
+        self.queue.put(value)
+
+    def finish(self):
+        """Publish the end of the last phase."""
+        self.publish(self.RANGE)
+
+
+class Profiler(object):
+    """Opt-in wall and CPU time and counters of the phases of the checks.
+       A check calls start(check), phase(name) at the start of each of
+       its phases, count(counter, n) as it goes and end() when done; a
+       phase ends when the next one starts, or at stop() (before another
+       thread carries on with the check).
+       SWIG calls are counted with a profile hook (sys.setprofile) on the
+       thread of the phase: each call from outside the pcbnew module into
+       it is one call. This slows the checks down, so the times are only
+       comparable between profiled runs.
+       CPU time includes finished child processes (the silk check pool).
+       If path is given, end() writes all runs so far to it as JSON."""
+
+    COUNTERS = ('pairs_examined','pairs_pruned','swig_calls','violations')
+
+    def __init__(self,path=None):
+        self.path = path
+        self.runs = []
+        self.run = None
+        self.current = None
+        # the functions of the real or stand-in pcbnew module, if any
+        self.module = None if pcbnew is kicad_pcb else pcbnew.__dict__
+
+    @staticmethod
+    def cpu_time():
+        t = os.times()
+        return t[0]+t[1]+t[2]+t[3]
+
+    def start(self,check):
+        """Start (or, in another thread, continue) a run of check."""
+        self.stop()
+        if self.run is None or self.run['check'] != check:
+            self.run = {'check':check,'phases':[]}
+            self.runs.append(self.run)
+
+    def phase(self,name):
+        """End the current phase and start the named one."""
+        self.stop()
+        if self.run is None:
+            self.start('')
+        self.current = dict(((counter,0) for counter in self.COUNTERS),
+            phase=name,wall=time.time(),cpu=self.cpu_time())
+        if self.module is not None:
+            sys.setprofile(self.hook)
+
+    def count(self,counter,count=1):
+        if self.current is not None:
+            self.current[counter] += count
+
+    def hook(self,frame,event,arg):
+        if event == 'call':
+            if frame.f_globals is not self.module:
+                return
+            caller = frame.f_back
+        elif event == 'c_call':
+            if getattr(arg,'__module__',None) not in ('pcbnew','_pcbnew'):
+                return
+            caller = frame
+        else:
+            return
+        if caller is None or caller.f_globals is not self.module:
+            self.current['swig_calls'] += 1
+
+    def stop(self):
+        """End the current phase, if any."""
+        if self.current is None:
+            return
+        if self.module is not None:
+            sys.setprofile(None)
+        current = self.current
+        current['wall'] = time.time() - current['wall']
+        current['cpu'] = self.cpu_time() - current['cpu']
+        self.run['phases'].append(current)
+        self.current = None
+
+    def end(self):
+        """End the run, write the JSON file, if any, and return the
+           summary table of the run."""
+        self.stop()
+        run = self.run
+        self.run = None
+        if self.path is not None:
+            with open(self.path,"w") as f:
+                json.dump(self.as_dict(),f,indent=1,sort_keys=True)
+                f.write("\n")
+        return self.summary(run)
+
+    def as_dict(self):
+        return {'runs':self.runs}
+
+    def summary(self,run):
+        """Return the table of the phases of run as text."""
+        lines = ["\n***** Profile: %s *****\n"%run['check'],
+                 "%-18s %9s %9s %10s %10s %10s %10s\n"%(
+                     "phase","wall (s)","cpu (s)","examined","pruned",
+                     "swig calls","violations")]
+        total = dict((key,0) for key in ('wall','cpu')+self.COUNTERS)
+        for phase in run['phases']:
+            for key in total:
+                total[key] += phase[key]
+        total['phase'] = "total"
+        for phase in run['phases']+[total]:
+            lines.append("%-18s %9.3f %9.3f %10d %10d %10d %10d\n"%(
+                phase['phase'],phase['wall'],phase['cpu'],
+                phase['pairs_examined'],phase['pairs_pruned'],
+                phase['swig_calls'],phase['violations']))
+        return "".join(lines)
+
+
+class ExcellonFile(object):
+    """Excellon drill files: write() streams the holes of each tool to a
+       file, read() loads the tools and hits of a file (e.g. the one
+       returned by the fab) and match() pairs hits with board holes.
+       Positions are internal units with the board's y axis (down);
+       files have the y axis up, as pcbnew writes them.
+       Slots are written and read as drilled slots: X..Y..G85X..Y..
+       from the center of one round end to the other.
+       read() handles INCH and METRIC, LZ and TZ, decimal points, tools
+       defined in the header or the body and M71/M72. It does not handle
+       incremental positions (G91), repeats or routed (G00/G01) paths."""
+
+    CHUNK = 4096
+    """Number of lines written with each stream.write()."""
+    _tool_pattern = re.compile(r'T(\d+)(?:[FSB][\d.]+)*C([\d.]+)')
+    _coordinate_pattern = re.compile(r'([XY])([-+]?[\d.]+)')
+    _hit_pattern = re.compile(r'X([-+]?\d*\.\d*)Y([-+]?\d*\.\d*)$')
+
+    @staticmethod
+    def write(stream,tools,comments=()):
+        """Write the metric Excellon file of tools, a list of (diameter,
+           list of (x, y, slot) in drilling order), as tools T1, T2...
+           slot is None for a hit at x, y, or the (x1, y1, x2, y2) ends
+           of a slot."""
+        scale = 1.0/pcbnew.IU_PER_MM
+        lines = ["M48\n"]
+        lines.extend("; %s\n"%comment for comment in comments)
+        lines.append("FMAT,2\nMETRIC,TZ\n")
+        for tindex,(diameter,holes) in enumerate(tools):
+            lines.append("T%dC%.3f\n"%(tindex+1,diameter*scale))
+        lines.append("%\nG90\nG05\n")
+        for tindex,(diameter,holes) in enumerate(tools):
+            lines.append("T%d\n"%(tindex+1))
+            for x,y,slot in holes:
+                if slot is None:
+                    lines.append("X%.3fY%.3f\n"%(x*scale,-y*scale))
+                else:
+                    x1,y1,x2,y2 = slot
+                    lines.append("X%.3fY%.3fG85X%.3fY%.3f\n"%(
+                        x1*scale,-y1*scale,x2*scale,-y2*scale))
+                if len(lines) >= ExcellonFile.CHUNK:
+                    stream.write("".join(lines))
+                    del lines[:]
+        lines.append("T0\nM30\n")
+        stream.write("".join(lines))
+
+    @staticmethod
+    def read(stream):
+        """Return (tools, hits) of the Excellon file stream: tools is a
+           dictionary of tool number to diameter and hits is a list of
+           (tool number, x, y, slot). slot is None for a hit, or the
+           (x1, y1, x2, y2) ends of a slot, whose hit x, y is its center."""
+        units = pcbnew.IU_PER_MILS*1000
+        # digits before and after the decimal point of numbers without one
+        integers,decimals = 2,4
+        leading_zeros = False
+        tools = {}
+        hits = []
+        tool = 0
+        x = y = 0.0
+        tool_pattern = ExcellonFile._tool_pattern
+        coordinate_pattern = ExcellonFile._coordinate_pattern
+        hit_pattern = ExcellonFile._hit_pattern
+        for line in stream:
+            line = line.strip()
+            if not line or line[0] == ';':
+                continue
+            if line[0] == 'X':
+                # the usual hit, both coordinates with decimal points
+                match = hit_pattern.match(line)
+                if match:
+                    x = float(match.group(1))*units
+                    y = -float(match.group(2))*units
+                    hits.append((tool,x,y,None))
+                    continue
+            if line.startswith(('METRIC','INCH')) or line in ('M71','M72'):
+                metric = line.startswith('METRIC') or line == 'M71'
+                units = pcbnew.IU_PER_MM if metric \
+                    else pcbnew.IU_PER_MILS*1000
+                integers,decimals = (3,3) if metric else (2,4)
+                fields = line.split(',')
+                if 'LZ' in fields:
+                    leading_zeros = True
+                elif 'TZ' in fields:
+                    leading_zeros = False
+                for field in fields[1:]:
+                    # number format, e.g. 000.000
+                    if '.' in field and field.strip('0.') == '':
+                        integers,decimals = map(len,field.split('.'))
+                continue
+            if line[0] == 'T':
+                match = tool_pattern.match(line)
+                if match:
+                    tools[int(match.group(1))] = float(match.group(2))*units
+                    continue
+                digits_end = 1
+                while digits_end < len(line) and line[digits_end].isdigit():
+                    digits_end += 1
+                tool = int(line[1:digits_end] or 0)
+                line = line[digits_end:]
+            if line[:1] not in ('X','Y'):
+                continue
+            # a slot is X..Y..G85X..Y.., each end keeping the coordinate
+            # it leaves out from the one before
+            ends = []
+            for part in line.split('G85')[:2]:
+                for axis,value in coordinate_pattern.findall(part):
+                    if '.' in value:
+                        value = float(value)
+                    else:
+                        sign = -1 if value[0] == '-' else 1
+                        value = value.lstrip('+-')
+                        if leading_zeros:
+                            # trailing zeros dropped: pad to the full format
+                            value = value.ljust(integers+decimals,'0')
+                        value = sign*int(value)/10.0**decimals
+                    if axis == 'X':
+                        x = value*units
+                    else:
+                        y = -value*units
+                ends.append((x,y))
+            if len(ends) == 1:
+                hits.append((tool,x,y,None))
+            else:
+                (x1,y1),(x2,y2) = ends
+                hits.append((tool,(x1+x2)/2.0,(y1+y2)/2.0,(x1,y1,x2,y2)))
+        return tools,hits
+
+    @staticmethod
+    def match(holes,hits,tolerance):
+        """Pair hits with holes, both lists of (x, y): a hit matches the
+           first unmatched hole within tolerance of it, found in a hashed
+           grid of the holes.
+           Returns (list of (hole index, hit index), hole indexes without
+           a hit, hit indexes without a hole)."""
+        # cells of 2*tolerance, keyed by the floored cell coordinates
+        cellsize = float(max(2*tolerance,1))
+        cells = {}
+        for index,(x,y) in enumerate(holes):
+            key = (x//cellsize,y//cellsize)
+            members = cells.get(key)
+            if members is None:
+                cells[key] = [index]
+            else:
+                members.append(index)
+        get = cells.get
+        matched = [False]*len(holes)
+        tolerance2 = float(tolerance)*tolerance
+        around = [(dx,dy) for dx in (-1,0,1) for dy in (-1,0,1) if dx or dy]
+        pairs = []
+        extra = []
+        hindex = -1
+        for hx,hy in hits:
+            hindex += 1
+            cx = hx//cellsize
+            cy = hy//cellsize
+            # most hits are in the cell of their hole: look there first
+            for index in get((cx,cy),()):
+                if not matched[index]:
+                    x,y = holes[index]
+                    if (x-hx)*(x-hx) + (y-hy)*(y-hy) <= tolerance2:
+                        break
+            else:
+                index = None
+                for ox,oy in around:
+                    for index in get((cx+ox,cy+oy),()):
+                        if not matched[index]:
+                            x,y = holes[index]
+                            if (x-hx)*(x-hx) + (y-hy)*(y-hy) <= tolerance2:
+                                break
+                    else:
+                        index = None
+                        continue
+                    break
+                if index is None:
+                    extra.append(hindex)
+                    continue
+            matched[index] = True
+            pairs.append((index,hindex))
+        missing = [index for index,done in enumerate(matched) if not done]
+        return pairs,missing,extra
+
+
+class Checkpoint(object):
+    """Results of the finished tasks of a long check, appended to a file
+       as each task finishes so that a cancelled or crashed run can
+       resume with the tasks that are left. The file holds JSON lines:
+       the key, then one [task, result] per finished task, so results
+       come back with lists in place of tuples. Nothing read from the
+       file is executed. The saved results are only used when key (e.g.
+       a hash of the tasks) is unchanged; a line cut short by a crash
+       ends them."""
+
+    def __init__(self,path,key):
+        self.path = path
+        self.key = key
+        self.results = {}
+        self._file = None
+        try:
+            with open(path,"rb") as f:
+                if json.loads(f.readline()) == key:
+                    for line in f:
+                        task,result = json.loads(line)
+                        self.results[task] = result
+        except (EnvironmentError,ValueError,TypeError):
+            # missing, unreadable, cut short or from an older version:
+            # keep what was read
+            pass
+
+    def add(self,task,result):
+        """Record the result of task (an index) and append it to the
+           file. The first call writes the file anew with the key and
+           the results kept from the last run."""
+        self.results[task] = result
+        if self._file is None:
+            temp = self.path + ".tmp"
+            with open(temp,"wb") as f:
+                f.write(json.dumps(self.key)+"\n")
+                for kept,value in self.results.iteritems():
+                    if kept != task:
+                        f.write(json.dumps([kept,value])+"\n")
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(temp,self.path)
+            self._file = open(self.path,"ab")
+        self._file.write(json.dumps([task,result])+"\n")
+        self._file.flush()
+
+    def close(self):
+        """Close the file, keeping it for the next run."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Delete the file once the check is complete."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def user_directory():
+        """Return the current user's checkpoint directory in the temp
+           directory, created readable by that user only. Raises OSError
+           if it is not a directory of that user, or others can use it:
+           files planted there are not to be trusted."""
+        directory = os.path.join(tempfile.gettempdir(),
+            "kipadcheck-%s"%getpass.getuser())
+        try:
+            os.mkdir(directory,0o700)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        if hasattr(os,'getuid'):
+            status = os.lstat(directory)
+            if not stat.S_ISDIR(status.st_mode) \
+               or status.st_uid != os.getuid() \
+               or stat.S_IMODE(status.st_mode) & 0o077:
+                raise OSError("%s is not a private directory"%directory)
+        return directory
+
+    @staticmethod
+    def for_board(directory,board,check,tasks):
+        """Return the Checkpoint of check on board (a file name) in
+           directory, keyed by a hash of tasks."""
+        name = hashlib.sha1(os.path.abspath(board or "untitled")).hexdigest()
+        return Checkpoint(
+            os.path.join(directory,"kipadcheck-%s-%s.ckpt"%(check,name[:16])),
+            hashlib.sha1(pickle.dumps(tasks,2)).hexdigest())
+
+
+class ConsoleStream(object):
+    """Console for headless runs: the AppendText() calls of the checks
+       are written to stream."""
+
+    def __init__(self,stream=None):
+        self.stream = stream or sys.stdout
+
+    def AppendText(self,text):
+        if isinstance(text,unicode):
+            text = text.encode('utf-8')
+        self.stream.write(text)
+
             
     # ds = board.GetDesignSettings() 
     # ugly. exposes a public member not via an accessor method
@@ -573,7 +2098,8 @@ class KiPadCheck( pcbnew.ActionPlugin ):
 
     # This allows stopping the thread from outside the thread.
     _progress_stop = False
-    """Allows stopping the progress thread from outside the thread."""
+    """Set (by the Cancel button) to stop the worker thread at its next
+       check of cancelled()."""
     
     # These provide communication from inside the thread to the main GUI thread:
     _progress_value_queue = Queue.Queue()
@@ -590,24 +2116,101 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         self.description = "Check pads, holes, stencil apertures, and silkscreen"
 
 
-    def ProgressThreadFunction(self,WorkerThread):
-        value = self._progress.GetValue()
-        while(WorkerThread.is_alive()):
-        
-            # take stuff from queue here
-            # take all you can, then call UpdateProgress
-            while (not self._progress_value_queue.empty()):
-                value = self._progress_value_queue.get()
-            self.UpdateProgress(value)
-            while (not self._console_text_queue.empty()):
-                self._consoleText.AppendText(self._console_text_queue.get())
-            time.sleep(0.25)
-        # process any remaining from the queues.
-        while (not self._progress_value_queue.empty()):
-            value = self._progress_value_queue.get()
-        self.UpdateProgress(value)
-        while (not self._console_text_queue.empty()):
-            self._consoleText.AppendText(self._console_text_queue.get())
+    PROGRESS_UPDATES_PER_SECOND = 10
+    """Most times per second the worker queues are moved to the GUI."""
+    _progress_timer = None
+    """wx.Timer that runs PumpQueues() while self.WorkerThread is alive."""
+
+    def StartWorker(self,target):
+        """Run target in self.WorkerThread and return at once. The queues
+           it fills are moved to the GUI by a wx.Timer (OnProgressTimer),
+           so pcbnew stays responsive while the worker runs."""
+        # a new worker, so clear the Cancel of the last one
+        self._progress_stop = False
+        self.WorkerThread = threading.Thread(
+            target=target, 
+            name="WT", 
+            args=(), 
+            kwargs={})#, daemon=False)#, *, daemon=None)
+        self.WorkerThread.start()
+        if self._progress_timer is None:
+            self._progress_timer = wx.Timer(self._frame)
+            self._frame.Bind(wx.EVT_TIMER,self.OnProgressTimer,
+                             self._progress_timer)
+        self._progress_timer.Start(1000//self.PROGRESS_UPDATES_PER_SECOND)
+
+    def PumpQueues(self):
+        """Move everything queued by the worker to the GUI: only the last
+           progress value is shown, and the console text is appended as
+           one chunk."""
+        value = None
+        while True:
+            try:
+                value = self._progress_value_queue.get_nowait()
+            except Queue.Empty:
+                break
+        if value is not None and value != self._progress.GetValue():
+            self._progress.SetValue(value)
+        text = []
+        while True:
+            try:
+                text.append(self._console_text_queue.get_nowait())
+            except Queue.Empty:
+                break
+        if text:
+            self._consoleText.AppendText("".join(text))
+
+    def CancelWorker(self,e):
+        """Ask a running worker thread to stop (see cancelled())."""
+        if self.WorkerThread is not None and self.WorkerThread.is_alive():
+            self._progress_stop = True
+            self._consoleText.AppendText("Cancelling...\n")
+
+    def cancelled(self):
+        """Return True when the worker thread should stop, which the
+           workers check between chunks of work. A cancelled SilkInfo
+           resumes from its checkpoint on the next run."""
+        if self._progress_stop:
+            self._console_text_queue.put("\n  ***** CANCELLED *****\n")
+            return True
+        return False
+
+    def profile_start(self,check):
+        """Start (or continue, in the worker thread) profiling check."""
+        if self._profiler is not None:
+            self._profiler.start(check)
+
+    def profile(self,phase):
+        """Start the named phase of the profiled check."""
+        if self._profiler is not None:
+            self._profiler.phase(phase)
+
+    def profile_count(self,counter,count=1):
+        """Add count to a Profiler counter of the current phase."""
+        if self._profiler is not None:
+            self._profiler.count(counter,count)
+
+    def profile_stop(self):
+        """End the current phase, before a worker thread continues."""
+        if self._profiler is not None:
+            self._profiler.stop()
+
+    def profile_end(self):
+        """End profiling the check. Returns its summary table, or an empty
+           string when not profiling."""
+        if self._profiler is None:
+            return ""
+        return self._profiler.end()
+
+    def OnProgressTimer(self,e):
+        """Timer event: update the GUI from the worker queues, and stop
+           and reset the progress bar once the worker is done."""
+        self.PumpQueues()
+        if self.WorkerThread is None or not self.WorkerThread.is_alive():
+            self._progress_timer.Stop()
+            # process any remaining from the queues.
+            self.PumpQueues()
+            self._progress.SetValue(0)
 
     # def GraphThreadFunction():
         # while(not GraphStop):
@@ -1265,8 +2868,8 @@ class KiPadCheck( pcbnew.ActionPlugin ):
     (25.0,"25.0")])
 
     _StandardDrillInfo.append(
-        ("Reduced set PCB drill sizes",
-        pcbnew.IU_PER_MM,
+        ("Reduced set PCB drill sizes (inches)",
+        pcbnew.IU_PER_MILS*1000,
         ("https://electronics.stackexchange.com/"
         "questions/85292/"
         "what-pad-hole-drill-size-is-appropriate-for-a-given-"
@@ -1288,6 +2891,13 @@ class KiPadCheck( pcbnew.ActionPlugin ):
     (.125,"1/8in")
     ])
 
+    _StandardDrillIU = map(
+        lambda info,drills: array.array('d',[size*info[1]
+                                             for size,name in drills]),
+        _StandardDrillInfo,_StandardDrill)
+    """The sizes of each _StandardDrill set in internal units (nm), in
+       the same (ascending) order, for get_standard_drills()."""
+
     # https://en.wikipedia.org/wiki/Solder_paste#By_size
     # IPC J-STD 005 80% minimum between
     PowderSizeRangeByType_um = {
@@ -1363,6 +2973,52 @@ class KiPadCheck( pcbnew.ActionPlugin ):
        that don't exist as indicated by GetBoard().GetCopperLayerCount()"""
     _layer_num_by_name = {}
     """Dicationary of layer numbers indicated by the given name."""
+    _stroke_cache = None
+    """StrokeCache of the text strokes read from pcbnew, kept across runs."""
+    _stroke_cache_bytes = 16*1024*1024
+    """Memory cap of _stroke_cache."""
+    _checkpoint_dir = None
+    """Directory of the SilkInfo checkpoints (see Checkpoint), None to
+       not keep checkpoints. The dialog sets Checkpoint.user_directory();
+       headless runs only keep checkpoints when asked (main() --resume)."""
+    PROGRESS_WEIGHTS = {
+        'hole sizes':1, 'hole separation':4, 'annular ring':1, 'drill sizes':1,
+        'drill path':4, 'via list':1, 'via distance':2, 'via track':4,
+        'silk setup':1, 'silk compare':10}
+    """Relative cost of one item of each worker phase, for the
+       ProgressReporter of DrillInfo_Worker and SilkInfo_Worker."""
+    DRILL_MACHINE = {'rapid':400.0, 'hit':0.2, 'tool change':10.0}
+    """Drill machine of the drilling time estimate: rapid traverse speed
+       (mm/s), time of one hit (s) and time of one tool change (s)."""
+    ANNULAR_RING_BINS = (0.0, 0.05, 0.1, 0.125, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5)
+    """(mm) Edges of the annular ring histogram of DrillInfo."""
+    ANNULAR_RING_WORST = 20
+    """Number of the thinnest annular rings listed by DrillInfo."""
+    EXCELLON_TOLERANCE = 0.01
+    """(mm) Largest distance from an Excellon hit to its board hole in
+       CheckExcellon()."""
+    CANCEL_CHUNK = 1024
+    """Number of items the workers check between calls to cancelled()."""
+    SILK_TILES = 4
+    """Least number of tiles across each side in SilkInfo, which is
+       also how finely a run can be cancelled and resumed."""
+    _backend = None
+    """Board data source (PcbnewBackend or PcbFileBackend),
+       PcbnewBackend when not set."""
+    _layer_set_hex = None
+    """Whether get_layer_mask() can read LSET.FmtHex() (None: not known
+       yet). Set on the instance, on its first call."""
+    _layer_buckets = None
+    """Objects by layer of the current run, by name (see
+       get_layer_buckets), None when not in a run."""
+    _profiler = None
+    """Profiler of the phases of PadInfo, DrillInfo, StencilInfo and
+       SilkInfo, None to not profile. In the scripting console:
+       kpc._profiler = kipadcheck.Profiler('profile.json')"""
+    _parameters = {'vv':12.0,'vt':12.0,'sp':0.0,'ot':0.0,'sc':False,'sw':1,
+                   'dt':0.1,'ar':5.0}
+    """Check parameters by dialog control name, used when there is no
+       dialog. Same defaults as the dialog."""
     # _board = None
     # """The current board loaded into KiCad (shortcut for pcbnew.GetBoard())"""        
 
@@ -1402,6 +3058,13 @@ class KiPadCheck( pcbnew.ActionPlugin ):
            functions."""
         board = pcbnew.GetBoard()
         self._consoleText.AppendText("Starting MenuItemPadInfo()...\n")
+        if self._checkpoint_dir is None:
+            # interactive runs resume a cancelled SilkInfo
+            try:
+                self._checkpoint_dir = Checkpoint.user_directory()
+            except OSError as error:
+                self._consoleText.AppendText(
+                    "SilkInfo checkpoints are off: %s\n"%error)
 
         windowName = 'KiPadCheck'
 
@@ -1435,6 +3098,8 @@ class KiPadCheck( pcbnew.ActionPlugin ):
             
             sizerbottom.Add(self.CreateLabeledEntry(panelbottom,"(mil) Via to Via spacing","vv",12.0))
             sizerbottom.Add(self.CreateLabeledEntry(panelbottom,"(mil) Via to Track spacing","vt",12.0))
+            sizerbottom.Add(self.CreateLabeledEntry(panelbottom,"(mm) Drill Oversize Tolerance","dt",0.1))
+            sizerbottom.Add(self.CreateLabeledEntry(panelbottom,"(mil) Minimum Annular Ring","ar",5.0))
             sp = self.CreateLabeledEntry(panelbottom,"(mm) Silk to Pad spacing","sp",0.0)
             #sp.Disable()
             sizerbottom.Add(sp)
@@ -1467,11 +3132,24 @@ class KiPadCheck( pcbnew.ActionPlugin ):
             sizertop.Add(b_drillinfo)
             sizertop.Add(b_stencilinfo)
             sizertop.Add(b_silkinfo)
+            b_cancel = wx.Button(paneltop, label="Cancel")
+            b_cancel.Bind(wx.EVT_BUTTON, self.CancelWorker)
+            sizertop.Add(b_cancel)
             panelbottom.Hide()
             panelbottom.Show()
             panelbottom.Update()
             panelbottom.Refresh()
 
+        self.SetBoardLayers(board)
+        self._consoleText.AppendText("Finished MenuItemPadInfo()\n")
+        self._frame.Show(True)
+        self._frame.Update()
+        self._frame.Refresh()
+        wx.Yield()
+        
+    def SetBoardLayers(self,board):
+        """Set self._layernums (F.Cu, B.Cu, inner copper, then the non
+           copper layers) and self._layer_num_by_name for board."""
         #self._layernums = [num for num in range(self.LAYERCOUNT) if not board.GetLayerName(num).startswith("In")]
         copperLayers = filter(
             (lambda x: pcbnew.IsCopperLayer(x)),
@@ -1479,8 +3157,6 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         nonCopperLayers = filter(
             (lambda x: pcbnew.IsNonCopperLayer(x)),
             range(self.LAYERCOUNT))
-        self._layernums = copperLayers[0:board.GetCopperLayerCount()] \
-            + nonCopperLayers
         #self._layernums = copperLayers + nonCopperLayers
         self._layernums = [copperLayers[0]] \
             + [copperLayers[-1]] \
@@ -1490,26 +3166,21 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         self._layer_num_by_name = {}
         for num in range(self.LAYERCOUNT):
             self._layer_num_by_name[board.GetLayerName(num)] = num
-        self._consoleText.AppendText("Finished MenuItemPadInfo()\n")
-        self._frame.Show(True)
-        self._frame.Update()
-        self._frame.Refresh()
-        wx.Yield()
-        
+
     #	PadLayerNames, PadLayers = GetPadLayerNameNum()
     def get_vias(self):
         """Get vias by filtering from _board.GetTracks()."""
         return filter((lambda x: x.Cast_to_VIA()), pcbnew.GetBoard().GetTracks())
-        
+
     def GetViaLayerNameNum(self,vias=None):
         """Get the layer numbers that each via is on.
            Return as a list in the same order as vias
            (or get_vias(), if vias is not supplied)"""
         return map(
             lambda v: tuple(layer for layer in range(self.LAYERCOUNT) \
-            if layer in _layernums \
+            if layer in self._layernums \
             #not board.GetLayerName(layer).startswith("In") \
-                and v.IsOnLayer(layer)), vias or get_vias())
+                and v.IsOnLayer(layer)), vias or self.get_vias())
 
     def GetPads(self):
         """Get all the pads in a list ordered by pad number."""
@@ -1527,40 +3198,272 @@ class KiPadCheck( pcbnew.ActionPlugin ):
 
 
     def get_holes_by_layer(self):
-        """Get all the pads in a list ordered by pad number."""
-        board = pcbnew.GetBoard()
-        holes = [board.GetPad(n) for n in range(board.GetPadCount()) if board.GetPad(n).GetDrillSize().x != 0 and board.GetPad(n).GetDrillSize().y != 0]
-        holes.extend(self.get_vias())
-        
-        holes_by_layer = {}
-        for layernum in self._layernums:
-            hs = filter ( lambda x: x.IsOnLayer(layernum), holes )
-            if len(hs):
-                holes_by_layer[layernum] = hs 
-        return holes_by_layer
+        """Returns a dictionary with layer number as key, and a list of
+           the drilled pads (ordered by pad number) and vias."""
+        def get_holes():
+            holes = []
+            for pad in self.GetPads():
+                drill = pad.GetDrillSize()
+                if drill.x != 0 and drill.y != 0:
+                    holes.append(pad)
+            holes.extend(self.get_vias())
+            return holes
+        return self.get_layer_buckets('drilled holes',get_holes)
+
+    def get_standard_drills(self,sizes):
+        """Return, for each _StandardDrill set, the list of the indexes in
+           that set of the closest larger (or equal) standard drill of each
+           of sizes (internal units), None where a size is larger than all
+           the drills of the set. One numpy.searchsorted() call per set,
+           or bisect without numpy."""
+        lookups = []
+        for drills in self._StandardDrillIU:
+            if numpy is not None and len(sizes):
+                indexes = numpy.searchsorted(
+                    numpy.asarray(drills),sizes).tolist()
+            else:
+                indexes = [bisect.bisect_left(drills,size) for size in sizes]
+            lookups.append([None if index >= len(drills) else index
+                            for index in indexes])
+        return lookups
+
+    def get_drill_tools(self,counts,tolerance,dset=None):
+        """Consolidate hole sizes to the fewest standard drills of drill
+           set dset (default self._DrillSet). counts is a dictionary of
+           the number of holes by size (internal units). A hole of size s
+           can be drilled with drill d when s <= d <= s + tolerance.
+           Returns (tools, unmatched): tools is a list of (drill index in
+           the set, list of sizes), in drill order, and unmatched is the
+           sorted list of sizes without a drill within tolerance.
+           The drills that fit each size are a range of the sorted set,
+           and both ends of the range grow with the size, so a drill can
+           serve any run of consecutive sizes whose ranges overlap. DP over
+           the sorted sizes: best[j] is the fewest tools, then the least
+           total oversize, for the first j sizes, the last run drilled
+           with the smallest drill that fits its largest size."""
+        if dset is None:
+            dset = self._DrillSet
+        drills = self._StandardDrillIU[dset]
+        # (size, first and last drill index that fit)
+        fits = []
+        unmatched = []
+        for size in sorted(counts):
+            first = bisect.bisect_left(drills,size)
+            last = bisect.bisect_right(drills,size+tolerance)-1
+            if first <= last:
+                fits.append((size,first,last))
+            else:
+                unmatched.append(size)
+
+        best = [(0,0.0)] + [None]*len(fits)
+        start = [0]*(len(fits)+1)
+        for j in range(1,len(fits)+1):
+            drill = drills[fits[j-1][1]]
+            oversize = 0.0
+            for i in range(j,0,-1):
+                size,first,last = fits[i-1]
+                if last < fits[j-1][1]:
+                    # and so do all smaller sizes
+                    break
+                oversize += counts[size]*(drill-size)
+                cost = (best[i-1][0]+1,best[i-1][1]+oversize)
+                if best[j] is None or cost < best[j]:
+                    best[j] = cost
+                    start[j] = i
+        tools = []
+        j = len(fits)
+        while j > 0:
+            i = start[j]
+            tools.append((fits[j-1][1],[fits[k][0] for k in range(i-1,j)]))
+            j = i-1
+        tools.reverse()
+        return tools,unmatched
+
+    def get_drill_holes(self):
+        """Return the list of (x, y, size, slot) of every drilled pad and
+           via of the snapshot (see BoardSnapshot.hole_table), pad holes
+           first. Holes are drilled by their width (the smaller drill
+           size). slot is None for a round hole; for a slot it is the
+           (x1, y1, x2, y2) centers of its round ends, routed between with
+           the drill."""
+        holes = self._snapshot.hole_table()
+        drilled = []
+        for row,(x1,y1,x2,y2,radius) in enumerate(
+                self.get_hole_capsules(holes)):
+            size_x = holes.size_x[row]
+            size_y = holes.size_y[row]
+            drilled.append((holes.x[row],holes.y[row],min(size_x,size_y),
+                            None if size_x == size_y else (x1,y1,x2,y2)))
+        return drilled
+
+    def get_tool_holes(self,holes,tools,unmatched,dset=None):
+        """Return the list of (drill size, list of hole (x, y, slot)) of
+           each tool of get_drill_tools(tools, unmatched), in tool order,
+           then one tool of each unmatched size. holes is
+           get_drill_holes()."""
+        if dset is None:
+            dset = self._DrillSet
+        drills = self._StandardDrillIU[dset]
+        tool_of = {}
+        for tindex,(dindex,sizes) in enumerate(tools):
+            for size in sizes:
+                tool_of[size] = tindex
+        for uindex,size in enumerate(unmatched):
+            tool_of[size] = len(tools)+uindex
+        toolholes = [[] for t in range(len(tools)+len(unmatched))]
+        for x,y,size,slot in holes:
+            toolholes[tool_of[size]].append((x,y,slot))
+        return zip([drills[dindex] for dindex,sizes in tools]+list(unmatched),
+                   toolholes)
+
+    def get_hole_capsules(self,holes):
+        """Return the capsule (x1, y1, x2, y2, radius) of each row of
+           the hole table holes (see BoardSnapshot.hole_table): the
+           segment between the centers of the round ends of a slot, and
+           half its width. Round holes are a point and their radius."""
+        capsules = []
+        for row in range(len(holes)):
+            x = holes.x[row]
+            y = holes.y[row]
+            size_x = holes.size_x[row]
+            size_y = holes.size_y[row]
+            if size_x == size_y:
+                capsules.append((x,y,x,y,size_x/2.0))
+                continue
+            angle = holes.orientation[row]/10.0
+            if size_y > size_x:
+                angle += 90.0
+            half = abs(size_x-size_y)/2.0
+            # positive orientations turn counterclockwise, y axis down
+            dx = half*math.cos(math.radians(angle))
+            dy = -half*math.sin(math.radians(angle))
+            capsules.append((x-dx,y-dy,x+dx,y+dy,min(size_x,size_y)/2.0))
+        return capsules
+
+    def get_hole_name(self,holes,row):
+        """Return a short description of row of the hole table holes:
+           the kind of hole and its pad (reference.name) or via number."""
+        snapshot = self._snapshot
+        kind = holes.kind[row]
+        if kind == snapshot.HOLE_VIA:
+            return "via %d"%holes.row[row]
+        pads = snapshot.pads
+        return "%s %s.%s"%(snapshot.HOLE_KINDS[kind],
+            pads.reference[holes.row[row]],pads.name[holes.row[row]])
+
+    def get_close_hole_pairs(self,holes,clearance):
+        """Return a sorted list of (i, j, distance) of the rows i<j of the
+           hole table holes whose drill edges are no more than clearance
+           apart. Slots are capsules. Only holes that drill through a
+           common dielectric layer are compared: their copper spans are
+           the same or overlap by more than one layer, so stacked
+           microvias (F.Cu-In1.Cu and In1.Cu-In2.Cu) do not fail.
+           Only holes in neighbouring cells of a SpatialGrid are compared.
+           The cell size is the longest drill plus clearance, which bounds
+           the center distance of any failing pair."""
+        capsules = self.get_hole_capsules(holes)
+        longest = max([max(size_x,size_y) for size_x,size_y
+                       in itertools.izip(holes.size_x,holes.size_y)] or [0])
+        grid = SpatialGrid(longest+clearance)
+        for x,y in itertools.izip(holes.x,holes.y):
+            grid.insert(x,y)
+        tops = holes.top
+        bottoms = holes.bottom
+        mindistance = wxPointUtil.mindistance_segments_xy
+        failed = []
+        examined = 0
+        for i,j in grid.pairs():
+            # SpanIndex.share_dielectric(), inline
+            if (tops[i] >= bottoms[j] or tops[j] >= bottoms[i]) \
+               and (tops[i] != tops[j] or bottoms[i] != bottoms[j]):
+                continue
+            examined += 1
+            ax1,ay1,ax2,ay2,ar = capsules[i]
+            bx1,by1,bx2,by2,br = capsules[j]
+            if ax1 == ax2 and ay1 == ay2 and bx1 == bx2 and by1 == by2:
+                dx = ax1 - bx1
+                dy = ay1 - by1
+                distance = math.sqrt(dx*dx+dy*dy) - ar - br
+            else:
+                distance = mindistance(
+                    ax1,ay1,ax2,ay2,bx1,by1,bx2,by2) - ar - br
+            if distance <= clearance:
+                failed.append((i,j,distance))
+        self.profile_count('pairs_examined',examined)
+        self.profile_count('pairs_pruned',
+            len(holes)*(len(holes)-1)//2 - examined)
+        failed.sort()
+        return failed
+
+    def get_annular_rings(self):
+        """Return (padrows, padrings, viarows, viarings): the rows of the
+           plated pads with a hole and of the drilled vias of the
+           snapshot, and the annular ring of each (internal units, see
+           wxPointUtil.annular_ring). Circle and oval pads are rounded,
+           other shapes their rectangle. A via ring is half its width less
+           its drill. With numpy, the columns are read as arrays and the
+           rings of all pads, then of all vias, are computed in one pass."""
+        pads = self._snapshot.pads
+        vias = self._snapshot.vias
+        npth = pcbnew.PAD_ATTRIB_HOLE_NOT_PLATED
+        rounded = (pcbnew.PAD_SHAPE_CIRCLE,pcbnew.PAD_SHAPE_OVAL)
+        names = ('w','h','drill_x','drill_y','offset_x','offset_y')
+        if numpy is None:
+            padrows = [row for row in range(len(pads))
+                       if pads.drill_x[row] > 0 and pads.drill_y[row] > 0
+                       and pads.attribute[row] != npth]
+            columns = [[getattr(pads,name)[row] for row in padrows]
+                       for name in names]
+            columns.append([pads.shape[row] in rounded for row in padrows])
+            viarows = [row for row in range(len(vias))
+                       if vias.drill_value[row] > 0]
+            viarings = [(vias.width[row]-vias.drill_value[row])/2.0
+                        for row in viarows]
+        else:
+            drill_x = pads.column_array('drill_x')
+            drill_y = pads.column_array('drill_y')
+            padrows = numpy.flatnonzero(
+                (drill_x > 0) & (drill_y > 0)
+                & (pads.column_array('attribute',int) != npth))
+            columns = [pads.column_array(name)[padrows] for name in names]
+            columns.append(numpy.in1d(
+                pads.column_array('shape',int)[padrows],rounded))
+            drill = vias.column_array('drill_value')
+            viarows = numpy.flatnonzero(drill > 0)
+            viarings = (vias.column_array('width')[viarows]
+                        - drill[viarows])/2.0
+        padrings = wxPointUtil.annular_ring_batch(*columns)
+        return padrows,padrings,viarows,viarings
+
+    def get_ring_histogram(self,rings,edges):
+        """Return the number of rings below edges[0], in each interval
+           [edges[i], edges[i+1]), and at or above edges[-1]."""
+        if numpy is None:
+            counts = [0]*(len(edges)+1)
+            for ring in rings:
+                counts[bisect.bisect_right(edges,ring)] += 1
+            return counts
+        return numpy.bincount(
+            numpy.searchsorted(edges,rings,side='right'),
+            minlength=len(edges)+1).tolist()
+
+    def get_thin_rings(self,rows,rings,minimum):
+        """Return the list of (ring, row) of the rows of get_annular_rings()
+           whose ring is less than minimum, thinnest first."""
+        if numpy is None:
+            return sorted((ring,row) for row,ring
+                          in itertools.izip(rows,rings) if ring < minimum)
+        thin = numpy.flatnonzero(rings < minimum)
+        thin = thin[numpy.argsort(rings[thin],kind='mergesort')]
+        return zip(rings[thin].tolist(),rows[thin].tolist())
 
     def GetAllHolesByLayer(self):
         """Returns a dictionary with layer number as key, and a list of
            all drill holes (those from vias and pads)."""
         # self._layernums = [num for num in range(self.LAYERCOUNT) if not board.GetLayerName(num).startswith("In")]
         # self._layernums = range(self.LAYERCOUNT)
-        allholes = self.GetPads()
-        allholes.extend(self.get_vias())
-        
-        #print self._layernums
-        layersByHole = []
-        for h in allholes:
-            layersByHole.append(
-                tuple([layer for layer in self._layernums if h.IsOnLayer(layer)]))
-
-    #	layersByHole = map(lambda h: tuple(layer for layer in self._layernums if h.IsOnLayer(layer)), allholes)
-
-        holesByLayer = {}
-
-        for index,layers in enumerate(layersByHole):
-            for layer in layers:
-                holesByLayer.setdefault(layer,[]).append(allholes[index])
-        return holesByLayer
+        return self.get_layer_buckets('holes',
+            lambda: self.GetPads() + self.get_vias())
         
 
     def GetPadLayerNameNum(self):
@@ -1568,16 +3471,25 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         on which the pad lies, and PadLayers is a list of layer numbers.
         Each list is ordered by pad number."""
         board = pcbnew.GetBoard()
+        if not self._layernums:
+            self.SetBoardLayers(board)
+        layermask = self.get_layernums_mask()
+        names = dict((layernum,board.GetLayerName(layernum))
+                     for layernum in self._layernums)
         PadLayers = {}
         PadLayerNames = {}
-        for padnum in range(board.GetPadCount()):
-            pad = board.GetPad(padnum)
+        layers_by_mask = {}
+        for padnum,pad in enumerate(self.GetPads()):
+            mask = self.get_layer_mask(pad,layermask)
+            if not mask:
+                continue
+            layers = layers_by_mask.get(mask)
+            if layers is None:
+                layers = layers_by_mask[mask] = [layernum
+                    for layernum in self._layernums if mask & (1 << layernum)]
             #_consoleText.AppendText("%s "%padnum)
-            for layernum in self._layernums:
-                if pad.IsOnLayer(layernum):
-                    PadLayers.setdefault(padnum,[]).append(layernum)
-                    PadLayerNames.setdefault(padnum,[]). \
-                        append(board.GetLayerName(layernum))
+            PadLayers[padnum] = list(layers)
+            PadLayerNames[padnum] = [names[layernum] for layernum in layers]
             #_consoleText.AppendText("%s\n"%(" ".join(PadLayerNames[padnum])))
         # _consoleText.AppendText("************** PadLayerNames*************\n")
 
@@ -1627,6 +3539,208 @@ class KiPadCheck( pcbnew.ActionPlugin ):
             self.padHolesBySize.setdefault( \
                 (int(dsize[0]),int(dsize[1])),[]).append(pad)
         return self.padHolesBySize
+
+    def get_layer_mask(self,object,layermask=None):
+        """Return the layer bitmask (bit n set for layer n) of the layers
+           in self._layernums that object is on. layermask is the bitmask
+           of self._layernums, if already known.
+           The mask is read from the object's LSET in one call when that
+           works in this pcbnew version (checked against IsOnLayer() on
+           the first object), otherwise by IsOnLayer() on every layer."""
+        if layermask is None:
+            layermask = self.get_layernums_mask()
+        if self._layer_set_hex is not False:
+            try:
+                # FmtHex() is the LSET bits as hex digits, highest first,
+                # in groups of 8 separated by '_'
+                mask = int(object.GetLayerSet().FmtHex().replace('_',''),16) \
+                    & layermask
+            except (AttributeError,TypeError,ValueError):
+                mask = None
+            if mask is not None and self._layer_set_hex:
+                return mask
+            if self._layer_set_hex is None:
+                # first object: the LSET has to agree with IsOnLayer()
+                self._layer_set_hex = mask is not None \
+                    and mask == self.get_layer_mask_by_layer(object)
+                if self._layer_set_hex:
+                    return mask
+        return self.get_layer_mask_by_layer(object)
+
+    def get_layer_mask_by_layer(self,object):
+        """get_layer_mask() by calling IsOnLayer() for every layer."""
+        mask = 0
+        for layernum in self._layernums:
+            if object.IsOnLayer(layernum):
+                mask |= 1 << layernum
+        return mask
+
+    def get_layernums_mask(self):
+        """Return the layer bitmask of self._layernums."""
+        mask = 0
+        for layernum in self._layernums:
+            mask |= 1 << layernum
+        return mask
+
+    def get_layer_buckets(self,name,get_objects):
+        """Return a dictionary of the list of objects (from get_objects())
+           on each layer number of self._layernums, using one layer
+           bitmask per object. The buckets are kept by name until the next
+           run (see LoadSnapshot), so the sections of a run share them."""
+        if self._layer_buckets is not None and name in self._layer_buckets:
+            return self._layer_buckets[name]
+        if not self._layernums:
+            self.SetBoardLayers(pcbnew.GetBoard())
+        layermask = self.get_layernums_mask()
+        buckets = {}
+        layers_by_mask = {}
+        for object in get_objects():
+            mask = self.get_layer_mask(object,layermask)
+            layers = layers_by_mask.get(mask)
+            if layers is None:
+                # in self._layernums order
+                layers = layers_by_mask[mask] = [
+                    layer for layer in self._layernums if mask & (1 << layer)]
+            for layer in layers:
+                buckets.setdefault(layer,[]).append(object)
+        if self._layer_buckets is not None:
+            self._layer_buckets[name] = buckets
+        return buckets
+
+    def GetParameter(self,name):
+        """Return the value of the named check parameter ('vv','vt','sp',
+           'ot','sc','sw','dt','ar') from the dialog, or from self._parameters when
+           running without the dialog. 'sw' is headless only."""
+        if self._frame is not None:
+            return self._frame.FindWindowByName(name).GetValue()
+        return self._parameters[name]
+
+    def LoadSnapshot(self):
+        """Return the BoardSnapshot of the board from self._backend.
+           Starts a run: the layer buckets of the last one are dropped."""
+        self._layer_buckets = {}
+        if self._backend is None:
+            self._backend = PcbnewBackend(self)
+        return self._backend.snapshot()
+
+    HEADLESS_CHECKS = ('PadInfo','DrillInfo','StencilInfo','SilkInfo')
+
+    def RunHeadless(self,backend,checks=HEADLESS_CHECKS,stream=None):
+        """Run the named checks on the board of backend without the GUI,
+           writing the console text to stream (default sys.stdout).
+           The worker functions of DrillInfo and SilkInfo run in the
+           calling thread."""
+        self._backend = backend
+        self._consoleText = ConsoleStream(stream)
+        self.profile_start('load')
+        self.profile('snapshot')
+        snapshot = backend.snapshot()
+        self._consoleText.AppendText(self.profile_end())
+        self._layernums = snapshot.layernums
+        self._layer_num_by_name = dict(
+            (name,num) for num,name in snapshot.layer_names.iteritems())
+        for check in checks:
+            if check == 'DrillInfo':
+                self._snapshot = snapshot
+                self.padHolesBySize = snapshot.pads.group_by(
+                    ('drill_x','drill_y'))
+                self.DrillInfo_Worker()
+            elif check == 'SilkInfo':
+                self._snapshot = snapshot
+                self.SilkInfo_Worker()
+            else:
+                getattr(self,check)(None)
+            while (not self._console_text_queue.empty()):
+                self._consoleText.AppendText(self._console_text_queue.get())
+            while (not self._progress_value_queue.empty()):
+                self._progress_value_queue.get()
+
+    def GetBoardSnapshot(self):
+        """Extract pads, vias, tracks, text and graphic items of
+           pcbnew.GetBoard() into a BoardSnapshot, reading each pcbnew
+           object once. Requires self._layernums (see MenuItemPadInfo)."""
+        board = pcbnew.GetBoard()
+        snapshot = BoardSnapshot(
+            self._layernums,
+            dict((layer,board.GetLayerName(layer))
+                 for layer in self._layernums))
+        layermask = self.get_layernums_mask()
+
+        for pad in self.GetPads():
+            center = pad.GetCenter()
+            size = pad.GetSize()
+            drill = pad.GetDrillSize()
+            offset = pad.GetOffset()
+            paste = pad.GetSolderPasteMargin()
+            bbox = pad.GetBoundingBox().getWxRect()
+            module = pad.GetParent()
+            snapshot.pads.append(
+                (center[0],center[1],size[0],size[1],drill[0],drill[1],
+                 offset[0],offset[1],
+                 pad.GetShape(),pad.GetDrillShape(),pad.GetAttribute(),
+                 pad.GetOrientation(),
+                 snapshot.net_id(pad.GetNetname()),
+                 pad.GetLocalClearance(),pad.GetClearance(),
+                 paste[0],paste[1],pad.GetLocalSolderPasteMargin(),
+                 pad.GetSolderMaskMargin(),pad.GetLocalSolderMaskMargin(),
+                 bbox[0],bbox[1],bbox[2],bbox[3]),
+                (module.GetReference(),pad.GetPadName(),module.GetValue()),
+                self.get_layer_mask(pad,layermask),
+                pad)
+
+        for track in board.GetTracks():
+            via = track.Cast_to_VIA()
+            if via is not None:
+                p = via.GetPosition()
+                snapshot.vias.append(
+                    (p[0],p[1],via.GetDrill(),via.GetDrillValue(),
+                     via.GetWidth(),via.GetViaType(),
+                     snapshot.net_id(via.GetNetname())),
+                    layers=self.get_layer_mask(via,layermask),
+                    object=via)
+            else:
+                start = track.GetStart()
+                end = track.GetEnd()
+                snapshot.tracks.append(
+                    (start[0],start[1],end[0],end[1],track.GetWidth(),
+                     snapshot.net_id(track.GetNetname())),
+                    layers=self.get_layer_mask(track,layermask),
+                    object=track)
+
+        if self._stroke_cache is None:
+            self._stroke_cache = StrokeCache(self._stroke_cache_bytes)
+        for text in self.GetTextObjects():
+            key = self.get_text_key(text)
+            points = self._stroke_cache.get(key)
+            if points is None:
+                points = self.get_text_strokes(text)
+                self._stroke_cache.put(key,points)
+            center = text.GetCenter()
+            box = text.GetTextBox().getWxRect()
+            snapshot.texts.append(
+                (center[0],center[1],box[0],box[1],box[2],box[3],
+                 self.get_text_orientation(text),text.GetThickness()),
+                (text.GetText(),points),
+                self.get_layer_mask(text,layermask),
+                text)
+
+        items = [d for d in board.GetDrawings()]
+        for m in board.GetModules():
+            items.extend([g for g in m.GraphicalItems()])
+        for item in items:
+            # only drawn shapes; text is handled above
+            if not hasattr(item,'GetShapeStr'):
+                continue
+            start = item.GetStart()
+            end = item.GetEnd()
+            center = item.GetCenter()
+            snapshot.drawings.append(
+                (start[0],start[1],end[0],end[1],item.GetWidth(),
+                 item.GetShape(),center[0],center[1]),
+                (item.GetShapeStr(),),
+                self.get_layer_mask(item,layermask),
+                item)
+        return snapshot
         
     def BoundingBoxIntersect(self,element1,element2,growby):
         """Returns whether the (orthogonal) Bounding Boxes of the given
@@ -1680,64 +3794,59 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         
     def PadInfo(self,e):
         """Main function for getting information about the pads in the current board."""
-        board = pcbnew.GetBoard()
-        self._consoleText.AppendText("Number of pads: %s\n"%(board.GetPadCount()))
+        self.profile_start('PadInfo')
+        self.profile('snapshot')
+        snapshot = self.LoadSnapshot()
+        self.profile('sort')
+        pads = snapshot.pads
+        self._consoleText.AppendText("Number of pads: %s\n"%(len(pads)))
         #_consoleText.AppendText("All Layers: %s\n"%(str(self._layernums)))
         
         self._consoleText.AppendText(
             "\n  ***** Pads By Footprint Reference, Alphabetical *****\n")	
                     
-        
-            
-        # pad = pcbnew.GetBoard().GetPad(0)
-        # modules  = pcbnew.GetBoard().GetModules()
-        # for module in modules:
-        # module.GetPads()
         self.PadsByReferenceAndName = {}
-        PadLayerNames, PadLayers = self.GetPadLayerNameNum()
-        for padnum in range(board.GetPadCount()):
-            pad = board.GetPad(padnum)
+        for padnum in range(len(pads)):
             self.PadsByReferenceAndName.setdefault(
-                str(pad.GetParent().GetReference()),{}). \
-                setdefault(str(pad.GetPadName()),[]).append(padnum)
+                str(pads.reference[padnum]),{}). \
+                setdefault(str(pads.name[padnum]),[]).append(padnum)
         
         sortedpads = []
         for ref in sorted(self.PadsByReferenceAndName.keys()):
             for padname in sorted(self.PadsByReferenceAndName[ref]):
                 sortedpads.extend(self.PadsByReferenceAndName[ref][padname])
                 
-        for padnum in sortedpads: #range(board.GetPadCount()):
-            pad = board.GetPad(padnum)
-            psize = pad.GetSize()
-            psize = (psize[0]/pcbnew.IU_PER_MM,psize[1]/pcbnew.IU_PER_MM)
-            dsize = pad.GetDrillSize()
-            dsize = (dsize[0]/pcbnew.IU_PER_MM,dsize[1]/pcbnew.IU_PER_MM)
+        self.profile('report')
+        for padnum in sortedpads:
+            psize = (pads.w[padnum]/pcbnew.IU_PER_MM,pads.h[padnum]/pcbnew.IU_PER_MM)
+            dsize = (pads.drill_x[padnum]/pcbnew.IU_PER_MM,pads.drill_y[padnum]/pcbnew.IU_PER_MM)
             self._consoleText.AppendText(
                 "#%5s\t(%s) X=%s Y=%s P=%s %s D=%s %s "
                 "Layers=%s lc=%.4f c=%.4f\n\t"
                 "Paste: spm=%.4f,%.4f lspm=%.4f lspmr=%.4f | "
                 "Mask : smm=%.4f lsmm=%.4f\n"%(
                     padnum,
-                    pad.GetParent().GetReference()+'.'+pad.GetPadName(),
-                    pad.GetCenter()[0]/pcbnew.IU_PER_MM,
-                    pad.GetCenter()[1]/pcbnew.IU_PER_MM,
-                    self.padshapes[pad.GetShape()],
+                    pads.reference[padnum]+'.'+pads.name[padnum],
+                    pads.x[padnum]/pcbnew.IU_PER_MM,
+                    pads.y[padnum]/pcbnew.IU_PER_MM,
+                    self.padshapes[pads.shape[padnum]],
                     psize,
-                    self.padshapes[pad.GetDrillShape()],
+                    self.padshapes[pads.drill_shape[padnum]],
                     dsize,
-                    ",".join(PadLayerNames[padnum]),
-                    pad.GetLocalClearance()/pcbnew.IU_PER_MM,
-                    pad.GetClearance()/pcbnew.IU_PER_MM,
-                    pad.GetSolderPasteMargin()[0]/pcbnew.IU_PER_MM,
-                    pad.GetSolderPasteMargin()[1]/pcbnew.IU_PER_MM,
-                    pad.GetLocalSolderPasteMargin()/pcbnew.IU_PER_MM,
-                    pad.GetLocalSolderPasteMargin()/pcbnew.IU_PER_MM,
-                    pad.GetSolderMaskMargin()/pcbnew.IU_PER_MM,
-                    pad.GetLocalSolderMaskMargin()/pcbnew.IU_PER_MM
+                    ",".join(snapshot.layer_names_of(pads.layers[padnum])),
+                    pads.local_clearance[padnum]/pcbnew.IU_PER_MM,
+                    pads.clearance[padnum]/pcbnew.IU_PER_MM,
+                    pads.paste_margin_x[padnum]/pcbnew.IU_PER_MM,
+                    pads.paste_margin_y[padnum]/pcbnew.IU_PER_MM,
+                    pads.local_paste_margin[padnum]/pcbnew.IU_PER_MM,
+                    pads.local_paste_margin[padnum]/pcbnew.IU_PER_MM,
+                    pads.mask_margin[padnum]/pcbnew.IU_PER_MM,
+                    pads.local_mask_margin[padnum]/pcbnew.IU_PER_MM
                     ))
+        self.profile('sizes')
         self._consoleText.AppendText("\n***** Quantity of Pads By Size, ordered by Area *****\n")
         # sort pad sizes by area
-        psizes = self.GetPadSizes()
+        psizes = pads.group_by(('w','h'))
         sizes = psizes.keys()
         sizes.sort(key=(lambda x: x[0]*x[1]))
         for padsize in sizes:
@@ -1748,6 +3857,7 @@ class KiPadCheck( pcbnew.ActionPlugin ):
                 padsize[0]/pcbnew.IU_PER_MM,
                 padsize[1]/pcbnew.IU_PER_MM,
                 len(padlist)))
+        self._consoleText.AppendText(self.profile_end())
         self._consoleText.AppendText("\n  ***** DONE *****\n")	
         
         
@@ -1812,16 +3922,58 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         """Return the non-orthogonal corner points of TEXTE_ object (either PCB or MODULE),
            taking text object orientation and parent (if any) orientation."""
         # Box is given by
+        return self.get_corners_rotated_rect(
+            object.GetTextBox().getWxRect(),
+            object.GetCenter(),
+            self.get_text_orientation(object))
+
+    def get_text_key(self,text):
+        """Return the StrokeCache key of text: the text and everything its
+           strokes depend on (font size, thickness, position, orientation,
+           parent module orientation, justification, mirror, italic)."""
+        if hasattr(text,'GetTextSize'):
+            size = text.GetTextSize()
+        else:
+            size = text.GetSize() # KiCad 4.0.6 stable
+        position = text.GetPosition()
+        if isinstance(text,pcbnew.TEXTE_MODULE):
+            parent_orientation = text.GetParent().GetOrientation()
+        else:
+            parent_orientation = 0
+        return (text.GetText(),size[0],size[1],text.GetThickness(),
+                position[0],position[1],text.GetOrientation(),
+                parent_orientation,text.GetHorizJustify(),
+                text.GetVertJustify(),text.IsMirrored(),text.IsItalic())
+
+    def get_text_strokes(self,text):
+        """Return the strokes of text as a flat array.array('l') of x,y
+           pairs, two points per stroke segment, in board orientation."""
+        strokes = pcbnew.wxPoint_Vector(0)
+        text.TransformTextShapeToSegmentList(strokes)
+        # orient TEXTE_MODULE strokes to the board
+        # TEXTE_MODULE: oddly, the combination of draw rotation and 
+        # orientation is what's needed to determine the correct
+        # segments transformation only for TEXTE_MODULE object.
+        # orientation is specified ccw (leftward) from positive x-axis
+        if isinstance(text,pcbnew.TEXTE_MODULE):
+            strokes = self.get_rotated_vector(
+                strokes,text.GetCenter(),
+                text.GetDrawRotation() - text.GetOrientation())
+        points = array.array('l')
+        for point in strokes:
+            points.append(point[0])
+            points.append(point[1])
+        return points
+
+    def get_text_orientation(self,object):
+        """Return the board orientation (tenths of a degree) of TEXTE_
+           object: its own orientation plus its parent module's, if any."""
         try:
             m=object.GetParent().Cast_to_MODULE()
             parentorientation = m.GetOrientation()
         except:
             parentorientation = 0.0
-        orientation = parentorientation+object.GetOrientation()
-        return self.get_corners_rotated_rect(
-            object.GetTextBox().getWxRect(),
-            object.GetCenter(),
-            orientation)
+        return parentorientation+object.GetOrientation()
             
     def get_corners_rotated_pad(self,object):
         """NEED TO REVIEW IMPLIMENTATION! uses GetBoundingBox(),
@@ -1991,66 +4143,40 @@ class KiPadCheck( pcbnew.ActionPlugin ):
     
         # Set up the thread, check if it is already running.
         # If so, return.
-        self._progress_stop = False
         if self.WorkerThread is not None and self.WorkerThread.is_alive():
-            self.ProgressThreadFunction(self.WorkerThreadself)
-            self._progress.SetValue(0)
+            # already running, its progress is still being shown
             return
 
         # Set up specifically for this worker thread.
-        # only enough to set the max value of the progress bar.
-        
-        # Total number of checks is:
-        # For each layer pair of padrects[i]*textrects[i]
-        # + padrects[i]*graphicalitems_to_check[i]
-        # Alternatively, just count each pad (sum of padrects[i]).
-        
-        pad_layer_list = (pcbnew.F_Cu,pcbnew.B_Cu)
-
-        # Get items to check that are pads on the layers in pad_layer_list
-        pads = self.GetPads()
-        pads_to_check = []
-        for layernum in pad_layer_list:
-            pads_to_check.append(filter(lambda x:x.IsOnLayer(layernum),pads))
-        
-        done=sum([len(p) for p in pads_to_check])
-        self._consoleText.AppendText("progress bar set to %d\n"%done)
+        # The worker reports its progress through a ProgressReporter,
+        # which scales the work of its phases to the range of the gauge.
+        self.profile_start('SilkInfo')
+        self.profile('snapshot')
+        self._snapshot = self.LoadSnapshot()
+        self.profile_stop()
+        if self._stroke_cache is not None:
+            self._consoleText.AppendText(self._stroke_cache.summary()+"\n")
         # initialize progress bar
-        self._progress.SetRange(done)
+        self._progress.SetRange(ProgressReporter.RANGE)
 
-        # Start up the worker thread
-        self.WorkerThread = threading.Thread(
-            target=self.SilkInfo_Worker, 
-            name="WT", 
-            args=(), 
-            kwargs={})#, daemon=False)#, *, daemon=None)
-        self.WorkerThread.start()
-        # Start the progress thread that updates the progress bar
-        # and console text
-        self.ProgressThreadFunction(self.WorkerThread)
-        
-        # Finalize by making sure the worker thread is complete,
-        # Then reset the progress bar.
-        self.WorkerThread.join()
-        self._progress.SetValue(0)
+        # Start up the worker thread. The progress bar and console text
+        # are updated from its queues, and the progress bar is reset
+        # when it is done (see OnProgressTimer).
+        self.StartWorker(self.SilkInfo_Worker)
 
        
     def SilkInfo_Worker(self):
         """Main function for getting information about the Silk Layers on the current board.
-           And executes basic silk-related DRC checks."""
+           And executes basic silk-related DRC checks.
+           The comparisons are split by side and by spatial tile (see
+           silk_partitions()) and, headless only, run in a process pool
+           when the 'sw' parameter asks for more than one process."""
         # self._progress_value_queue.put(count)
         # self._console_text_queue.put(text)
-        board = pcbnew.GetBoard()
-        sp = self._frame.FindWindowByName('vv')
-        MinimumSilkToPadMils = sp.Value
-        MinimumSilkToPadMils = 0
-
-        
-        Texts = self.GetTextObjects()
-        GraphicalItems = self.GetAllDrawingsAndGraphicItemsByLayer()
-        
-        # Texts = filter(lambda x:x.GetText()=='Elegant Computer Design',Texts)
-        # Texts = filter(lambda x:x.GetText()=='I',Texts)
+        snapshot = self._snapshot
+        pads = snapshot.pads
+        texts = snapshot.texts
+        drawings = snapshot.drawings
 
 # reload(kipadcheck); kpc=kipadcheck.KiPadCheck(); kpc.Run(); kpc.MenuItemPadInfo(); kpc.SilkInfo(None)
 
@@ -2070,54 +4196,72 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         # pad_layer_list = (pcbnew.F_Mask,pcbnew.B_Mask)
 
         # Get items to check that are pads on the copper layers
-        pads = self.GetPads()
+        # (lists of snapshot rows)
         pads_to_check = []
         for layernum in pad_layer_list:
-            pads_to_check.append(filter(lambda x:x.IsOnLayer(layernum),pads))
+            pads_to_check.append(pads.on_layer(layernum))
+        texts_on_silk = sum(len(texts.on_layer(layernum))
+                            for layernum in silk_layer_list)
+        pads_on_copper = sum(len(rows) for rows in pads_to_check)
+        progress = ProgressReporter(self._progress_value_queue,[
+            ('silk setup',pads_on_copper+texts_on_silk,
+             self.PROGRESS_WEIGHTS['silk setup']),
+            ('silk compare',pads_on_copper,
+             self.PROGRESS_WEIGHTS['silk compare'])])
+        self.profile_start('SilkInfo')
+        progress.phase('silk setup')
+        self.profile('silk setup')
           
         padrect_to_check = []
         for layerindex,layernum in enumerate(pad_layer_list):
             padrect_to_check.append([])
-            for i,pad in enumerate(pads_to_check[layerindex]):
-                padrect_to_check[-1].append(self.get_corners_rotated_pad(pad))
+            for row in pads_to_check[layerindex]:
+                padrect_to_check[-1].append(self.get_corners_rotated_rect(
+                    (pads.bbox_x[row],pads.bbox_y[row],
+                     pads.bbox_w[row],pads.bbox_h[row]),
+                    (pads.x[row],pads.y[row]),
+                    0.0))
+                progress.advance()
 
         
-        # Get items to check on the silk layer (right now, just text)
+        # Get items to check on the silk layer (text and graphic items)
         texts_to_check = []
         strokes_to_check = []
         textrect_to_check = []
         graphicalitems_to_check = []
         for layernum in silk_layer_list:
-            graphicalitems_to_check.append(GraphicalItems.get(layernum,[]))
-            texts_to_check.append(filter(lambda x:x.IsOnLayer(layernum),Texts))
+            graphicalitems_to_check.append(drawings.on_layer(layernum))
+            texts_to_check.append(texts.on_layer(layernum))
             strokes_to_check.append([])
-            for t in texts_to_check[-1]:
-                strokes_to_check[-1].append(pcbnew.wxPoint_Vector(0))
-                t.TransformTextShapeToSegmentList(strokes_to_check[-1][-1])
-                # orient TEXTE_MODULE strokes to the board
-                # TEXTE_MODULE: oddly, the combination of draw rotation and 
-                # orientation is what's needed to determine the correct
-                # segments transformation only for TEXTE_MODULE object.
-
-                # orientation is specified ccw (leftward) from positive x-axis
-                if isinstance(t,pcbnew.TEXTE_MODULE):
-                    orientation = t.GetDrawRotation() \
-                                  - t.GetOrientation()
-                    #print t.GetText(), orientation
-                    strokes_to_check[-1][-1] = self.get_rotated_vector(strokes_to_check[-1][-1],t.GetCenter(),orientation)
-                    
             textrect_to_check.append([])
-            for text in texts_to_check[-1]:
-                textrect_to_check[-1].append(self.get_corners_rotated_text(text))
-            # for text in strokes_to_check[-1]:
-                # wxPointUtil.convex_hull(strokes)
-                
-        USER_minsilkpadspacing = self._frame.FindWindowByName('sp').Value * pcbnew.IU_PER_MM
-        USER_slow_check        = self._frame.FindWindowByName('sc').GetValue()
-        USER_draw_outlines_thickness = self._frame.FindWindowByName('ot').Value * pcbnew.IU_PER_MM
+            for row in texts_to_check[-1]:
+                points = texts.strokes[row]
+                strokes_to_check[-1].append(
+                    [pcbnew.wxPoint(points[i],points[i+1])
+                     for i in range(0,len(points)-1,2)])
+                textrect_to_check[-1].append(self.get_corners_rotated_rect(
+                    (texts.box_x[row],texts.box_y[row],
+                     texts.box_w[row],texts.box_h[row]),
+                    (texts.x[row],texts.y[row]),
+                    texts.orientation[row]))
+                progress.advance()
+
+        USER_minsilkpadspacing = self.GetParameter('sp') * pcbnew.IU_PER_MM
+        USER_slow_check        = self.GetParameter('sc')
+        USER_draw_outlines_thickness = self.GetParameter('ot') * pcbnew.IU_PER_MM
         USER_draw_outlines = False # (USER_draw_outlines_thickness != 0)
         USER_draw_stroke_thickness   = USER_draw_outlines_thickness
         USER_draw_outlines_layer = pcbnew.Eco2_User
+        # The process pool only runs headless: in pcbnew, it would fork
+        # KiCad from this thread (or, on Windows, start KiCad's own
+        # executable), so the partitions run in this thread.
+        USER_workers = 1
+        if wx is None or isinstance(self._backend,PcbFileBackend):
+            USER_workers = max(1,int(self.GetParameter('sw')))
+        if USER_draw_outlines_thickness > 0:
+            # the debug outlines are drawn on this board,
+            # so the partitions have to run in this process
+            USER_workers = 1
         if USER_draw_outlines:
             for rects_to_check in (padrect_to_check, textrect_to_check):
                 for rects in rects_to_check:
@@ -2134,16 +4278,8 @@ class KiPadCheck( pcbnew.ActionPlugin ):
 
             for layerindex,strokes in enumerate(strokes_to_check):
                 for vindex, vector in enumerate(strokes):
-
-                    object=texts_to_check[layerindex][vindex]
-                    center = object.GetCenter()
-                    
                     # Creates line
                     # segments ('DRAWSEGMENT') from the individual strokes of text.
-                    #
-                    # 'object' here is a text object of type TEXTE_MODULE or TEXTE_PCB
-                    #
-                        
                     self.draw_vector(vector,
                         layer=pcbnew.Eco1_User, #USER_draw_outlines_layer,
                         thickness=USER_draw_stroke_thickness)
@@ -2154,149 +4290,321 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         
         # the outer loop include the parallel objects to check
         # These are the objects on F.Cu -> F.Silk and B.Cu -> B.Silk in all
-        # combinations.
-
-        failed=0
-        checked=0
-        #print "Back",len(pads_to_check[pcbnew.B_SilkS]),len(texts_to_check[pcbnew.B_SilkS])
-        #BTextRect=[]
-        layerindex = -1
-        progress_count = 0
-        # loop through the layer pairs
-        for padrects, textrects in itertools.izip(padrect_to_check, textrect_to_check):
-            layerindex += 1 # keep track of which layers (by index) are being compared
+        # combinations. Each side is split into spatial tiles, and the
+        # tiles (partitions) are checked by silk_check_partition().
+        self.profile('silk partitions')
+        parameters = (USER_minsilkpadspacing,USER_slow_check,
+                      USER_draw_outlines_thickness)
+        tiles = max(self.SILK_TILES,int(math.ceil(math.sqrt(USER_workers))))
+        tasks = []
+        total = 0
+        for layerindex in range(len(pad_layer_list)):
+            padrects = padrect_to_check[layerindex]
+            textrects = textrect_to_check[layerindex]
 
             self._console_text_queue.put( "Comparing layers: %s and %s\n"%(
-                board.GetLayerName(silk_layer_list[layerindex]),
-                board.GetLayerName(pad_layer_list[layerindex])))
+                snapshot.layer_names.get(silk_layer_list[layerindex]),
+                snapshot.layer_names.get(pad_layer_list[layerindex])))
             self._console_text_queue.put( "Pads: %d; Text Objects: %d\n"%(len(padrects),len(textrects)))
-            for ipad,pad in enumerate(padrects):
-                progress_count+=1
-                self._progress_value_queue.put(progress_count)
-                #self._console_text_queue.put("Progress = %d\n"%progress_count)
-
-                for itext,text in enumerate(textrects):
-                    checked+=1
-                    flow = 'start '
-                    # mindist = self.mindistance_polygon_polygon(text,pad)
-                    # continue
-                    #print str(pad),str(text)
-                    #if self.RectangleIntersect(pad,text,0):
-                    # Here, we proceed through four checks.
-                    # 1) Do the bounding boxes intersect. If so, dist = 0
-                    # 2) If not, dist = dist from bounding box to polygon pad
-                    # 3) if dist < minimum, do any segments intersect? If so, dist=0
-                    # 4) If not, find minimum distance of all segments to polygon pad.
-                    mindist2 = 1000000000*1000000000 # 1m
-                    if wxPointUtil.check_polygons_intersecting(pad,text):
-                        # self.draw_polygon(pad)
-                        # self.draw_polygon(text)
-                        mindist2=0.0 # temporary value until we find segment distances
-                        flow += '-> intersecting'
-                    elif USER_slow_check:
-                        mindist2 = (self.mindistance_polygon_polygon(text,pad) - texts_to_check[layerindex][itext].GetThickness()/2.0)**2.0
-                        flow += '-> mindist2_pp'
-                            
-                    # if polygons are within mindistance, check all strokes for that text
-                    #print mindist2, USER_minsilkpadspacing*USER_minsilkpadspacing
-                    if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing: # and USER_slow_check:
-                        mindist2 = 1000000000*1000000000 # 1m
-                        flow += '-> mindist2 le minsilk'
-                        #print "Checking strokes for ", itext,ipad
-                        vectors = strokes_to_check[layerindex][itext]
-                        intersect=False
-                        #print len(vectors)
-                        if USER_draw_outlines_thickness > 0:
-                            self.draw_vector(vectors,thickness=USER_draw_outlines_thickness)
-                            self.draw_polygon(pad,thickness=USER_draw_outlines_thickness)
-                        for vindex in range(0,len(vectors)-1,2):                            
-                            # does this stroke (vector[vindex]) intersect pad?
-                            if wxPointUtil.check_polygons_intersecting((vectors[vindex],vectors[vindex+1]),pad,closed=False):
-                                mindist2 = 0.0
-                                flow += '-> stroke intersect'
-                                break
-                        
-                        if USER_slow_check and mindist2 > USER_minsilkpadspacing*USER_minsilkpadspacing:
-                            for vindex in range(0,len(vectors)-1,2):
-                                #print vectors[vindex],vectors[vindex+1],pad
-                                mindist2 = (self.mindistance_line_polygon((vectors[vindex],vectors[vindex+1]),pad) - texts_to_check[layerindex][itext].GetThickness()/2)**2.0
-                                if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing:
-                                    flow += '-> stroke dist<=min'
-                                    break
-                    if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing:
-                        #self._console_text_queue.put("%d %d\n"%(mindist2,USER_minsilkpadspacing*USER_minsilkpadspacing))
-                        pads_to_check[layerindex][ipad].SetSelected()
-                        texts_to_check[layerindex][itext].SetSelected()
-                        failed+=1
-                        #print("%.3f %.3f %s %s %s"%(pad[0]/pcbnew.IU_PER_MM,pad[1]/pcbnew.IU_PER_MM,texts_to_check[pcbnew.B_SilkS][itext].GetText(),str(pads_by_layernum[pcbnew.B_SilkS][ipad].GetPosition()),str(pads_by_layernum[pcbnew.B_SilkS][ipad].GetBoundingBox().getWxRect())))
-                    #self._console_text_queue.put('%s\n'%flow)
-            # Check the drawings against this padrect
-            #print graphicalitems_to_check[layerindex]
+
+            # only the drawn segments are checked
+            segments = []
             for gi in graphicalitems_to_check[layerindex]:
-                if not hasattr(gi,'GetShapeStr'):
+                if drawings.shape[gi] != pcbnew.S_SEGMENT:
+                    self._console_text_queue.put("Shape '%s' at (%d, %d) not checked.\n"%(
+                        drawings.shape_name[gi],drawings.cx[gi],drawings.cy[gi]))
                     continue
-                if gi.GetShapeStr() != "Line":
-                    self._console_text_queue.put("Shape '%s' at %s not checked.\n"%(gi.GetShapeStr(),str(gi.GetCenter())))
-                    continue
-                #self.draw_segment(gi.GetStart().x,gi.GetStart().y,gi.GetEnd().x,gi.GetEnd().y,layer=pcbnew.Eco2_User, thicknessmm=0.02)
-                #self._console_text_queue.put("width=%.3f mm\n"%(gi.GetWidth()/pcbnew.IU_PER_MM))
-                for ipad,pad in enumerate(padrects):
-                    # does this stroke (vector[vindex]) intersect pad?
-                    mindist2 = (1000 * pcbnew.IU_PER_MM)*(1000 * pcbnew.IU_PER_MM)
-                    #print gi
-                    if not hasattr(gi,'GetShapeStr'):
-                        continue
-                    if gi.GetShapeStr() == "Line":
-                        
-                        try:
-                            orientation = gi.GetDrawRotation() \
-                                  - gi.GetOrientation()
-                        except:
-                            orientation = 0.0
-
-                        #print gi.GetCenter(), orientation
-                        #self.draw_segment(gi.GetStart().x,gi.GetStart().y,gi.GetEnd().x,gi.GetEnd().y,layer=pcbnew.Cmts_User, thicknessmm=0.02)
-
-                        if wxPointUtil.check_polygons_intersecting(
-                           (gi.GetStart(),gi.GetEnd()),pad,closed=False):
-                            mindist2 = 0.0
-                            # break
-                            
-                        elif USER_slow_check:
-                            #for vindex in range(0,len(vectors)-1,2):
-                            #print vectors[vindex],vectors[vindex+1],pad
-                            # Width is the diameter, but we need to subtract the radius
-                            mindist2 = (self.mindistance_line_polygon((gi.GetStart(),gi.GetEnd()),pad) - gi.GetWidth()/2.0)**2.0
-                            #self._console_text_queue.put("%d %d\n"%(mindist2,gi.GetWidth()))
-                            # if mindist2<= USER_minsilkpadspacing*USER_minsilkpadspacing:
-                                # break
-                    else:
-                        self._console_text_queue.put("SHAPE '%s' at %s not checked.\n"%(gi.GetShapeStr(),str(gi.GetCenter())))
-                        continue
-                    #print gi.GetCenter(), mindist2
-                    if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing:
-                        pads_to_check[layerindex][ipad].SetSelected()
-                        gi.SetSelected()
-                        failed+=1
+                segments.append((gi,drawings.x1[gi],drawings.y1[gi],
+                                 drawings.x2[gi],drawings.y2[gi],
+                                 drawings.width[gi]))
+            total += len(padrects)*(len(textrects)+len(segments))
+
+            # plain tuples, so the partitions can be sent to other processes
+            tasks.extend(self.silk_partitions(
+                [(row,[(p[0],p[1]) for p in rect]) for row,rect in
+                 itertools.izip(pads_to_check[layerindex],padrects)],
+                [(row,[(p[0],p[1]) for p in rect],texts.strokes[row],
+                  texts.thickness[row]) for row,rect in
+                 itertools.izip(texts_to_check[layerindex],textrects)],
+                segments,parameters,tiles))
+
+        # results of the finished partitions, by task index, starting
+        # with those of a cancelled or crashed run of the same tasks
+        finished = {}
+        checkpoint = None
+        if self._checkpoint_dir is not None and self._backend is not None:
+            checkpoint = Checkpoint.for_board(self._checkpoint_dir,
+                self._backend.name(),"silk",tasks)
+            finished.update(checkpoint.results)
+            if finished:
+                self._console_text_queue.put(
+                    "Resuming: %d of %d partitions already checked\n"%(
+                        len(finished),len(tasks)))
+        todo = [i for i in range(len(tasks)) if i not in finished]
+
+        self.profile('silk compare')
+        pool = None
+        if USER_workers > 1 and len(todo) > 1:
+            pool = multiprocessing.Pool(min(USER_workers,len(todo)))
+            results = pool.imap(_silk_check_partition,[tasks[i] for i in todo])
+        else:
+            results = itertools.imap(self.silk_check_partition,
+                                     [tasks[i] for i in todo])
+
+        progress.phase('silk compare')
+        progress.advance(sum(len(tasks[i][0]) for i in finished))
+        cancelled = False
+        try:
+            for i,result in itertools.izip(todo,results):
+                finished[i] = result
+                if checkpoint is not None:
+                    checkpoint.add(i,result)
+                progress.advance(len(tasks[i][0]))
+                if self.cancelled():
+                    cancelled = True
+                    break
+        finally:
+            if pool is not None:
+                if cancelled:
+                    pool.terminate()
+                else:
+                    pool.close()
+                pool.join()
+            if checkpoint is not None:
+                checkpoint.close()
+        if cancelled:
+            return
+        if checkpoint is not None:
+            checkpoint.remove()
 
+        # Merge the partitions. A pair is only compared in the tile of
+        # its pad, but the sets also drop any pair reported twice.
+        text_failures = set()
+        segment_failures = set()
+        checked=0
+        for i in sorted(finished):
+            text_failed,segment_failed,task_checked = finished[i]
+            # pairs read back from a checkpoint are lists
+            text_failures.update(tuple(pair) for pair in text_failed)
+            segment_failures.update(tuple(pair) for pair in segment_failed)
+            checked+=task_checked
+        failed = len(text_failures)+len(segment_failures)
+        self.profile_count('pairs_examined',checked)
+        self.profile_count('pairs_pruned',total-checked)
+        self.profile_count('violations',failed)
+
+        self.profile('select')
+        for padrow,textrow in sorted(text_failures):
+            pads.select(padrow)
+            texts.select(textrow)
+        for padrow,gi in sorted(segment_failures):
+            pads.select(padrow)
+            drawings.select(gi)
+
+        progress.finish()
         self._console_text_queue.put("Checked: %d; Failed: %d\n"%(checked,failed))
+        self._console_text_queue.put("Pruned by broad phase: %d of %d pairs\n"%(
+            total-checked,total))
+        self._console_text_queue.put(self.profile_end())
         return
 
+    def silk_partitions(self,pad_items,text_items,segment_items,parameters,tiles=1):
+        """Split the silk checks of one side into at most tiles x tiles
+           tasks for silk_check_partition().
+           pad_items are (row, polygon), text_items are (row, polygon,
+           strokes, thickness) and segment_items are (row, x1, y1, x2, y2,
+           width) of the snapshot, with polygons as lists of (x, y).
+           Each pad goes to the tile holding its center. Each text and
+           segment goes to every tile whose pads it comes within the
+           spacing of (the halo), so every pair is compared in exactly
+           one task. Returns the tasks in tile order, each one
+           (pad_items, text_items, segment_items, parameters)."""
+        spacing = parameters[0]
+        pad_boxes = [wxPointUtil.polygon_box(polygon) for row,polygon in pad_items]
+        cells = collections.defaultdict(list)
+        if pad_items:
+            minx = min(box[0]+box[2] for box in pad_boxes)//2
+            miny = min(box[1]+box[3] for box in pad_boxes)//2
+            width = max(box[0]+box[2] for box in pad_boxes)//2 - minx + 1
+            height = max(box[1]+box[3] for box in pad_boxes)//2 - miny + 1
+        for ipad,box in enumerate(pad_boxes):
+            cells[(((box[1]+box[3])//2-miny)*tiles//height,
+                   ((box[0]+box[2])//2-minx)*tiles//width)].append(ipad)
+
+        text_boxes = [wxPointUtil.polygon_box(polygon,spacing+thickness)
+                      for row,polygon,strokes,thickness in text_items]
+        segment_boxes = [wxPointUtil.polygon_box(((x1,y1),(x2,y2)),spacing+width)
+                         for row,x1,y1,x2,y2,width in segment_items]
+        tasks = []
+        for cell in sorted(cells):
+            ipads = cells[cell]
+            extent = (min(pad_boxes[i][0] for i in ipads),
+                      min(pad_boxes[i][1] for i in ipads),
+                      max(pad_boxes[i][2] for i in ipads),
+                      max(pad_boxes[i][3] for i in ipads))
+            tasks.append((
+                [pad_items[i] for i in ipads],
+                [item for item,box in itertools.izip(text_items,text_boxes)
+                 if wxPointUtil.boxes_overlapping(box,extent)],
+                [item for item,box in itertools.izip(segment_items,segment_boxes)
+                 if wxPointUtil.boxes_overlapping(box,extent)],
+                parameters))
+        return tasks
+
+    def silk_check_partition(self,task):
+        """Compare the pads of one silk_partitions() task to its texts and
+           drawing segments. Returns (failed (pad row, text row) pairs,
+           failed (pad row, drawing row) pairs, number of pairs left after
+           the broad phase). Only uses task, so it can run in a pool
+           worker process (see _silk_check_partition())."""
+        pad_items, text_items, segment_items, parameters = task
+        USER_minsilkpadspacing,USER_slow_check,USER_draw_outlines_thickness = parameters
+        padrects = [[pcbnew.wxPoint(x,y) for x,y in polygon]
+                    for row,polygon in pad_items]
+        textrects = [[pcbnew.wxPoint(x,y) for x,y in polygon]
+                     for row,polygon,points,thickness in text_items]
+        strokes = [[pcbnew.wxPoint(points[i],points[i+1])
+                    for i in range(0,len(points)-1,2)]
+                   for row,polygon,points,thickness in text_items]
+
+        # the same polygons as arrays for the batched checks
+        # (see wxPointUtil.check_polygons_intersecting_batch)
+        padrect_array = wxPointUtil.polygon_array(padrects)
+        textrect_array = wxPointUtil.polygon_array(textrects)
+        stroke_arrays = [wxPointUtil.polygon_array(
+                             [(vectors[i],vectors[i+1])
+                              for i in range(0,len(vectors)-1,2)])
+                         for vectors in strokes]
+
+        text_failed = []
+        segment_failed = []
+        checked = 0
+
+        # Broad phase: a pad and a text can only fail when their boxes
+        # overlap once the text box is grown by the spacing and the
+        # stroke thickness.
+        pad_boxes = [wxPointUtil.polygon_box(pad) for pad in padrects]
+        broadphase = SweepAndPrune(pad_boxes,[
+            wxPointUtil.polygon_box(text,USER_minsilkpadspacing
+                + text_items[itext][3])
+            for itext,text in enumerate(textrects)])
+        texts_by_pad = {}
+        for ipad,itext in broadphase.pairs():
+            texts_by_pad.setdefault(ipad,[]).append(itext)
+
+        for ipad,pad in enumerate(padrects):
+            candidates = texts_by_pad.get(ipad)
+            if not candidates:
+                continue
+            checked+=len(candidates)
+            pad_array = padrect_array[ipad]
+            # this pad against all its candidate text rectangles at once
+            text_intersecting = wxPointUtil.check_polygons_intersecting_batch(
+                pad_array,wxPointUtil.take_polygons(textrect_array,candidates))
+
+            for icandidate,itext in enumerate(candidates):
+                text = textrects[itext]
+                thickness = text_items[itext][3]
+                # Here, we proceed through four checks.
+                # 1) Do the bounding boxes intersect. If so, dist = 0
+                # 2) If not, dist = dist from bounding box to polygon pad
+                # 3) if dist < minimum, do any segments intersect? If so, dist=0
+                # 4) If not, find minimum distance of all segments to polygon pad.
+                mindist2 = 1000000000*1000000000 # 1m
+                if text_intersecting[icandidate]:
+                    mindist2=0.0 # temporary value until we find segment distances
+                elif USER_slow_check and numpy is not None:
+                    mindist2 = (math.sqrt(wxPointUtil.mindistance2_segments_batch(
+                        wxPointUtil.polygon_edges(textrect_array[itext]),
+                        wxPointUtil.polygon_edges(pad_array)).min())
+                        - thickness/2.0)**2.0
+                elif USER_slow_check:
+                    mindist2 = (self.mindistance_polygon_polygon(text,pad) - thickness/2.0)**2.0
+                        
+                # if polygons are within mindistance, check all strokes for that text
+                if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing:
+                    mindist2 = 1000000000*1000000000 # 1m
+                    vectors = strokes[itext]
+                    if USER_draw_outlines_thickness > 0:
+                        self.draw_vector(vectors,thickness=USER_draw_outlines_thickness)
+                        self.draw_polygon(pad,thickness=USER_draw_outlines_thickness)
+                    # does any stroke intersect pad?
+                    if any(wxPointUtil.check_polygons_intersecting_batch(
+                           pad_array,stroke_arrays[itext],
+                           closed=False)):
+                        mindist2 = 0.0
+                    
+                    if (USER_slow_check and numpy is not None
+                        and mindist2 > USER_minsilkpadspacing*USER_minsilkpadspacing):
+                        # all strokes against all pad edges at once
+                        mindist2 = self.mindistance2_strokes_polygon(
+                            stroke_arrays[itext],pad_array,
+                            thickness,USER_minsilkpadspacing*USER_minsilkpadspacing)
+                    elif USER_slow_check and mindist2 > USER_minsilkpadspacing*USER_minsilkpadspacing:
+                        for vindex in range(0,len(vectors)-1,2):
+                            mindist2 = (self.mindistance_line_polygon((vectors[vindex],vectors[vindex+1]),pad) - thickness/2)**2.0
+                            if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing:
+                                break
+                if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing:
+                    text_failed.append((pad_items[ipad][0],text_items[itext][0]))
+
+        # Check the drawings against the pads, with the same broad
+        # phase (segment boxes grown by the spacing and the width)
+        broadphase = SweepAndPrune(pad_boxes,[
+            wxPointUtil.polygon_box(((x1,y1),(x2,y2)),
+                                    USER_minsilkpadspacing + width)
+            for gi,x1,y1,x2,y2,width in segment_items])
+        pads_by_segment = {}
+        for ipad,isegment in broadphase.pairs():
+            pads_by_segment.setdefault(isegment,[]).append(ipad)
+
+        for isegment,(gi,x1,y1,x2,y2,width) in enumerate(segment_items):
+            candidates = pads_by_segment.get(isegment)
+            if not candidates:
+                continue
+            checked+=len(candidates)
+            start = pcbnew.wxPoint(x1,y1)
+            end = pcbnew.wxPoint(x2,y2)
+            # this segment against all its candidate pads at once
+            segment = wxPointUtil.polygon_array([(start,end)])
+            candidate_pads = wxPointUtil.take_polygons(padrect_array,candidates)
+            pad_intersecting = wxPointUtil.check_polygons_intersecting_batch(
+                segment[0],candidate_pads,closed=False)
+            if USER_slow_check and numpy is not None:
+                # distance from the segment to all edges of all
+                # candidate pads at once
+                edges = wxPointUtil.polygon_edges(candidate_pads)
+                pad_distance2 = wxPointUtil.mindistance2_segments_batch(
+                    segment,edges.reshape(-1,2,2)).reshape(
+                        len(candidates),-1).min(axis=1)
+            for icandidate,ipad in enumerate(candidates):
+                pad = padrects[ipad]
+                # does this stroke (vector[vindex]) intersect pad?
+                mindist2 = (1000 * pcbnew.IU_PER_MM)*(1000 * pcbnew.IU_PER_MM)
+                if pad_intersecting[icandidate]:
+                    mindist2 = 0.0
+                elif USER_slow_check and numpy is not None:
+                    mindist2 = (math.sqrt(pad_distance2[icandidate]) - width/2.0)**2.0
+                elif USER_slow_check:
+                    # Width is the diameter, but we need to subtract the radius
+                    mindist2 = (self.mindistance_line_polygon((start,end),pad) - width/2.0)**2.0
+                if mindist2 <= USER_minsilkpadspacing*USER_minsilkpadspacing:
+                    segment_failed.append((pad_items[ipad][0],gi))
+        return (text_failed,segment_failed,checked)
+
     def GetAllDrawingsAndGraphicItemsByLayer(self):
-        items = [d for d in pcbnew.GetBoard().GetDrawings()]
-        for m in pcbnew.GetBoard().GetModules():
-            items.extend([g for g in m.GraphicalItems()])
-            
-        itemsByLayer={}
-        for i in items:
-            for layernum in range(self.LAYERCOUNT):
-                if i.IsOnLayer(layernum):
-                    itemsByLayer.setdefault(layernum,[]).append(i)
-        return itemsByLayer
+        """Returns a dictionary with layer number as key, and a list of
+           the board drawings and module graphic items on that layer."""
+        def get_items():
+            items = [d for d in pcbnew.GetBoard().GetDrawings()]
+            for m in pcbnew.GetBoard().GetModules():
+                items.extend([g for g in m.GraphicalItems()])
+            return items
+        return self.get_layer_buckets('drawings',get_items)
 
     def DrawAllGraphicItems(self):
-        itemsByLayer = GetAllDrawingsAndGraphicItemsByLayer()
-        silkdrawsegments = filter(lambda x: isinstance(x,pcbnew.DRAWSEGMENT),itemsByLayer[pcbnew.F_SilkS])
+        itemsByLayer = self.GetAllDrawingsAndGraphicItemsByLayer()
+        silkdrawsegments = filter(lambda x: isinstance(x,pcbnew.DRAWSEGMENT),itemsByLayer.get(pcbnew.F_SilkS,[]))
         for i in silkdrawsegments:
             self.draw_segment(i.GetStart().x,i.GetStart().y,i.GetEnd().x,i.GetEnd().y,layer=pcbnew.Eco1_User)
         #self.draw_segment(0,0,pcbnew.IU_PER_MM*100,pcbnew.IU_PER_MM*100,layer=pcbnew.Eco1_User)
@@ -2342,50 +4650,36 @@ class KiPadCheck( pcbnew.ActionPlugin ):
             vectors.clear()
            
 
-    def UpdateProgress(self,count):
-        """Updated the GUI progress bar to the indicated value.
-        (Sleep an arbitrary amount of time (100ms) to allow GUI update."""
-        self._progress.SetValue(count)
-        # self._progress.Refresh()
-        # self._progress.Update()
-        wx.Yield()
-        time.sleep(.1)
-        return
-
     padHolesBySize = None
+    drillPaths = None
+    """List of (drill size, holes (x, y, slot) in drilling order) of each
+       tool of the last DrillInfo (see get_drill_holes)."""
     WorkerThread = None
     def DrillInfo(self,e):
         """Main function for getting information about Drill Holes on the current board.
            And executes basic hole-related DRC checks.
            This is the parent function that instantiates and installs a separated
            workor thread (DrillInfo_Worker())"""
-    # TODO: Clean up _progress_stop: change to CancelDrillWorker, provide for cancel.
         board = pcbnew.GetBoard()
-        self._progress_stop = False
         if self.WorkerThread is not None and self.WorkerThread.is_alive():
-            self.ProgressThreadFunction(self.WorkerThreadself)
-            self._progress.SetValue(0)
+            # already running, its progress is still being shown
             return
 
+        self.profile_start('DrillInfo')
+        self.profile('clear selection')
         for t in board.GetTracks():
             t.ClearSelected()
             t.ClearHighlighted()
             t.ClearBrightened()
         
-        self.padHolesBySize = self.GetPadHoles(); 
-        self._vias = self.get_vias()
+        self.profile('snapshot')
+        self._snapshot = self.LoadSnapshot()
+        self.padHolesBySize = self._snapshot.pads.group_by(('drill_x','drill_y'))
+        self.profile_stop()
         
-        self._progress.SetRange(2*len(self.padHolesBySize)+2*len(self._vias))
+        self._progress.SetRange(ProgressReporter.RANGE)
 
-        self.WorkerThread = threading.Thread(
-            target=self.DrillInfo_Worker, 
-            name="WT", 
-            args=(), 
-            kwargs={})#, daemon=False)#, *, daemon=None)
-        self.WorkerThread.start()
-        self.ProgressThreadFunction(self.WorkerThread)
-        self.WorkerThread.join()
-        self._progress.SetValue(0)
+        self.StartWorker(self.DrillInfo_Worker)
         
     def DrillInfo_Worker(self):
         """Function that does all the work of Drill Hole DRC as a background thread."""
@@ -2393,18 +4687,43 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         # use _console_text_queue and _progress_value_queue
         # to update the GUI
         
-        board = pcbnew.GetBoard()
-        vv = self._frame.FindWindowByName('vv')
-        vt = self._frame.FindWindowByName('vt')
-        MinimumViaViaMils = vv.Value
-        MinimumViaTrackMils = vt.Value
+        snapshot = self._snapshot
+        pads = snapshot.pads
+        vias = snapshot.vias
+        tracks = snapshot.tracks
+        MinimumViaViaMils = self.GetParameter('vv')
+        MinimumViaTrackMils = self.GetParameter('vt')
         MinimumViaVia = MinimumViaViaMils*pcbnew.IU_PER_MILS
+
+        self.profile_start('DrillInfo')
+        self.profile('holes by layer')
+        # (table, rows) of all pads and vias on each layer
+        holesByLayer = []
+        for layer in snapshot.layernums:
+            padrows = pads.on_layer(layer)
+            viarows = vias.on_layer(layer)
+            if len(padrows) or len(viarows):
+                holesByLayer.append((layer,padrows,viarows))
+        holes = sum(len(padrows)+len(viarows)
+                    for layer,padrows,viarows in holesByLayer)
+        drilled = self.get_drill_holes()
+        progress = ProgressReporter(self._progress_value_queue,[
+            (name,items,self.PROGRESS_WEIGHTS[name]) for name,items in (
+                ('hole sizes',holes),
+                ('hole separation',holes),
+                ('annular ring',len(pads)+len(vias)),
+                ('drill sizes',2*len(self.padHolesBySize)),
+                ('drill path',len(drilled)),
+                ('via list',len(vias)),
+                ('via distance',len(vias)),
+                ('via track',len(vias)))])
+        progress.phase('hole sizes')
+        self.profile('hole sizes')
         self._console_text_queue.put(
             "\n\n***** Quantity of holes by layer and size *****\n")
-        self._console_text_queue.put("Layers: %s\n"%(str(self.GetAllHolesByLayer().keys())))
+        self._console_text_queue.put("Layers: %s\n"%(str([h[0] for h in holesByLayer])))
         
-        allHolesByLayer = self.GetAllHolesByLayer()
-        for layer, holelist in allHolesByLayer.iteritems():
+        for layer, padrows, viarows in holesByLayer:
             IsOrIsNot = []
             if pcbnew.IsCopperLayer(layer):
                 IsOrIsNot.append("Copper")
@@ -2429,22 +4748,20 @@ class KiPadCheck( pcbnew.ActionPlugin ):
 
             self._console_text_queue.put(
                 "Layer %s (%s):\n"%(
-                board.GetLayerName(layer),
+                snapshot.layer_names[layer],
                 ', '.join(IsOrIsNot)))
             bysize = {}
-            for hole in holelist:
-                try:
-                    d = hole.GetDrillSize()
-                    #d = getattr(
-                    #   hole,
-                    #   "GetDrillSize",
-                    #   getattr(hole,"GetDrillValue"))
-                except:
-                    d = hole.GetDrillValue()
-                    d = (d,d)
+            for row in padrows:
+                d = (pads.drill_x[row],pads.drill_y[row])
                 if d[0] == 0.0 or d[1] == 0.0:
                     continue
-                bysize.setdefault((d[0],d[1]),[]).append(hole)
+                bysize.setdefault(d,[]).append(row)
+            for row in viarows:
+                d = (vias.drill_value[row],vias.drill_value[row])
+                if d[0] == 0.0 or d[1] == 0.0:
+                    continue
+                bysize.setdefault(d,[]).append(row)
+            progress.advance(len(padrows)+len(viarows))
                 
             areaorder = sorted(bysize.keys(),key=lambda x: x[0]*x[1])
             for size in areaorder:
@@ -2456,32 +4773,132 @@ class KiPadCheck( pcbnew.ActionPlugin ):
                     size[1]/pcbnew.IU_PER_MM,
                     len(holelist)))
         self._console_text_queue.put("\n\n***** Check hole separation by layer *****\n")
-        mindist = 1000*pcbnew.IU_PER_MM
-        for layer, holelist in self.get_holes_by_layer().iteritems():
-            fails = 0
-            for i in range(len(holelist)-2):
-                sizei = self.get_drill_size(holelist[i])
-                for j in range(i+1,len(holelist)-1):
-                    sizej = self.get_drill_size(holelist[j])
-                    dist2 = wxPointUtil.distance2(holelist[i].GetCenter(),holelist[j].GetCenter())
-                    mindist = min(mindist,math.sqrt(dist2) - (max(sizei.x,sizei.y) + max(sizej.x,sizej.y))/2.0)
-                    if mindist <= MinimumViaVia:
-                        holelist[i].SetSelected()
-                        holelist[j].SetSelected()
-                        fails += 1
-            self._console_text_queue.put("Layer %s => %d errors:\n"%(board.GetLayerName(layer),fails))
+        progress.phase('hole separation')
+        self.profile('hole separation')
+        if self.cancelled():
+            return
+        # one query over the pad holes (slots as capsules) and vias of all
+        # layers, then the failures are counted by layer and pair class
+        holetable = snapshot.hole_table()
+        close = self.get_close_hole_pairs(holetable,MinimumViaVia)
+        progress.advance(holes)
+        fails = dict((layer,0) for layer,padrows,viarows in holesByLayer)
+        classes = []
+        for i,kind in enumerate(snapshot.HOLE_KINDS):
+            for other in snapshot.HOLE_KINDS[i:]:
+                classes.append("%s - %s"%(kind,other))
+        byclass = dict((name,[]) for name in classes)
+        for i,j,distance in close:
+            holetable.select(i)
+            holetable.select(j)
+            for layer in SnapshotTable.layers_of(
+                    holetable.layers[i] & holetable.layers[j]):
+                if layer in fails:
+                    fails[layer] += 1
+            kinds = sorted((holetable.kind[i],holetable.kind[j]))
+            byclass["%s - %s"%tuple(
+                snapshot.HOLE_KINDS[kind] for kind in kinds)].append(
+                (i,j,distance))
+        self.profile_count('violations',len(close))
+        drilled_layers = 0
+        for mask in holetable.layers:
+            drilled_layers |= mask
+        for layer, padrows, viarows in holesByLayer:
+            if drilled_layers & (1 << layer):
+                self._console_text_queue.put("Layer %s => %d errors:\n"%(snapshot.layer_names[layer],fails[layer]))
+        self._console_text_queue.put(
+            "\n***** Holes too close (%.3f mm), by pair class *****\n"%(
+            MinimumViaVia/pcbnew.IU_PER_MM))
+        for name in classes:
+            self._console_text_queue.put("%s: %d\n"%(name,len(byclass[name])))
+        for name in classes:
+            for i,j,distance in byclass[name]:
+                self._console_text_queue.put(
+                    "%s at (%.3f, %.3f) mm, %s at (%.3f, %.3f) mm:"
+                    " %.3f mm apart\n"%(
+                    self.get_hole_name(holetable,i),
+                    holetable.x[i]/pcbnew.IU_PER_MM,
+                    holetable.y[i]/pcbnew.IU_PER_MM,
+                    self.get_hole_name(holetable,j),
+                    holetable.x[j]/pcbnew.IU_PER_MM,
+                    holetable.y[j]/pcbnew.IU_PER_MM,
+                    distance/pcbnew.IU_PER_MM))
                      
-            
-        count = 0
-        self._progress_value_queue.put(count)
+        if self.cancelled():
+            return
+        progress.phase('annular ring')
+        self.profile('annular ring')
+        MinimumRingMils = self.GetParameter('ar')
+        MinimumRing = MinimumRingMils*pcbnew.IU_PER_MILS
+        padrows,padrings,viarows,viarings = self.get_annular_rings()
+        progress.advance(len(pads)+len(vias))
+        edges = [edge*pcbnew.IU_PER_MM for edge in self.ANNULAR_RING_BINS]
+        padcounts = self.get_ring_histogram(padrings,edges)
+        viacounts = self.get_ring_histogram(viarings,edges)
+        thinpads = self.get_thin_rings(padrows,padrings,MinimumRing)
+        thinvias = self.get_thin_rings(viarows,viarings,MinimumRing)
+        self.profile_count('violations',len(thinpads)+len(thinvias))
+        for ring,row in thinpads:
+            pads.select(row)
+        for ring,row in thinvias:
+            vias.select(row)
+        self._console_text_queue.put(
+            "\n\n***** Annular Ring (minimum %.3f mils, %.3f mm) *****\n"%(
+            MinimumRingMils,MinimumRing/pcbnew.IU_PER_MM))
+        self._console_text_queue.put("%-15s %8s %8s\n"%("Ring (mm)","Pads","Vias"))
+        bins = ["< %.3f"%self.ANNULAR_RING_BINS[0]]
+        for low,high in zip(self.ANNULAR_RING_BINS,self.ANNULAR_RING_BINS[1:]):
+            bins.append("%.3f - %.3f"%(low,high))
+        bins.append(">= %.3f"%self.ANNULAR_RING_BINS[-1])
+        for name,padcount,viacount in zip(bins,padcounts,viacounts):
+            self._console_text_queue.put(
+                "%-15s %8d %8d\n"%(name,padcount,viacount))
+        self._console_text_queue.put("%-15s %8d %8d\n"%(
+            "Total",len(padrows),len(viarows)))
+        self._console_text_queue.put(
+            "Below minimum: %d pads, %d vias\n"%(len(thinpads),len(thinvias)))
+        if len(thinpads) or len(thinvias):
+            worst = heapq.nsmallest(self.ANNULAR_RING_WORST,
+                [(ring,0,row) for ring,row in thinpads[:self.ANNULAR_RING_WORST]]
+                + [(ring,1,row) for ring,row in thinvias[:self.ANNULAR_RING_WORST]])
+            self._console_text_queue.put(
+                "\n***** Thinnest annular rings (%d of %d) *****\n"%(
+                len(worst),len(thinpads)+len(thinvias)))
+            for ring,isvia,row in worst:
+                if isvia:
+                    self._console_text_queue.put(
+                        "via %d at (%.3f, %.3f) mm: ring %.3f mm"
+                        " (width %.3f mm, drill %.3f mm)\n"%(
+                        row,vias.x[row]/pcbnew.IU_PER_MM,
+                        vias.y[row]/pcbnew.IU_PER_MM,ring/pcbnew.IU_PER_MM,
+                        vias.width[row]/pcbnew.IU_PER_MM,
+                        vias.drill_value[row]/pcbnew.IU_PER_MM))
+                    continue
+                self._console_text_queue.put(
+                    "pad %s.%s at (%.3f, %.3f) mm: ring %.3f mm"
+                    " (%s %.3f x %.3f mm, drill %.3f x %.3f mm,"
+                    " offset %.3f, %.3f mm)\n"%(
+                    pads.reference[row],pads.name[row],
+                    pads.x[row]/pcbnew.IU_PER_MM,pads.y[row]/pcbnew.IU_PER_MM,
+                    ring/pcbnew.IU_PER_MM,
+                    self.padshapes.get(pads.shape[row],str(pads.shape[row])),
+                    pads.w[row]/pcbnew.IU_PER_MM,pads.h[row]/pcbnew.IU_PER_MM,
+                    pads.drill_x[row]/pcbnew.IU_PER_MM,
+                    pads.drill_y[row]/pcbnew.IU_PER_MM,
+                    pads.offset_x[row]/pcbnew.IU_PER_MM,
+                    pads.offset_y[row]/pcbnew.IU_PER_MM))
+
+        if self.cancelled():
+            return
+        progress.phase('drill sizes')
+        self.profile('drill sizes')
         #_console_text_queue.put("\n%s\n"%(str(count)))
         self._console_text_queue.put(
             "\n\n***** Quantity of Pads By Specified Drill Size, ordered by area *****\n")
         areaorder = sorted(self.padHolesBySize.keys(),key=lambda x:x[0]*x[1])
         for padsize in areaorder:
             padlist = self.padHolesBySize[padsize]
-            count += 1
-            self._progress_value_queue.put(count)
+            progress.advance()
             #_console_text_queue.put(str(count))
             # time.sleep(1)
             # self._progress.Refresh()
@@ -2492,48 +4909,144 @@ class KiPadCheck( pcbnew.ActionPlugin ):
                 padsize[0]/pcbnew.IU_PER_MM,len(padlist)))
         self._console_text_queue.put(
             "\n\n***** Quantity of Pads By Standard Drill Size, ordered by area *****\n")
-        setname, scale, source = self._StandardDrillInfo[self._DrillSet]
-        self._console_text_queue.put("%s from:\n%s\n\n"%(setname,source))
-        
-        areaorder = sorted(self.padHolesBySize.keys(),key=lambda x:x[0]*x[1])
-        for padsize in areaorder:
-            padlist = self.padHolesBySize[padsize]
-            count += 1
-            self._progress_value_queue.put(count)
-            if padsize[0]==0 and padsize[1]==0:
-                continue
-            for dindex,dsize in enumerate(self._StandardDrill[self._DrillSet]):
+        # the closest larger drill of every drill set, side by side
+        self._console_text_queue.put(
+            "Closest larger drill (Name mm) of each drill set"
+            " (* default set):\n")
+        for dset,(setname,scale,source) in enumerate(self._StandardDrillInfo):
+            self._console_text_queue.put("%s[%d] %s from:\n    %s\n"%(
+                "*" if dset == self._DrillSet else " ",dset+1,setname,source))
+        self._console_text_queue.put("\n%8s %7s %5s"%("Size mm","mils","Qty"))
+        for dset in range(len(self._StandardDrill)):
+            self._console_text_queue.put(" %15s"%("[%d]"%(dset+1)))
+        self._console_text_queue.put("\n")
+
+        areaorder = [padsize for padsize in
+            sorted(self.padHolesBySize.keys(),key=lambda x:x[0]*x[1])
+            if padsize[0]!=0 or padsize[1]!=0]
+        drills_by_set = self.get_standard_drills(
+            [padsize[0] for padsize in areaorder])
+        progress.advance(len(self.padHolesBySize)-len(areaorder))
+        for sindex,padsize in enumerate(areaorder):
+            progress.advance()
+            line = ["%8.3f %7.1f %5d"%(
+                padsize[0]/pcbnew.IU_PER_MM,
+                padsize[0]/pcbnew.IU_PER_MILS,
+                len(self.padHolesBySize[padsize]))]
+            for dset,drills in enumerate(drills_by_set):
+                dindex = drills[sindex]
+                if dindex is None:
+                    line.append(" %15s"%"-")
+                    continue
                 # drill sizes * scale are internal units
-                if (dsize[0]*scale) >= padsize[0]:
-                    self._console_text_queue.put(
-                       'Size: %.3fmm (%.1f mils), '
-                       'Drill "%s": %.3fmm  (%.1f mils), '
-                       'Quantity %s\n'%(
-                       padsize[0]/pcbnew.IU_PER_MM,
-                       padsize[0]/pcbnew.IU_PER_MILS,
-                       self._StandardDrill[self._DrillSet][dindex][1],
-                       dsize[0]*scale/pcbnew.IU_PER_MM,
-                       dsize[0]*scale/pcbnew.IU_PER_MILS,
-                       len(padlist)))
-                    # padsize[0]*25.4/1000000.0
-                    break
+                line.append(" %8s %6.3f"%(
+                    '"%s"'%self._StandardDrill[dset][dindex][1],
+                    self._StandardDrillIU[dset][dindex]/pcbnew.IU_PER_MM))
+            self._console_text_queue.put("".join(line)+"\n")
+
+        self.profile('drill tools')
+        # pad holes (slots by their width) and vias, by size
+        tolerance = self.GetParameter('dt')*pcbnew.IU_PER_MM
+        hole_counts = collections.Counter(size for x,y,size,slot in drilled)
+        tools,unmatched = self.get_drill_tools(hole_counts,tolerance)
+        setname, scale, source = self._StandardDrillInfo[self._DrillSet]
+        self._console_text_queue.put(
+            "\n\n***** Drill Tool Consolidation "
+            "(oversize tolerance %.3f mm) *****\n%s\n"%(
+            tolerance/pcbnew.IU_PER_MM,setname))
+        self._console_text_queue.put("%-5s %8s %7s %6s  %s\n"%(
+            "Tool","Drill","mm","Holes","Hole sizes (mm)"))
+        for tindex,(dindex,sizes) in enumerate(tools):
+            self._console_text_queue.put("T%-4d %8s %7.3f %6d  %s\n"%(
+                tindex+1,
+                '"%s"'%self._StandardDrill[self._DrillSet][dindex][1],
+                self._StandardDrillIU[self._DrillSet][dindex]/pcbnew.IU_PER_MM,
+                sum(hole_counts[size] for size in sizes),
+                ", ".join("%.3f"%(size/pcbnew.IU_PER_MM) for size in sizes)))
+        for size in unmatched:
+            self._console_text_queue.put(
+                "No standard drill within tolerance: %.3f mm (%d holes)\n"%(
+                size/pcbnew.IU_PER_MM,hole_counts[size]))
+        closest = self.get_standard_drills(sorted(hole_counts))[self._DrillSet]
+        consolidated = len(tools)+len(unmatched)
+        self._console_text_queue.put(
+            "Tools: %d hole sizes, %d closest larger drills, "
+            "%d consolidated (%d saved)\n"%(
+            len(hole_counts),
+            len(set(d for d in closest if d is not None))
+                + closest.count(None),
+            consolidated,len(hole_counts)-consolidated))
+
+        if self.cancelled():
+            return
+        progress.phase('drill path')
+        self.profile('drill path')
+        rapid = self.DRILL_MACHINE['rapid']
+        hit = self.DRILL_MACHINE['hit']
+        change = self.DRILL_MACHINE['tool change']
+        self._console_text_queue.put(
+            "\n\n***** Drill Path (travel between the holes of each tool) *****\n"
+            "Estimated at %.0f mm/s rapid, %.2f s per hit, "
+            "%.0f s per tool change\n"%(rapid,hit,change))
+        self._console_text_queue.put("%-5s %7s %6s %12s %12s %12s %8s\n"%(
+            "Tool","mm","Holes","Board mm","Hilbert mm","2-opt mm","Time s"))
+        self.drillPaths = []
+        totals = [0,0.0,0.0,0.0]
+        for tindex,(size,toolholes) in enumerate(self.get_tool_holes(drilled,tools,unmatched)):
+            if self.cancelled():
+                return
+            # slots are ordered by their center
+            points = [(x,y) for x,y,slot in toolholes]
+            path = DrillPath(points)
+            lengths = [path.length()]
+            path.seed()
+            lengths.append(path.length())
+            path.improve()
+            lengths.append(path.length())
+            progress.advance(len(points))
+            self.drillPaths.append((size,[toolholes[i] for i in path.order]))
+            # each tool is loaded once, its change counts with its holes
+            seconds = lengths[2]/pcbnew.IU_PER_MM/rapid + len(points)*hit \
+                + change
+            self._console_text_queue.put(
+                "T%-4d %7.3f %6d %12.1f %12.1f %12.1f %8.1f\n"%((
+                tindex+1,size/pcbnew.IU_PER_MM,len(points))
+                + tuple(length/pcbnew.IU_PER_MM for length in lengths)
+                + (seconds,)))
+            totals[0] += len(points)
+            for i,length in enumerate(lengths):
+                totals[i+1] += length
+        travel = totals[3]/pcbnew.IU_PER_MM/rapid
+        hits = totals[0]*hit
+        changes = len(self.drillPaths)*change
+        self._console_text_queue.put(
+            "%-5s %7s %6d %12.1f %12.1f %12.1f %8.1f\n"%((
+            "Total","",totals[0])
+            + tuple(length/pcbnew.IU_PER_MM for length in totals[1:])
+            + (travel+hits+changes,)))
+        seconds = int(round(travel+hits+changes))
+        self._console_text_queue.put(
+            "Estimated drilling time %d:%02d:%02d (travel %.0f s, "
+            "%d hits %.0f s, %d tool changes %.0f s)\n"%(
+            seconds//3600,seconds//60%60,seconds%60,
+            travel,totals[0],hits,len(self.drillPaths),changes))
 
-        # for via in self._vias:
-            # via.SetDrill(int(0.294*1000000.0))
-            
         self._console_text_queue.put(
             "\n\n***** Via Holes List "
             "(pad #, position (nm), "
             "Type, Drill, Drill Value, Via Width) *****\n")
+        if self.cancelled():
+            return
+        progress.phase('via list')
+        self.profile('via list')
         vias_details = []
-        for index,v in enumerate(self._vias):
-            count += 1
-            self._progress_value_queue.put(count)
-            p=v.GetPosition()
-            t=v.GetViaType()
-            d=v.GetDrill()
-            dv=v.GetDrillValue()
-            w=v.GetWidth()
+        for index in range(len(vias)):
+            progress.advance()
+            p=(vias.x[index],vias.y[index])
+            t=vias.via_type[index]
+            d=vias.drill[index]
+            dv=vias.drill_value[index]
+            w=vias.width[index]
             self._console_text_queue.put(
                 "%d (Type %d) Pos=%.3f mm, "
                 "%.3f mm; Drill=%.3f mm; "
@@ -2542,27 +5055,46 @@ class KiPadCheck( pcbnew.ActionPlugin ):
                 (index,t,p[0]/pcbnew.IU_PER_MM,p[1]/pcbnew.IU_PER_MM,
                 d/pcbnew.IU_PER_MM,dv/pcbnew.IU_PER_MM,w/pcbnew.IU_PER_MM))
             vias_details.append((p[0],p[1],dv,w))
-        num = len(vias_details)
-        distmin = num*[1000000000]
-        for i in range(num):
-            for j in range(i+1,num):
-                dist2 = (
-                    ((vias_details[i][0]-vias_details[j][0])*
-                    (vias_details[i][0]-vias_details[j][0]))+
-                    ((vias_details[i][1]-vias_details[j][1])
-                    *(vias_details[i][1]-vias_details[j][1]))
-                    )
-                dist = (dist2**(1/2.0)) \
-                    - vias_details[i][2]/2.0 \
-                    - vias_details[j][2]/2.0
-                if dist < distmin[i]:
-                    distmin[i] = dist
+        if self.cancelled():
+            return
+        progress.phase('via distance')
+        self.profile('via distance')
+        # Every via's true nearest neighbour among the vias that drill
+        # through a common dielectric layer: one KDTree per layer span,
+        # searched for the spans that share a dielectric with the via's.
+        viaspans = [snapshot.copper_span(mask) for mask in vias.layers]
+        byspan = {}
+        for index,span in enumerate(viaspans):
+            byspan.setdefault(span,[]).append(index)
+        viatrees = {}
+        local = [0]*len(vias)
+        for span,indexes in byspan.iteritems():
+            for i,index in enumerate(indexes):
+                local[index] = i
+            viatrees[span] = KDTree(
+                [(vias_details[i][0],vias_details[i][1]) for i in indexes],
+                [vias_details[i][2]/2.0 for i in indexes])
+        related = dict(
+            (span,[other for other in byspan
+                   if SpanIndex.share_dielectric(span,other)])
+            for span in byspan)
+        distmin = []
+        for index,(x,y,dv,w) in enumerate(vias_details):
+            span = viaspans[index]
+            best = 1000000000
+            for other in related[span]:
+                nearest,dist = viatrees[other].query(
+                    x,y,local[index] if other == span else None)
+                if nearest is not None:
+                    best = min(best,dist - dv/2.0)
+            distmin.append(best)
+        progress.advance(len(vias))
         FailedVias = []
         FailedViaTracks = set()
         FailedTracks = set()
         self._console_text_queue.put(
             "\n\n***** Distance to next closest via  ***** "
-            "(looking only *forward* through the list)\n")
+            "(nearest via through a common layer)\n")
         self._console_text_queue.put(
             "Minimum Via to Via = %.3f mils (%.3f mm)\n\n"
             %(MinimumViaViaMils,25.4*MinimumViaViaMils/1000.0))
@@ -2570,71 +5102,183 @@ class KiPadCheck( pcbnew.ActionPlugin ):
             self._console_text_queue.put("%d %.3f mm\n"%(i,dist/1000000.0))
             if dist<25.4*1000000.0*MinimumViaViaMils/1000.0:
                 FailedVias.append(i)
-                self._vias[i].SetHighlighted()
+                vias.highlight(i)
+        self.profile_count('violations',len(FailedVias))
         if len(FailedVias) > 0:
             self._console_text_queue.put(
                 "\n\n***** Vias too close to another via *****\n")
         for via in FailedVias:
             self._console_text_queue.put("%d\n"%via)
         
-        # test for self._vias proximity to track segments
-        for vindex,via in enumerate(self._vias):
-            count += 1
-            self._progress_value_queue.put(count)
-            for track in board.GetTracks():
-                trackvia = track.Cast_to_VIA()
-                if trackvia is not None: # is a via, skip
-                    continue
+        # test for vias proximity to track segments
+        MinimumViaTracknm = (1000000/1000)*MinimumViaTrackMils*25.4
+        # Each track box is grown by half its width plus the clearance,
+        # so a via only needs the tracks overlapping its own drill box.
+        # Only the tracks on the copper layers a via spans are searched.
+        tracktree = SpanIndex([
+            (min(tracks.x1[t],tracks.x2[t]) - (tracks.width[t]/2.0 + MinimumViaTracknm),
+             min(tracks.y1[t],tracks.y2[t]) - (tracks.width[t]/2.0 + MinimumViaTracknm),
+             max(tracks.x1[t],tracks.x2[t]) + (tracks.width[t]/2.0 + MinimumViaTracknm),
+             max(tracks.y1[t],tracks.y2[t]) + (tracks.width[t]/2.0 + MinimumViaTracknm))
+            for t in range(len(tracks))],
+            [snapshot.copper_span(mask) for mask in tracks.layers])
+        progress.phase('via track')
+        self.profile('via track')
+        examined = 0
+        for vindex in range(len(vias)):
+            if vindex % self.CANCEL_CHUNK == 0 and self.cancelled():
+                return
+            progress.advance()
+            vx = vias.x[vindex]
+            vy = vias.y[vindex]
+            d = vias.drill_value[vindex]
+            vianet = vias.net[vindex]
+            candidates = tracktree.query(
+                vx-d/2.0, vy-d/2.0, vx+d/2.0, vy+d/2.0,
+                viaspans[vindex][0], viaspans[vindex][1])
+            examined += len(candidates)
+            for tindex in candidates:
                 # Check if via and track are the same net. If so, skip
-                if via.GetNetname() == track.GetNetname():
+                if vianet == tracks.net[tindex]:
                     continue
-                v = via.GetPosition()
-                d = via.GetDrillValue()
-                # if RectangleIntersect(
-                #     (v[0],v[1],d,d),
-                #     track.GetBoundingBox().getWxRect(),0):
-                #     continue
-                s = track.GetStart()
-                e = track.GetEnd()
-                #v = via.GetPosition()
-                s = pcbnew.wxPoint(s[0],s[1])
-                e = pcbnew.wxPoint(e[0],e[1])
-                v = pcbnew.wxPoint(v[0],v[1])
-                #print "point=",v,'start=', s,'end=',e,'length=',e.distance(s)
-                dist = wxPointUtil.mindistance(v,s,e)
+                sx = tracks.x1[tindex]
+                sy = tracks.y1[tindex]
+                ex = tracks.x2[tindex]
+                ey = tracks.y2[tindex]
+                dist = wxPointUtil.mindistance_xy(vx,vy,sx,sy,ex,ey)
                 if dist == 0.0:
                     continue
-                DIST = dist
-                dist = dist - (track.GetWidth() + d)/2.0
-                DISTREDUCED = dist
-                MinimumViaTracknm = (1000000/1000)*MinimumViaTrackMils*25.4
+                dist = dist - (tracks.width[tindex] + d)/2.0
                 if (abs(dist) > 1000) and (dist < MinimumViaTracknm):
                     if dist < 0:
-                        track.SetHighlighted()
-                        via.SetHighlighted()
-                        #print v,s,e
-                        #print "dist %d; reduced dist %d\n" \
-                        #    %(DIST,DISTREDUCED),SavePrint
+                        tracks.highlight(tindex)
+                        vias.highlight(vindex)
                     FailedViaTracks.add(
                         (vindex,
-                            "Via (%s) at %s is %d away from track (%s) (%s ; %s)."
+                            "Via (%s) at (%d, %d) is %d away from track (%s) ((%d, %d) ; (%d, %d))."
                             "Shoud be %d"%
-                            (via.GetNetname(),
-                            str(v),
+                            (snapshot.netnames[vianet],
+                            vx,vy,
                             dist,
-                            track.GetNetname(),
-                            str(s),
-                            str(e),
+                            snapshot.netnames[tracks.net[tindex]],
+                            sx,sy,
+                            ex,ey,
                             MinimumViaTracknm)))
-                    FailedTracks.add(track)
+                    FailedTracks.add(tindex)
+        self.profile_count('pairs_examined',examined)
+        self.profile_count('pairs_pruned',len(vias)*len(tracks) - examined)
+        self.profile_count('violations',len(FailedViaTracks))
+        self.profile('select')
         for track in FailedTracks:
-            track.SetSelected()
+            tracks.select(track)
         if len(FailedViaTracks) >0:
             self._console_text_queue.put("\n\n***** Vias too close to track *****\n")
         for via,message in FailedViaTracks:
             self._console_text_queue.put("%d %s\n"%(via,message))
+        progress.finish()
+        self._console_text_queue.put(self.profile_end())
         self._console_text_queue.put("\n  ***** DONE *****\n")	
-        self._progress_stop = True
+
+    def WriteExcellon(self,stream):
+        """Write the holes of the last DrillInfo to stream as an Excellon
+           drill file: tools T1, T2... are the consolidated drills of the
+           chosen drill set (then one tool of each size without a drill),
+           with their holes in drilling order (see drillPaths)."""
+        if self.drillPaths is None:
+            raise Exception("No drill paths: run Drill Info first.")
+        setname, scale, source = self._StandardDrillInfo[self._DrillSet]
+        ExcellonFile.write(stream,self.drillPaths,(
+            "DRILL file from KiPadCheck, board %s"%(
+                self._backend.name() if self._backend is not None else ""),
+            "Drills from %s"%setname))
+
+    def CheckExcellon(self,stream,tolerance=None):
+        """Cross-check the Excellon drill file stream against the holes of
+           the last DrillInfo. Each hit is matched to a board hole within
+           tolerance (mm, default EXCELLON_TOLERANCE) of its center, whose
+           size must be drilled by a drill up to the Drill Oversize
+           Tolerance larger. Slots must be slots (G85) in the file, with
+           both ends within tolerance, and round holes hits.
+           Returns the report text."""
+        if tolerance is None:
+            tolerance = self.EXCELLON_TOLERANCE
+        tolerance = tolerance*pcbnew.IU_PER_MM
+        oversize = self.GetParameter('dt')*pcbnew.IU_PER_MM
+        mm = 1.0/pcbnew.IU_PER_MM
+        holes = self.get_drill_holes()
+        tools,hits = ExcellonFile.read(stream)
+        pairs,missing,extra = ExcellonFile.match(
+            [(x,y) for x,y,size,slot in holes],
+            [(x,y) for t,x,y,slot in hits],tolerance)
+        lines = ["\n\n***** Excellon Drill File Check "
+                 "(position tolerance %.3f mm) *****\n"%(tolerance*mm)]
+        lines.append("%d hits (%d slots) of %d tools, %d board holes"
+            " (%d slots), %d matched\n"%(
+            len(hits),sum(1 for hit in hits if hit[3] is not None),
+            len(tools),len(holes),
+            sum(1 for hole in holes if hole[3] is not None),len(pairs)))
+        # the file's diameters are rounded to its number format
+        rounding = 0.001*pcbnew.IU_PER_MM
+        sizes = []
+        slots = []
+        for hole,hit in pairs:
+            x,y,size,slot = holes[hole]
+            tool,hx,hy,routed = hits[hit]
+            if slot is not None or routed is not None:
+                slots.extend(self.get_slot_mismatch(
+                    x,y,size,slot,routed,tolerance))
+            diameter = tools.get(tool)
+            if diameter is None or not (
+                    size - rounding <= diameter <= size + oversize + rounding):
+                sizes.append("Hole %.3f mm at (%.3f, %.3f) mm drilled by"
+                    " T%d %s\n"%(size*mm,x*mm,y*mm,tool,
+                    "(undefined)" if diameter is None
+                    else "%.3f mm"%(diameter*mm)))
+        lines.append("\n***** Holes drilled by a drill outside"
+                     " [size, size + %.3f mm]: %d *****\n"%(
+                     oversize*mm,len(sizes)))
+        lines.extend(sizes)
+        lines.append("\n***** Slots and round holes drilled as the"
+                     " other, or slot ends apart: %d *****\n"%len(slots))
+        lines.extend(slots)
+        lines.append("\n***** Board holes without a hit: %d *****\n"%(
+            len(missing)))
+        for hole in missing:
+            x,y,size,slot = holes[hole]
+            lines.append("%s %.3f mm at (%.3f, %.3f) mm\n"%(
+                "Hole" if slot is None else "Slot",size*mm,x*mm,y*mm))
+        lines.append("\n***** Hits without a board hole: %d *****\n"%(
+            len(extra)))
+        for hit in extra:
+            tool,x,y,slot = hits[hit]
+            lines.append("T%d %sat (%.3f, %.3f) mm\n"%(
+                tool,"" if slot is None else "slot ",x*mm,y*mm))
+        return "".join(lines)
+
+    def get_slot_mismatch(self,x,y,size,slot,routed,tolerance):
+        """Return the CheckExcellon() report lines (none or one) of the
+           board hole of width size at x, y, and slot (see
+           get_drill_holes), matched by a hit with slot ends routed
+           (see ExcellonFile.read). The ends of a slot may be in either
+           order."""
+        mm = 1.0/pcbnew.IU_PER_MM
+        if routed is None:
+            return ["Slot %.3f mm at (%.3f, %.3f) mm drilled as a round"
+                    " hit\n"%(size*mm,x*mm,y*mm)]
+        if slot is None:
+            return ["Hole %.3f mm at (%.3f, %.3f) mm drilled as a slot\n"%(
+                size*mm,x*mm,y*mm)]
+        x1,y1,x2,y2 = slot
+        rx1,ry1,rx2,ry2 = routed
+        def apart(ax,ay,bx,by):
+            return math.sqrt((ax-bx)*(ax-bx) + (ay-by)*(ay-by))
+        if min(max(apart(x1,y1,rx1,ry1),apart(x2,y2,rx2,ry2)),
+               max(apart(x1,y1,rx2,ry2),apart(x2,y2,rx1,ry1))) <= tolerance:
+            return []
+        return ["Slot %.3f mm from (%.3f, %.3f) to (%.3f, %.3f) mm drilled"
+                " from (%.3f, %.3f) to (%.3f, %.3f) mm\n"%(
+                size*mm,x1*mm,y1*mm,x2*mm,y2*mm,
+                rx1*mm,ry1*mm,rx2*mm,ry2*mm)]
 
 
     def GetApertureSize(self,pad):
@@ -2658,18 +5302,25 @@ class KiPadCheck( pcbnew.ActionPlugin ):
         """Main function for getting information about Paste Layers on the current board.
            And calculates parameters useful for creating stencils including:
            (aperture ratio, area ratio, solder paste type/size)."""
-        board = pcbnew.GetBoard()
+        self.profile_start('StencilInfo')
+        self.profile('snapshot')
+        snapshot = self.LoadSnapshot()
+        self.profile('ratios')
+        pads = snapshot.pads
            
         FailedAreaRatio = {}
         FailedAspectRatio = {}
-        PadLayerNames, PadLayers = self.GetPadLayerNameNum()
         # get only pads on F.Paste layer
-        padnums = [padnum for padnum in range(board.GetPadCount()) \
-            if board.GetPad(padnum).IsOnLayer(self._layer_num_by_name["F.Paste"])]
+        padnums = pads.on_layer(self._layer_num_by_name["F.Paste"])
         AreaRange = {}
         AspectRange = {}
         AperturesBySize = {}
-        stencilSizes = self.GetStencilSizes(padnums)
+        stencilSizes = {}
+        for padnum in padnums:
+            stencilSizes.setdefault(
+                (pads.w[padnum] + pads.paste_margin_x[padnum],
+                 pads.h[padnum] + pads.paste_margin_y[padnum]),
+                []).append(padnum)
         AreaRatio = {}
         AspectRatio = {}
         for Size,padlist in stencilSizes.iteritems():
@@ -2709,6 +5360,10 @@ class KiPadCheck( pcbnew.ActionPlugin ):
                 # _consoleText.AppendText(" (%.1f %.2f %.2f)"%(
                     # Tmil,AreaRatio[Size][index],AspectRatio[Size][index]))
             # _consoleText.AppendText("\n")
+        self.profile_count('violations',
+            sum(len(sizes) for sizes in FailedAreaRatio.itervalues())
+            + sum(len(sizes) for sizes in FailedAspectRatio.itervalues()))
+        self.profile('report')
         self._consoleText.AppendText(
             "\n***** Pads by Stencil Aperture (Paste Aperture) Ratio *****\n")
         for Size in sorted(AperturesBySize, key=lambda k: AperturesBySize[k][0]):
@@ -2726,8 +5381,7 @@ class KiPadCheck( pcbnew.ActionPlugin ):
             self._consoleText.AppendText("\n")
             footprints = set()
             for padnum in padlist:
-                p = board.GetPad(padnum)
-                footprints.add(p.GetParent().GetValue())
+                footprints.add(pads.footprint[padnum])
             self._consoleText.AppendText("\tPads: %s\n"%str(padlist))
             self._consoleText.AppendText("\tFrom: %s\n"%','.join(footprints))
             
@@ -2765,6 +5419,7 @@ class KiPadCheck( pcbnew.ActionPlugin ):
                 "Min Aperture: %d %cm (%.3f mil)\n"%
                 (type,mu,sizerange[0],sizerange[1],sizerange[1]*5,
                 mu,(sizerange[1]*5)/25.4))
+        self._consoleText.AppendText(self.profile_end())
         self._consoleText.AppendText("\n  ***** DONE *****\n")	
         
     #@deprecated
@@ -2885,6 +5540,27 @@ class KiPadCheck( pcbnew.ActionPlugin ):
             #print min2, wxPointUtil.mindistance2(polygon[i],line[0],line[1])
         return min2
         
+    STROKE_BLOCK = 64
+    """Number of strokes per block in mindistance2_strokes_polygon()."""
+
+    def mindistance2_strokes_polygon(self,strokes,polygon,thickness,limit2):
+        """Vectorized slow silk check of text strokes (N, 2, 2) against a
+           closed polygon (k, 2), both polygon_array() arrays. The clearance
+           of a stroke is its distance to the polygon less half the text
+           thickness. Strokes are taken STROKE_BLOCK at a time, stopping
+           after the first block with a squared clearance within limit2.
+           Returns the smallest squared clearance found. Requires numpy."""
+        edges = wxPointUtil.polygon_edges(polygon)
+        min2 = 1000000000*1000000000 # 1m
+        for start in range(0,len(strokes),self.STROKE_BLOCK):
+            distance2 = wxPointUtil.mindistance2_segments_batch(
+                strokes[start:start+self.STROKE_BLOCK],edges).min(axis=1)
+            min2 = min(min2,
+                ((numpy.sqrt(distance2) - thickness/2.0)**2.0).min())
+            if min2 <= limit2:
+                break
+        return min2
+
     def mindistance_polygon_polygon(self,polygon1,polygon2):
         """Return the minimum distance between the specified polygons.
            Each polygon is a list of wxPoint vertices"""
@@ -2955,15 +5631,186 @@ def Run():
     # wx.EVT_MENU(self, _id, action)
     kpc._consoleText.AppendText("Finished Run()\n")
 
-# invoke only when run as a script, not as import
-if __name__ == "__main__":
-    Run()
-else:
-    # The above should work (currently untested) with Action Menu
-    # (KiCAD compiled with KICAD_SCRIPTING_ACTION_MENU)
-    # However, in KiCAD builds without ACTION_MENU enabled, the following
-    # is a workaround that allows "import kipadcheck" to enable the menu item.
-    Run()
-
-# register through Action Script when imported
-kpc.register()
+def _silk_check_partition(task):
+    """Run KiPadCheck.silk_check_partition() on task in a pool worker
+       process (see SilkInfo_Worker)."""
+    return KiPadCheck().silk_check_partition(task)
+
+def _excellon_path(path,board):
+    """Return the Excellon file of board: path itself, or the board's
+       name with .drl in directory path."""
+    if os.path.isdir(path):
+        return os.path.join(path,
+            os.path.splitext(os.path.basename(board))[0]+".drl")
+    return path
+
+def _check_board(job):
+    """Run the checks on one board file for main().
+       job is (path, checks, parameters, profile, excellon, checkpoints);
+       excellon is (Excellon file or directory to write, to check), both
+       may be None; checkpoints is the SilkInfo checkpoint directory or
+       None.
+       Returns (path, report text, error text or None, seconds,
+       Profiler.as_dict() or None). Runs in a pool worker process."""
+    path, checks, parameters, profile, excellon, checkpoints = job
+    start = time.time()
+    report = StringIO.StringIO()
+    error = None
+    checker = KiPadCheck()
+    if profile:
+        checker._profiler = Profiler()
+    try:
+        checker._parameters = parameters
+        checker._checkpoint_dir = checkpoints
+        checker.RunHeadless(PcbFileBackend(path),checks,report)
+        write, check = excellon
+        if write is not None:
+            with open(_excellon_path(write,path),"w") as f:
+                checker.WriteExcellon(f)
+        if check is not None:
+            with open(_excellon_path(check,path)) as f:
+                report.write(checker.CheckExcellon(f))
+    except Exception:
+        error = traceback.format_exc()
+    return (path,report.getvalue(),error,time.time()-start,
+            checker._profiler.as_dict() if profile else None)
+
+def main(argv=None):
+    """Command line batch mode: check .kicad_pcb files in parallel
+       without KiCad, streaming each board's results to the report as
+       soon as that board is done. Returns the exit status (1 if any
+       board could not be checked)."""
+    parser = argparse.ArgumentParser(
+        prog="kipadcheck",
+        description="Run KiPadCheck checks on .kicad_pcb files.")
+    parser.add_argument("boards",nargs="+",metavar="BOARD",
+        help=".kicad_pcb file to check")
+    parser.add_argument("--vv",type=float,
+        default=KiPadCheck._parameters['vv'],
+        help="(mil) Via to Via spacing (default %(default)s)")
+    parser.add_argument("--vt",type=float,
+        default=KiPadCheck._parameters['vt'],
+        help="(mil) Via to Track spacing (default %(default)s)")
+    parser.add_argument("--dt",type=float,
+        default=KiPadCheck._parameters['dt'],
+        help="(mm) Drill oversize tolerance, for the drill tool"
+             " consolidation (default %(default)s)")
+    parser.add_argument("--ar",type=float,
+        default=KiPadCheck._parameters['ar'],
+        help="(mil) Minimum annular ring of pads and vias"
+             " (default %(default)s)")
+    parser.add_argument("--sp",type=float,
+        default=KiPadCheck._parameters['sp'],
+        help="(mm) Silk to Pad spacing (default %(default)s)")
+    parser.add_argument("--sc",action="store_true",
+        help="Silk Slow Check")
+    parser.add_argument("--checks",default=",".join(
+        KiPadCheck.HEADLESS_CHECKS),
+        help="comma separated checks to run (default %(default)s)")
+    parser.add_argument("-j","--workers",type=int,
+        default=multiprocessing.cpu_count(),
+        help="number of worker processes, used for the silk check"
+             " when there is only one board (default %(default)s)")
+    parser.add_argument("-o","--output",default="-",
+        help="report file (default stdout)")
+    parser.add_argument("--excellon",metavar="DRL",
+        help="write the Excellon drill file of DrillInfo to DRL, or to"
+             " DRL/<board>.drl if DRL is a directory")
+    parser.add_argument("--check-excellon",metavar="DRL",
+        help="cross-check the Excellon drill file DRL, or DRL/<board>.drl"
+             " if DRL is a directory, against the board's holes")
+    parser.add_argument("--resume",action="store_true",
+        help="keep SilkInfo checkpoints in a private temp directory, so"
+             " that a run of the same boards after a crash or interrupt"
+             " resumes where it stopped")
+    parser.add_argument("--profile",metavar="JSON",
+        help="time and count the phases of each check: adds a table to"
+             " the report and writes all phases of all boards to JSON")
+    args = parser.parse_args(argv)
+
+    checks = [c.strip() for c in args.checks.split(",") if c.strip()]
+    for check in checks:
+        if check not in KiPadCheck.HEADLESS_CHECKS:
+            parser.error("unknown check %s (choose from %s)"%(
+                check,", ".join(KiPadCheck.HEADLESS_CHECKS)))
+    for path in (args.excellon,args.check_excellon):
+        if path is None:
+            continue
+        if 'DrillInfo' not in checks:
+            parser.error("--excellon and --check-excellon need DrillInfo")
+        if len(args.boards) > 1 and not os.path.isdir(path):
+            parser.error("%s is not a directory, for %d boards"%(
+                path,len(args.boards)))
+    parameters = dict(KiPadCheck._parameters,
+        vv=args.vv,vt=args.vt,sp=args.sp,sc=args.sc,dt=args.dt,ar=args.ar)
+    # pool workers cannot start pools of their own, so the silk check
+    # only gets the processes when the boards are not checked in a pool
+    if len(args.boards) == 1:
+        parameters['sw'] = max(1,args.workers)
+    profile = args.profile is not None
+    excellon = (args.excellon,args.check_excellon)
+    checkpoints = None
+    if args.resume:
+        try:
+            checkpoints = Checkpoint.user_directory()
+        except OSError as error:
+            parser.error("--resume: %s"%error)
+    jobs = [(path,checks,parameters,profile,excellon,checkpoints)
+            for path in args.boards]
+    workers = max(1,min(args.workers,len(jobs)))
+
+    if args.output == "-":
+        report = sys.stdout
+    else:
+        report = open(args.output,"w")
+    start = time.time()
+    failed = 0
+    profiles = {}
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(_check_board,jobs)
+    else:
+        results = itertools.imap(_check_board,jobs)
+    try:
+        for path, text, error, seconds, profiled in results:
+            if profiled is not None:
+                profiles[path] = profiled
+            report.write("\n===== %s (%.1f s) =====\n"%(path,seconds))
+            report.write(text)
+            if error is not None:
+                failed += 1
+                report.write("\n***** ERROR *****\n%s"%error)
+            report.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    report.write("\n***** Checked %d boards in %.1f s with %d workers,"
+                 " %d failed *****\n"%(
+                     len(jobs),time.time()-start,workers,failed))
+    if report is not sys.stdout:
+        report.close()
+    if profile:
+        with open(args.profile,"w") as f:
+            json.dump({'boards':profiles},f,indent=1,sort_keys=True)
+            f.write("\n")
+    return 1 if failed else 0
+
+# Command line batch mode when run as a script with arguments,
+# or without wx and pcbnew (see main()).
+if __name__ == "__main__" and (wx is None or len(sys.argv) > 1):
+    sys.exit(main())
+elif wx is not None:
+    # invoke only when run as a script, not as import
+    if __name__ == "__main__":
+        Run()
+    else:
+        # The above should work (currently untested) with Action Menu
+        # (KiCAD compiled with KICAD_SCRIPTING_ACTION_MENU)
+        # However, in KiCAD builds without ACTION_MENU enabled, the following
+        # is a workaround that allows "import kipadcheck" to enable the menu item.
+        Run()
+
+    # register through Action Script when imported
+    kpc.register()
@@ -0,0 +1,216 @@
+"""Tests of the KiPadCheck checks on a small board, read the way pcbnew
+   boards are through the fakepcbnew stand-in:
+      python -m unittest test_kipadcheck
+   (pytest finds them too)."""
+
+import StringIO
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import fakepcbnew
+fakepcbnew.install()
+import kipadcheck
+
+pcbnew = kipadcheck.pcbnew
+
+def mm(value):
+    """Return value (internal units) in mm, to the micrometer."""
+    return round(value/pcbnew.IU_PER_MM,3)
+
+BOARD = """(kicad_pcb (version 20171130) (host pcbnew 5.1.5)
+  (general (thickness 1.6))
+  (layers
+    (0 F.Cu signal)
+    (31 B.Cu signal)
+    (34 B.Paste user)
+    (35 F.Paste user)
+    (36 B.SilkS user)
+    (37 F.SilkS user)
+    (38 B.Mask user)
+    (39 F.Mask user)
+    (44 Edge.Cuts user)
+  )
+  (net 0 "")
+  (net 1 GND)
+  (net 2 SIG)
+  (net_class Default "Default"
+    (clearance 0.2)
+    (via_dia 0.8)
+    (via_drill 0.4)
+    (add_net GND)
+    (add_net SIG)
+  )
+  (module TH (layer F.Cu) (tedit 0) (tstamp 1)
+    (at 10 10)
+    (fp_text reference TH1 (at 0 0) (layer F.SilkS)
+      (effects (font (size 1 1) (thickness 0.15)))
+    )
+    (fp_text value TH (at 0 3) (layer F.Fab)
+      (effects (font (size 1 1) (thickness 0.15)))
+    )
+    (pad 1 thru_hole circle (at 0 0) (size 1.6 1.6) (drill 0.8) (layers *.Cu *.Mask) (net 1 GND))
+    (pad 2 thru_hole circle (at 1 0) (size 1.6 1.6) (drill 0.8) (layers *.Cu *.Mask) (net 1 GND))
+    (pad 3 thru_hole oval (at 5 0) (size 1.6 2.4) (drill oval 0.8 1.6) (layers *.Cu *.Mask) (net 2 SIG))
+    (pad 4 thru_hole circle (at 8 0) (size 1 1) (drill 0.8) (layers *.Cu *.Mask) (net 2 SIG))
+  )
+  (gr_line (start 17 10) (end 19 10) (layer F.SilkS) (width 0.15))
+  (via (at 20 20) (size 0.8) (drill 0.4) (layers F.Cu B.Cu) (net 1))
+  (via (at 20.6 20) (size 0.8) (drill 0.4) (layers F.Cu B.Cu) (net 1))
+  (via (at 30 20) (size 0.6) (drill 0.45) (layers F.Cu B.Cu) (net 1))
+  (via (at 40 20) (size 0.8) (drill 0.4) (layers F.Cu B.Cu) (net 2))
+  (segment (start 39 20.5) (end 41 20.5) (width 0.25) (layer F.Cu) (net 1))
+  (segment (start 39 30) (end 41 30) (width 0.25) (layer F.Cu) (net 1))
+)
+"""
+"""Board with one of each failure at the default parameters: pad holes
+   TH1.1 and TH1.2, and vias 0 and 1, 0.2 mm apart; via 3 (SIG) 0.175 mm
+   from track 0 (GND); text TH1 over pads 1 and 2 and the silk line over
+   pad 4; a 0.1 mm ring on pad 4 and a 0.075 mm ring on via 2. Pad 3 has
+   a 0.8 x 1.6 mm slot."""
+
+
+class BoardTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory,"board.kicad_pcb")
+        with open(cls.path,"w") as f:
+            f.write(BOARD)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def run_checks(self,*checks):
+        """Load BOARD into fakepcbnew and run checks on it. Returns
+           (KiPadCheck, report text)."""
+        fakepcbnew.LoadBoard(self.path)
+        kpc = kipadcheck.KiPadCheck()
+        kpc._parameters = dict(kipadcheck.KiPadCheck._parameters)
+        report = StringIO.StringIO()
+        kpc.RunHeadless(kipadcheck.PcbnewBackend(kpc),checks,report)
+        return kpc,report.getvalue()
+
+    @staticmethod
+    def selected(table):
+        """Return the rows of table whose object is selected."""
+        return [row for row in range(len(table))
+                if table.objects[row].IsSelected()]
+
+    def test_hole_pairs(self):
+        kpc,report = self.run_checks('DrillInfo')
+        holes = kpc._snapshot.hole_table()
+        pairs = kpc.get_close_hole_pairs(holes,12*pcbnew.IU_PER_MILS)
+        self.assertEqual(
+            [(kpc.get_hole_name(holes,i),kpc.get_hole_name(holes,j),
+              mm(distance)) for i,j,distance in pairs],
+            [("pad hole TH1.1","pad hole TH1.2",0.2),
+             ("via 0","via 1",0.2)])
+        self.assertIn("via - via: 1\n",report)
+        self.assertIn("pad hole - pad hole: 1\n",report)
+
+    def test_nearest_via(self):
+        kpc,report = self.run_checks('DrillInfo')
+        self.assertIn("0 0.200 mm\n1 0.200 mm\n2 8.975 mm\n3 9.575 mm\n",
+                      report)
+        self.assertIn("***** Vias too close to another via *****\n0\n1\n",
+                      report)
+
+    def test_via_track(self):
+        kpc,report = self.run_checks('DrillInfo')
+        self.assertIn("3 Via (SIG) at (40000000, 20000000) is 175000 away"
+                      " from track (GND)",report)
+        self.assertEqual(self.selected(kpc._snapshot.tracks),[0])
+
+    def test_silk(self):
+        kpc,report = self.run_checks('SilkInfo')
+        snapshot = kpc._snapshot
+        self.assertIn("Checked: 3; Failed: 3\n",report)
+        self.assertEqual(
+            [snapshot.pads.name[row] for row in self.selected(snapshot.pads)],
+            ["1","2","4"])
+        self.assertEqual(
+            [snapshot.texts.text[row]
+             for row in self.selected(snapshot.texts)],["TH1"])
+        self.assertEqual(self.selected(snapshot.drawings),[0])
+
+    def test_annular_rings(self):
+        kpc,report = self.run_checks('DrillInfo')
+        pads = kpc._snapshot.pads
+        padrows,padrings,viarows,viarings = kpc.get_annular_rings()
+        rings = ([(pads.name[row],mm(ring))
+                  for row,ring in zip(padrows,padrings)],
+                 [mm(ring) for ring in viarings])
+        self.assertEqual(rings,(
+            [("1",0.4),("2",0.4),("3",0.4),("4",0.1)],
+            [0.2,0.2,0.075,0.2]))
+        self.assertIn("Below minimum: 1 pads, 1 vias\n",report)
+        if kipadcheck.numpy is not None:
+            # the scalar fallback gives the same rings
+            numpy = kipadcheck.numpy
+            kipadcheck.numpy = None
+            try:
+                padrows,padrings,viarows,viarings = kpc.get_annular_rings()
+            finally:
+                kipadcheck.numpy = numpy
+            self.assertEqual(
+                ([(pads.name[row],mm(ring))
+                  for row,ring in zip(padrows,padrings)],
+                 [mm(ring) for ring in viarings]),
+                rings)
+
+    def test_excellon_round_trip(self):
+        kpc,report = self.run_checks('DrillInfo')
+        stream = StringIO.StringIO()
+        kpc.WriteExcellon(stream)
+        text = stream.getvalue()
+        tools,hits = kipadcheck.ExcellonFile.read(StringIO.StringIO(text))
+        self.assertEqual(len(tools),2)
+        self.assertEqual(len(hits),8)
+        slots = [slot for tool,x,y,slot in hits if slot is not None]
+        self.assertEqual(
+            [sorted([(mm(x1),mm(y1)),(mm(x2),mm(y2))])
+             for x1,y1,x2,y2 in slots],
+            [[(15.0,9.6),(15.0,10.4)]])
+        check = kpc.CheckExcellon(StringIO.StringIO(text))
+        self.assertIn("8 hits (1 slots) of 2 tools, 8 board holes (1 slots),"
+                      " 8 matched\n",check)
+        for problems in ("drill outside [size, size + 0.100 mm]: 0",
+                         "or slot ends apart: 0",
+                         "Board holes without a hit: 0",
+                         "Hits without a board hole: 0"):
+            self.assertIn(problems,check)
+        # the slot drilled as a round hit at its center
+        slot = [line for line in text.splitlines() if "G85" in line][0]
+        check = kpc.CheckExcellon(StringIO.StringIO(
+            text.replace(slot,"X15.000Y-10.000")))
+        self.assertIn("Slot 0.800 mm at (15.000, 10.000) mm drilled as a"
+                      " round hit\n",check)
+
+
+class TextTest(unittest.TestCase):
+
+    def test_multiline_text(self):
+        board = (u'(kicad_pcb (layers (37 F.SilkS user))\n'
+                 u'  (gr_text "AB\\nCD" (at 10 10) (layer F.SilkS)\n'
+                 u'    (effects (font (size 1 1) (thickness 0.15)))))\n')
+        texts = [record for kind,record
+                 in kipadcheck.kicad_pcb.read_board(io.StringIO(board))
+                 if kind == 'texts']
+        self.assertEqual(len(texts),1)
+        text = texts[0]
+        self.assertEqual(text['text'],u"AB\nCD")
+        # two 1 mm lines 1.61 mm apart, centered on the anchor
+        self.assertEqual(
+            [mm(text[key]) for key in ('box_x','box_y','box_w','box_h')],
+            [8.925,8.62,2.15,2.76])
+        ys = text['strokes'][1::2]
+        self.assertEqual((mm(min(ys)),mm(max(ys))),(8.695,11.305))
+
+
+if __name__ == "__main__":
+    unittest.main()